@@ -2,6 +2,8 @@ from opentrons import protocol_api
 import math
 import datetime
 import csv
+import json
+import time
 
 metadata = {
     'apiLevel': '2.8',
@@ -19,11 +21,11 @@ metadata = {
                     Currently only one plate at a time is supported if using platemaps
                     
                     Materials:
-                    Chemically-competent cells (10ul per vector) [TOP10 from Invitrogen, catalog # C4040-03]
+                    Chemically-competent cells (%%CELLS VOLUME%%ul per vector) [TOP10 from Invitrogen, catalog # C4040-03]
                         Alternate cells can be used depending on need
-                    SOC Media (170ul per vector)
+                    SOC Media (%%SOC VOLUME%%ul per vector)
                     
-                    Vector (2ul per vector)
+                    Vector (%%VECTOR VOLUME%%ul per vector)
 
                     Will also need plates poured with selective media appropriate for each vector
                    """
@@ -31,65 +33,65 @@ metadata = {
 
 
 def run(protocol: protocol_api.ProtocolContext):
-    vector_map = %%VECTOR PLATEMAP%%
-    num_of_samples = len(vector_map) if vector_map else %%NUM OF VECTORS%%
-
-    multichannel = %%MULTICHANNEL MODE%%
+    multichannel = %%MULTICHANNEL MODE%% # small pipette works column by column for cells and vectors
+    multichannel_soc = %%MULTICHANNEL SOC%% # large pipette works column by column for SOC
+    soc_from_top = %%SOC FROM TOP%% # one tip for all SOC, dispensed from the top of each well
+    mix_soc = %%MIX SOC%% # mix SOC from the top into the cells afterwards, a fresh tip per well
+    soc_columns_per_well = %%SOC COLUMNS PER WELL%% # columns served by each SOC reservoir well, with room for overage and dead volume
+    AIR_GAP = 10 # ul drawn in behind a dispense from the top, so nothing drips on the way
+
+    # ul per well, the preprocessor checks these against the pipettes and labware
+    cells_volume = %%CELLS VOLUME%%
+    vector_volume = %%VECTOR VOLUME%%
+    vector_mix_volume = %%VECTOR MIX VOLUME%%
+    soc_volume = %%SOC VOLUME%%
+    soc_mix_volume = %%SOC MIX VOLUME%%
+    soc_load_volumes = %%SOC LOAD VOLUMES%% # ul to load in each SOC well without liquid tracking, with overage and dead volume
     
-    # a function that gets us the next available slot on the deck
-    available_slots = range(11,0,-1)
-        
-    def slot_generator(available_slots):
-        for slot in available_slots:
-            yield slot
-    get_slot = slot_generator(available_slots)
-
-    # a function that gets us the next available well on a plate
-    # if the plate is full, the functions provisions another plate
-    def well_generator(labware_type):
-        while True:
-            try:
-                plate = protocol.load_labware(labware_type, next(get_slot))
-            except StopIteration:
-                 raise IndexError("""There aren't enough slots on the deck to run
-                                        all of the samples you're attempting to run.
-                                        Try doing it on two seperate runs."""
-                                    ) #Would prefer to raise StopIteration, but OT seems to be weird about handling it
-            for well in plate.wells():
-                yield well
-
-    def map_sort(platemap):
-        """
-        Sorts the platemap by well position
-        This is necessary for row because a multichannel pipette always
-        pipettes all the rows in the same order. We sort the columns
-        as well, because it's just nice to not arbitrarily have your
-        columns mixed up on the new plate.
-        """
-        sorted_by_row = sorted(platemap.items(), key=lambda x: x[1][:1])
-        sorted_by_row_n_col = sorted(sorted_by_row, key=lambda x: int(x[1][1:]))
-        return {k: v for k, v in sorted_by_row_n_col}
-
-    get_vector_well = well_generator('%%VECTOR PLATE%%')
-    get_transform_well = well_generator('%%TRANSFORMATION PLATE%%')
+    # slots and wells for all labware were planned by the preprocessor
+    deck_plan = %%DECK PLAN%%
+    def load_plates(role, labware_type):
+        return [protocol.load_labware(labware_type, slot) for slot in deck_plan['slots'][role]]
+    # indexing a plate by name rebuilds its whole name -> well map, so look wells up in one table per plate
+    def planned_wells(role, plates):
+        tables = [plate.wells_by_name() for plate in plates]
+        return {item: tables[plate][well] for item, (plate, well) in deck_plan['wells'][role].items()}
+    def planned_columns(role, plates):
+        # multichannel pipettes address a column through its top well
+        tables = [plate.wells_by_name() for plate in plates]
+        return [tables[plate][top_well] for plate, top_well, _ in deck_plan['columns'][role]]
+
+    # opt-in liquid tracking: sources start with the volume the preprocessor planned and aspirates follow the meniscus down
+    liquid_tracking = %%LIQUID TRACKING%%
+    liquid_volumes = %%LIQUID VOLUMES%%
+    # opt-in profiling: every pipette step and phase is timed and saved next to the platemap on the robot
+    profile = %%PROFILE%%
+    # every finished step is logged on the robot, a protocol filled with --resume_from that log skips the steps it lists
+    checkpoint = %%CHECKPOINT%%
+    run_name = '%%RUN NAME%%'
+    resume = %%RESUME%% # the last step an interrupted run finished and the tips it had used by then
+
+    # liquid tracking, flow rate, profiling and checkpoint helpers shared by every protocol, from common/protocol_helpers.py.tmpl
+    %%PROTOCOL HELPERS%%
 
     # load the tipracks for the large and small pipettes
-    tipracks_sm = list()
-    for rack in range(math.ceil((num_of_samples + 1) / 95)):
-        tipracks_sm.append(protocol.load_labware('%%SMALL TIPRACK%%', next(get_slot)))
-    tipracks_lg = [protocol.load_labware('%%LARGE TIPRACK%%', next(get_slot))]
+    tipracks_sm = load_plates('small_tipracks', '%%SMALL TIPRACK%%')
+    tipracks_lg = load_plates('large_tipracks', '%%LARGE TIPRACK%%')
         
     # set the pipettes we will be using
-    pipette_sm = protocol.load_instrument(
+    pipette_sm = resumable(profiled(protocol.load_instrument(
             '%%SMALL PIPETTE%%',
             mount='left',
             tip_racks=tipracks_sm
-    )
-    pipette_lg = protocol.load_instrument(
+    )))
+    pipette_lg = resumable(profiled(protocol.load_instrument(
             '%%LARGE PIPETTE%%',
             mount='right',
             tip_racks=tipracks_lg
-    )
+    )))
+    # the first racks may be ones an earlier run left partly used
+    start_tips(pipette_sm, tipracks_sm, %%SMALL STARTING TIP%%)
+    start_tips(pipette_lg, tipracks_lg, %%LARGE STARTING TIP%%)
 
 
     protocol.comment('**CHECK BEFORE RUNNING**')
@@ -97,75 +99,128 @@ def run(protocol: protocol_api.ProtocolContext):
     
     # Load compentant cells. Expecting volume will be in 100ul to 2000ul range
     if not multichannel:
-        competant_cells_plate = protocol.load_labware('%%CELLS PLATE%%', next(get_slot))
-        competant_cells = competant_cells_plate.wells("A1")
+        competant_cells_plate = load_plates('cells', '%%CELLS PLATE%%')[0]
+        competant_cells = competant_cells_plate.wells("A1")[0]
         protocol.comment(f'Competant Cells -> {competant_cells}')
 
     # Load SOC. Expecting volumes in 2ml - 30ml range
-    SOC_plate = protocol.load_labware('%%SOC PLATE%%', next(get_slot))
-    SOC = SOC_plate.wells("A1")
-    protocol.comment(f'SOC -> {SOC} (Closed lid until after heat shock)')
-
-    if not vector_map:
-        vector_map = dict()
-        for vector in range(num_of_samples):
-            vector_map[f'VECTOR {vector}'] = next(get_vector_well)
+    SOC_plate = load_plates('soc', '%%SOC PLATE%%')[0]
+    if multichannel_soc:
+        # each reservoir well serves as many columns of the transformation plate as the preprocessor fit in it
+        soc_columns = len(deck_plan['columns']['transformed'])
+        SOC = SOC_plate.wells()[:math.ceil(soc_columns / soc_columns_per_well)]
     else:
-        # Ensure the vectormap is in plate order
-        vector_map = map_sort(vector_map)
-        vector_plate = protocol.load_labware('%%VECTOR PLATE%%', next(get_slot))
-        for vector in vector_map:
-            vector_map[vector] = vector_plate.wells_by_name()[vector_map[vector]]
+        SOC = SOC_plate.wells("A1")
+    # tracked wells have to hold exactly the planned volume
+    load_volumes = track_liquid('soc', [SOC_plate])
+    for well in SOC:
+        if str(well) in load_volumes:
+            protocol.comment(f'SOC -> {well}: {load_volumes[str(well)]}ul (Closed lid until after heat shock)')
+        else:
+            protocol.comment(f'SOC -> {well}: {math.ceil(soc_load_volumes[well.well_name] / 100) / 10}ml (Closed lid until after heat shock)')
+
+    # The preprocessor has already sorted a provided vectormap into plate order,
+    # or assigned wells to each vector if only a number was given
+    vector_plates = load_plates('vectors', '%%VECTOR PLATE%%')
+    vector_map = planned_wells('vectors', vector_plates)
     for vector in vector_map:
         protocol.comment(f'{vector} -> {vector_map[vector]}')
 
-    if multichannel: transformation_plate = protocol.load_labware('%%TRANSFORMATION PLATE%%', next(get_slot))
+    #multichannel mode only supports directly mapping from one plate to another
+    transformed_plates = load_plates('transformed', '%%TRANSFORMATION PLATE%%')
+    transformed_cells_map = planned_wells('transformed', transformed_plates)
+    transformed_columns = planned_columns('transformed', transformed_plates)
+    if multichannel or multichannel_soc:
+        for (plate, _, wells_used), top_well in zip(deck_plan['columns']['transformed'], transformed_columns):
+            if wells_used < len(transformed_plates[plate].columns()[0]):
+                protocol.comment(f'NOTE: only {wells_used} wells in the column of {top_well} hold vectors. '
+                                 'The multichannel pipette also fills the others, which can be ignored')
 
-    transformed_cells_map = dict()
-    vector_well_list = list()
-    transformed_cells_well_list = list()
-    for vector in vector_map:
-        if multichannel:
-            #multichannel mode only supports directly mapping from one plate to another
-            transformed_cells_map[vector] = transformation_plate.wells_by_name()[vector_map[vector].well_name]
-        else:
-            transformed_cells_map[vector] = next(get_transform_well)
-        # ensure that vectors are explicitly listed in the same order in both plates
-        vector_well_list.append(vector_map[vector])
-        transformed_cells_well_list.append(transformed_cells_map[vector])
+    # ensure that vectors are explicitly listed in the same order in both plates
+    vector_well_list = list(vector_map.values())
+    transformed_cells_well_list = [transformed_cells_map[vector] for vector in vector_map]
 
     # Load competant cells into all of the necessary wells
+    phase('competent cells')
     if multichannel:
-        vol_per_well = 10
-        vol_in_start_column = math.ceil(len(transformed_cells_map) / 8) * vol_per_well + (math.ceil(len(transformed_cells_map) / 8)) #add extra vol for blowout
-        transformed_cells_plate = transformed_cells_well_list[0].parent
-        protocol.comment(f'ACTION: Before starting, load {vol_in_start_column}ul of competant cells into the first column of {transformed_cells_plate}')
-        wells_to_load = list(transformed_cells_map.values())[8:] #Skip first 9 wells bc they are already loaded
-        pipette_sm.distribute(vol_per_well, transformed_cells_plate.columns(0), wells_to_load, new_tip='once')
+        vol_in_start_column = len(transformed_columns) * (cells_volume + 1) #add extra vol for blowout
+        protocol.comment(f'ACTION: Before starting, load {vol_in_start_column}ul of competant cells into each well of the column of {transformed_columns[0]}')
+        #the first column is already loaded
+        distribute_steps(pipette_sm, cells_volume, transformed_columns[0], transformed_columns[1:],
+                         names=[f'competent cells {dest}' for dest in transformed_columns[1:]])
     else:
-        pipette_sm.distribute(source=competant_cells,dest=list(transformed_cells_map.values()),volume=10)
+        distribute_steps(pipette_sm, source=competant_cells,dest=list(transformed_cells_map.values()),volume=cells_volume,
+                         names=[f'competent cells {dest}' for dest in transformed_cells_map.values()])
 
-    # Load each vector into the appropriate well
-    pipette_sm.transfer(source=vector_well_list,
-                            dest=transformed_cells_well_list,
-                            volume=2,
-                            new_tip='always',
-                            touch_tip=True,
-                            mix_after=(2,3)
-                            )
+    # Load each vector into the appropriate well, a column at a time in multichannel mode
+    phase('vectors')
+    if multichannel:
+        vector_transfers = zip(planned_columns('vectors', vector_plates), transformed_columns)
+    else:
+        vector_transfers = zip(vector_well_list, transformed_cells_well_list)
+    #one transfer per well, so an interrupted run picks up at the well it stopped at
+    for source, dest in vector_transfers:
+        step(f'vector {dest}')
+        pipette_sm.transfer(source=source,
+                                dest=dest,
+                                volume=vector_volume,
+                                new_tip='always',
+                                touch_tip=True,
+                                mix_after=(2,vector_mix_volume)
+                                )
 
     protocol.comment('Loading complete')
     protocol.comment('Hold samples at 4C for 30 minutes, then heat shock at 42C for 30sec')
     protocol.comment('Finally, hold samples again at 4C for 2 minutes, then return plate(s) to their slot')
-    protocol.pause('Once plate is returned, continue protocol to load SOC media')
+    phase('heat shock')
+    step('heat shock')
+    if not skipping():
+        protocol.pause('Once plate is returned, continue protocol to load SOC media')
     
     # Load SOC media into all of the necessary wells
-    pipette_lg.transfer(source=SOC,
-                        dest=list(transformed_cells_map.values()),
-                        volume=170,
-                        new_tip='always',
-                        mix_after=(2,100)
-                        )
+    phase('SOC')
+    if multichannel_soc:
+        soc_sources = [SOC[column // soc_columns_per_well] for column in range(len(transformed_columns))]
+        soc_dests = transformed_columns
+    else:
+        soc_sources = SOC
+        soc_dests = list(transformed_cells_map.values())
+    #one transfer per well, so every aspirate follows a tracked SOC level down and a resumed run starts at the right well
+    soc_transfers = list(zip(soc_sources * len(soc_dests) if len(soc_sources) == 1 else soc_sources, soc_dests))
+    flow_profile(pipette_lg, 'aqueous')
+    if soc_from_top:
+        #the tip never reaches the cells, so it is kept for every well and SOC is blown out at the top
+        for source, dest in soc_transfers:
+            step(f'SOC {dest}')
+            if not pipette_lg.has_tip:
+                pipette_lg.pick_up_tip()
+            pipette_lg.transfer(source=below_meniscus(pipette_lg, source, soc_volume),
+                                dest=dest.top(),
+                                volume=soc_volume,
+                                new_tip='never',
+                                air_gap=AIR_GAP,
+                                blow_out=True,
+                                blowout_location='destination well'
+                                )
+        if pipette_lg.has_tip:
+            pipette_lg.drop_tip()
+        if mix_soc:
+            phase('SOC mixing')
+            for dest in soc_dests:
+                step(f'mix {dest}')
+                pipette_lg.pick_up_tip()
+                pipette_lg.mix(2, soc_mix_volume, dest)
+                pipette_lg.drop_tip()
+    else:
+        for source, dest in soc_transfers:
+            step(f'SOC {dest}')
+            pipette_lg.transfer(source=below_meniscus(pipette_lg, source, soc_volume),
+                                dest=dest,
+                                volume=soc_volume,
+                                new_tip='always',
+                                mix_after=(2,soc_mix_volume)
+                                )
+    step()
 
     protocol.comment('All cells loaded. Incubate at 37C for 15min if Amp resistant, and 60min otherwise')
     protocol.comment('Once incubated, plate each strain on selective agar and grow overnight')
@@ -182,4 +237,6 @@ def run(protocol: protocol_api.ProtocolContext):
             writer.writerow([vector, vector_map[vector].well_name, transformed_cells_map[vector].well_name])
     csvfile.close()
     protocol.comment(f'Output CSV map is saved as {filename} ON the robot.')
-    protocol.comment('This file will persist until the robot is turned off')
\ No newline at end of file
+    protocol.comment('This file will persist until the robot is turned off')
+
+    save_profile('CELL_TRANSFORM')
@@ -1,45 +1,99 @@
 import logging
 import argparse
-import datetime
+import json
 import os
+import sys
+import ast
+import math
 
-def read_args(explicit_args):
+#the shared helpers live one level up, next to the protocol folders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.deck_planner import DeckPlan, DeckCapacityError
+from common import sharding
+from common import inputs
+from common import ordering
+from common.output import unique_stamp, write_files
+from common.cache import ProtocolCache
+from common.templating import load_template, rename_keys
+from common import estimator
+from common import validation
+from common import state
+from common import checkpoints
+from common.labware import PIPETTES, get_labware
+from common.wells import row_col, well_index
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = 'cell_transform'
+TIPRACKS = {
+            'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
+            ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
+            ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
+            ,'p300_multi_gen2':'opentrons_96_tiprack_300ul'
+            ,'p20_multi_gen2':'opentrons_96_tiprack_20ul'
+           }
+# ul per well, filled into cell_transform.py as placeholders
+CELLS_VOLUME = 10
+VECTOR_VOLUME = 2
+VECTOR_MIX_VOLUME = 3
+SOC_VOLUME = 170
+SOC_MIX_VOLUME = 100
+SOC_OVERAGE = 1.1 # SOC wells are loaded with this much extra
+VOLUMES = {
+           '%%CELLS VOLUME%%': CELLS_VOLUME,
+           '%%VECTOR VOLUME%%': VECTOR_VOLUME,
+           '%%VECTOR MIX VOLUME%%': VECTOR_MIX_VOLUME,
+           '%%SOC VOLUME%%': SOC_VOLUME,
+           '%%SOC MIX VOLUME%%': SOC_MIX_VOLUME,
+          }
+
+
+def read_args(explicit_args, argv=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--vector_map', '-vm'
-                        ,dest='%%VECTOR PLATEMAP%%'
+                        ,dest='vector_map'
                         ,default='None'
                         ,help='Vector Platemap data in JSON following the schema {VECTOR NAME:"A1", ...}'
                         )
+    parser.add_argument('--vector_map_file', '--vector-map-file', '-vmf'
+                        ,dest='vector_map_file'
+                        ,default=None
+                        ,help='CSV or JSONL file with one vector and its well per row, or - for stdin. Use instead of --vector_map.'
+                        )
     parser.add_argument('--num_vectors', '-nv'
-                        ,dest='%%NUM OF VECTORS%%'
+                        ,dest='num_vectors'
                         ,default='0'
                         ,help='Number of vectors to be used. If a platemap does not exist, this can be used instead to generate one'
                         )
     parser.add_argument('--vector_plate', '-vp'
                         ,dest='%%VECTOR PLATE%%'
                         ,default='nunc_96_well_plate_v_bottom'
-                        ,help='Name of labware to use to hold the vector solutions. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the vector solutions. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--transformation_plate', '-tp'
                         ,dest='%%TRANSFORMATION PLATE%%'
                         ,default='pcr_96_300ul_ondeepwell'
-                        ,help='Name of labware to use to hold the transformation cells. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the transformation cells. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--cells_plate', '-cp'
                         ,dest='%%CELLS PLATE%%'
                         ,default='cryo_35_tuberack_2000ul'
-                        ,help='Name of labware to use to hold the competant cells. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the competant cells. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--soc_plate', '-sp'
                         ,dest='%%SOC PLATE%%'
                         ,default='marburg_6_tuberack_50ml'
-                        ,help='Name of labware to use to hold the SOC media. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the SOC media. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
+                        )
+    parser.add_argument('--keep_wells', '-kw'
+                        ,dest='keep_wells'
+                        ,action='store_true'
+                        ,help='Put every transformation in the same well as its vector, so the transformation plate lines up with the vector plate.'
                         )
     parser.add_argument('--small_pipette', '-smp'
                         ,dest='%%SMALL PIPETTE%%'
                         ,default='p20_single_gen2'
-                        ,help='Specify the pipette type for small volumes. Use Opentrons standard names.'
+                        ,help='Specify the pipette type for small volumes. Use Opentrons standard names listed in common/labware.py.'
                         )
     parser.add_argument('--small_tiprack', '-smt'
                         ,dest='%%SMALL TIPRACK%%'
@@ -49,63 +103,312 @@ def read_args(explicit_args):
     parser.add_argument('--large_pipette', '-lgp'
                         ,dest='%%LARGE PIPETTE%%'
                         ,default='p300_single_gen2'
-                        ,help='Specify the pipette type for large volumes. Use Opentrons standard names.'
+                        ,help='Specify the pipette type for large volumes. Use Opentrons standard names listed in common/labware.py.'
                         )
     parser.add_argument('--large_tiprack', '-lgt'
                         ,dest='%%LARGE TIPRACK%%'
                         ,default= None
                         ,help='Specify the tiprack type for large volumes. Use Opentrons standard names. An option is inferred if nothing is provided.'
                         )
+    parser.add_argument('--track_liquid'
+                        ,dest='%%LIQUID TRACKING%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Aspirate SOC from just below its surface, following the volume planned for it, with faster flow rates. Load exactly the volume the protocol lists.'
+                        )
+    parser.add_argument('--soc_from_top'
+                        ,dest='%%SOC FROM TOP%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Dispense SOC from the top of each well behind an air gap and blow it out there, so one tip serves every well instead of one tip per well. SOC is not mixed in unless --mix_soc is also given.'
+                        )
+    parser.add_argument('--mix_soc'
+                        ,dest='%%MIX SOC%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='With --soc_from_top, mix every well once all SOC is in, with a fresh tip per well.'
+                        )
+    parser.add_argument('--profile'
+                        ,dest='%%PROFILE%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Time every pipette step and phase on the robot, saved as CSV and JSON next to the platemap. Aggregate them with `python -m common.profiles`.'
+                        )
+    parser.add_argument('--estimate'
+                        ,dest='estimate'
+                        ,action='store_true'
+                        ,help='Simulate every run to estimate robot time, tips and the volume to load in each source, saved as JSON next to the platemap. Takes a while on very large jobs.'
+                        )
+    parser.add_argument('--no_cache'
+                        ,dest='no_cache'
+                        ,action='store_true'
+                        ,help='Always render a new protocol instead of reusing an identical one from the cache.'
+                        )
+    parser.add_argument('--cache_dir'
+                        ,dest='cache_dir'
+                        ,default=None
+                        ,help='Folder to cache filled protocols in. Defaults to protocol_cache/ in the output folder.'
+                        )
+    parser.add_argument('--state_file'
+                        ,dest='state_file'
+                        ,default=None
+                        ,help='JSON file of the tips left on the deck, read and updated so back-to-back jobs use up partly used tipracks. See common/state.py.'
+                        )
+    parser.add_argument('--no_checkpoint'
+                        ,dest='%%CHECKPOINT%%'
+                        ,action='store_const'
+                        ,const='False'
+                        ,default='True'
+                        ,help='Do not log each finished step on the robot. Without the log an interrupted run can only be started over.'
+                        )
+    parser.add_argument('--resume_from', '--resume-from'
+                        ,dest='resume_from'
+                        ,default=None
+                        ,help='Checkpoint log of an interrupted run, copied off the robot. Give the options of the interrupted job and only the runs it has left are filled, skipping the steps already done. See common/checkpoints.py.'
+                        )
 
-    args = vars(parser.parse_args())
-    if explicit_args: args |= explicit_args
+    args = vars(parser.parse_args(argv))
+    if explicit_args: args |= rename_keys(explicit_args)
 
-    for size in ['LARGE','SMALL']:
+    #Check every volume before planning anything, the robot is the most expensive place to find out.
+    #Mixes count too, the small pipette mixes after each vector and the large one after the SOC
+    for size, volumes, what in [('LARGE', [SOC_VOLUME, SOC_MIX_VOLUME], 'SOC'), ('SMALL', [CELLS_VOLUME, VECTOR_VOLUME, VECTOR_MIX_VOLUME], 'cells and vectors')]:
+        pipette = validation.choose_pipette(args[f'%%{size} PIPETTE%%'], volumes, TIPRACKS, what)
+        if pipette != args[f'%%{size} PIPETTE%%']:
+            args[f'%%{size} PIPETTE%%'], args[f'%%{size} TIPRACK%%'] = pipette, None
         if not args[f'%%{size} TIPRACK%%']:
-            args[f'%%{size} TIPRACK%%'] = {
-                                'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
-                                ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
-                                ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
-                                ,'p300_multi_gen2':'opentrons_96_tiprack_300ul'
-                                ,'p20_multi_gen2':'opentrons_96_tiprack_20ul'
-                                }[args[f'%%{size} PIPETTE%%']]
+            args[f'%%{size} TIPRACK%%'] = TIPRACKS[args[f'%%{size} PIPETTE%%']]
             logging.info(f'Inferring tiprack as `{args[f"%%{size} TIPRACK%%"]}` based on pipette')
+        validation.check_tiprack(args[f'%%{size} PIPETTE%%'], args[f'%%{size} TIPRACK%%'])
+    validation.check_wells(args['%%TRANSFORMATION PLATE%%'], CELLS_VOLUME + VECTOR_VOLUME + SOC_VOLUME, 'transformed cells')
+
+    #Start with the tips earlier jobs left on the deck
+    args['deck_state'] = state.read_state(args['state_file'])
+    #a resumed job is filled again from the state it started from
+    args['resume'] = checkpoints.read_checkpoint(args['resume_from'], TEMPLATE_NAME) if args['resume_from'] else None
+    if args['resume']:
+        args['deck_state'] = state.resumed(args['deck_state'])
+    args['first_tips'] = state.starting_tips(args['deck_state'], {'small_tipracks': (args['%%SMALL TIPRACK%%'], args['%%SMALL PIPETTE%%']),
+                                                                  'large_tipracks': (args['%%LARGE TIPRACK%%'], args['%%LARGE PIPETTE%%'])})
 
-    if not args['%%VECTOR PLATEMAP%%'] and not args['%%NUM OF VECTORS%%']:
-        raise(AttributeError, "No vector info was provided. use `python protocol_preprocessor.py --help` for more info")
+    if args['vector_map_file']:
+        args['vector_map'] = inputs.read_vector_map(args['vector_map_file'])
+    else:
+        args['vector_map'] = ast.literal_eval(args['vector_map'])
+    if not args['vector_map'] and not int(args['num_vectors']):
+        raise ValueError("No vector info was provided. use `python protocol_preprocessor.py --help` for more info")
 
-    args['%%MULTICHANNEL MODE%%'] = 'False'
-    if args['%%LARGE PIPETTE%%'] == 'p300_multi_gen2' or args['%%SMALL PIPETTE%%'] == 'p20_multi_gen2':
+    #a multichannel small pipette moves cells and vectors column by column, a multichannel large pipette does the same for SOC
+    args['%%MULTICHANNEL MODE%%'] = str(PIPETTES[args['%%SMALL PIPETTE%%']]['channels'] > 1)
+    args['%%MULTICHANNEL SOC%%'] = str(PIPETTES[args['%%LARGE PIPETTE%%']]['channels'] > 1)
+    if args['%%MULTICHANNEL SOC%%'] == 'True':
         args['%%SOC PLATE%%'] = 'nest_12_reservoir_15ml'
-        args['%%MULTICHANNEL MODE%%'] = 'True'
         logging.info(f'Inferring media container as `{args["%%SOC PLATE%%"]}` based on use of multichannel pipette')
-        logging.warning(f'NOTE: Because a multichannel pipette is used, you must load competent cells into all of column A before running this protocol.')
+    args['%%SOC COLUMNS PER WELL%%'] = str(soc_columns_per_well(args))
+    args |= {placeholder: str(volume) for placeholder, volume in VOLUMES.items()}
+    if args['%%MULTICHANNEL MODE%%'] == 'True':
+        logging.warning(f'NOTE: Because a multichannel pipette is used, you must load competent cells into the first column of the transformation plate before running this protocol.')
     
     return args
 
 
-def make_procedure(option_args = None): 
-    params = read_args(option_args)
-    APP_DIR = os.getcwd()
-    TEMPLATE_NAME = 'cell_transform'
+def map_sort(platemap):
+    """
+    Sorts the platemap by well position
+    This is necessary for row because a multichannel pipette always
+    pipettes all the rows in the same order. We sort the columns
+    as well, because it's just nice to not arbitrarily have your
+    columns mixed up on the new plate.
+    """
+    def column_then_row(item):
+        row, column = row_col(item[1])
+        return column, row
+    return dict(sorted(platemap.items(), key=column_then_row))
+
+
+def vector_list(args):
+    """Every vector with its well, or None if the well should be assigned"""
+    if args['vector_map']:
+        # Ensure the vectormap is in plate order
+        return list(map_sort(args['vector_map']).items())
+    return [(f'VECTOR {vector}', None) for vector in range(int(args['num_vectors']))]
+
+
+def plan_deck(args):
+    vectors = args['vectors'] if 'vectors' in args else vector_list(args)
+    multichannel = args['%%MULTICHANNEL MODE%%'] == 'True'
+    multichannel_soc = args['%%MULTICHANNEL SOC%%'] == 'True'
+    channels_sm = PIPETTES[args['%%SMALL PIPETTE%%']]['channels']
+    channels_lg = PIPETTES[args['%%LARGE PIPETTE%%']]['channels']
+
+    plan = DeckPlan()
+    plan.add_tipracks('small_tipracks', args['%%SMALL TIPRACK%%'], 0, args['first_tips'].get('small_tipracks', 0)) #sized once the columns are known
+    plan.add_tipracks('large_tipracks', args['%%LARGE TIPRACK%%'], 0, args['first_tips'].get('large_tipracks', 0))
+    plan.add_labware('cells', args['%%CELLS PLATE%%'], 0 if multichannel else 1)
+    plan.add_labware('soc', args['%%SOC PLATE%%'])
+    if vectors and vectors[0][1]:
+        plan.add_named_wells('vectors', args['%%VECTOR PLATE%%'], dict(vectors))
+    else:
+        plan.add_wells('vectors', args['%%VECTOR PLATE%%'], [vector for vector, _ in vectors])
+    if multichannel:
+        #multichannel mode only supports directly mapping from one plate to another
+        if any(plate for plate, _ in plan.wells['vectors'].values()):
+            raise DeckCapacityError('Multichannel mode only supports a single vector plate per run')
+        plan.add_named_wells('transformed', args['%%TRANSFORMATION PLATE%%'],
+                             {vector: well for vector, (_, well) in plan.wells['vectors'].items()})
+    elif args['keep_wells']:
+        plan.add_aligned_wells('transformed', args['%%TRANSFORMATION PLATE%%'], 'vectors')
+    else:
+        plan.add_wells('transformed', args['%%TRANSFORMATION PLATE%%'], plan.wells['vectors'])
+    plan.add_columns('vectors')
+    plan.add_columns('transformed')
+
+    #one pickup to distribute cells and one per vector (or column), then one per well (or column) for SOC.
+    #SOC from the top takes a single tip, and another per well if it is mixed in afterwards
+    columns = len(plan.columns['transformed'])
+    small_pickups = 1 + (columns if multichannel else len(vectors))
+    soc_wells = columns if multichannel_soc else len(vectors)
+    if args['%%SOC FROM TOP%%'] == 'True':
+        large_pickups = 1 + (soc_wells if args['%%MIX SOC%%'] == 'True' else 0)
+    else:
+        large_pickups = soc_wells
+    plan.resize_tipracks('small_tipracks', small_pickups * channels_sm)
+    plan.resize_tipracks('large_tipracks', large_pickups * channels_lg)
+
+    #Sources that would run dry make for smaller runs
+    validation.check_sources(args['%%VECTOR PLATE%%'], {vector: VECTOR_VOLUME for vector in plan.wells['vectors']}, 'Vector')
+    if multichannel:
+        #the first column is loaded by hand with enough cells for every column, plus a little for blowouts
+        validation.check_sources(args['%%TRANSFORMATION PLATE%%'], {'starting column': columns * (CELLS_VOLUME + 1)}, 'The')
+    else:
+        validation.check_sources(args['%%CELLS PLATE%%'], {'competent cells': len(vectors) * CELLS_VOLUME}, 'The')
+    validation.check_sources(args['%%SOC PLATE%%'], {well: volume * SOC_OVERAGE for well, volume in soc_needs(args, plan).items()}, 'SOC')
+    return plan
+
+
+def soc_columns_per_well(args):
+    """Columns one SOC well serves, so the SOC they draw plus overage and dead volume fit in the well"""
+    spec = get_labware(args['%%SOC PLATE%%'])
+    channels = PIPETTES[args['%%LARGE PIPETTE%%']]['channels']
+    return max(1, math.floor((spec['max_volume'] - spec['dead_volume']) / (channels * SOC_VOLUME * SOC_OVERAGE)))
+
+
+def soc_needs(args, plan):
+    """ul drawn from every SOC well, a multichannel pipette spreads the columns over reservoir wells like the template does"""
+    if args['%%MULTICHANNEL SOC%%'] == 'True':
+        columns = len(plan.columns['transformed'])
+        channels = PIPETTES[args['%%LARGE PIPETTE%%']]['channels']
+        per_well = int(args['%%SOC COLUMNS PER WELL%%'])
+        names = well_index(args['%%SOC PLATE%%']).names
+        return {names[well]: min(per_well, columns - well * per_well) * channels * SOC_VOLUME
+                for well in range(math.ceil(columns / per_well))}
+    return {'A1': len(plan.wells['vectors']) * SOC_VOLUME}
+
+
+def partial_columns(plan):
+    """Transformation plate columns that a multichannel pipette fills although some of their wells hold no vector"""
+    return [top for _, top, used in plan.columns['transformed'] if used < get_labware(plan.load_names['transformed'])['rows']]
+
+
+def shard_args(args, vectors):
+    return {**args, 'vectors': vectors}
+
+
+def render_procedure(params):
+    """Fills the template for every run, returning the protocols and platemap as a dict of file name to content"""
+    #Get procedure template, compiled once per change to the file
+    template = load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py'))
+
+    #Split the vectors into as many runs as it takes to fit them on the deck
+    runs = sharding.make_runs(params, vector_list(params), shard_args, plan_deck)
+    checkpoints.check_run(params['resume'], len(runs))
+    if len(runs) > 1:
+        logging.info(f'Vectors do not fit on one deck, splitting them into {len(runs)} runs')
+
+    now = unique_stamp()
+    files = dict()
+    platemap = list()
+    for run, (run_params, plan) in enumerate(runs, 1):
+        if run > 1 and params['deck_state'] is not None:
+            #back-to-back runs go on with the tipracks the run before left
+            run_params, plan = state.carry_over(run_params, plan_deck, state.carried(*runs[run - 2]))
+            runs[run - 1] = (run_params, plan)
+        if run_params['%%MULTICHANNEL MODE%%'] == 'False':
+            #Chain the vector transfers so each one starts close to where the last one ended
+            vector_positions = ordering.positions(plan, 'vectors')
+            transformed_positions = ordering.positions(plan, 'transformed')
+            transfers = [(vector, [vector]) for vector in plan.wells['vectors']]
+            ordered = ordering.order_groups(transfers, vector_positions, transformed_positions)
+            logging.info(f'Run {run}: estimated head travel for vector loading {ordering.group_travel(transfers, vector_positions, transformed_positions) / 1000:.1f}m, '
+                         f'{ordering.group_travel(ordered, vector_positions, transformed_positions) / 1000:.1f}m after reordering')
+            ordering.reorder(plan, 'vectors', [vector for vector, _ in ordered])
+        run_params['%%DECK PLAN%%'] = repr(plan.layout())
+        run_params['%%SMALL STARTING TIP%%'] = str(plan.tips['small_tipracks'][0])
+        run_params['%%LARGE STARTING TIP%%'] = str(plan.tips['large_tipracks'][0])
+        #SOC wells start with what the run draws from them, for tracking their liquid level
+        dead_volume = get_labware(run_params['%%SOC PLATE%%'])['dead_volume']
+        run_params['%%LIQUID VOLUMES%%'] = repr({'soc': [(0, well, round(volume + dead_volume, 1)) for well, volume in soc_needs(run_params, plan).items()]})
+        #otherwise they get the overage on top, the volumes the source check allowed for
+        run_params['%%SOC LOAD VOLUMES%%'] = repr({well: round(volume * SOC_OVERAGE + dead_volume, 1) for well, volume in soc_needs(run_params, plan).items()})
+        if 'True' in (run_params['%%MULTICHANNEL MODE%%'], run_params['%%MULTICHANNEL SOC%%']) and partial_columns(plan):
+            logging.warning(f'Run {run}: columns {partial_columns(plan)} are only partly used by vectors. '
+                            f'The multichannel pipette also fills their empty wells, which can be ignored')
+
+        #Every run logs its steps under its own name, only the interrupted run of a resumed job skips any
+        run_suffix = f'_RUN{run}' if len(runs) > 1 else ''
+        run_params['%%RUN NAME%%'] = f'{TEMPLATE_NAME}_FILLED{now}{run_suffix}'
+        run_params['%%RESUME%%'] = checkpoints.resume_params(params['resume'], run)
+
+        #Replace placeholders with values, leaving out the runs a resumed job already did
+        if not checkpoints.skipped(params['resume'], run):
+            files[f'{run_params["%%RUN NAME%%"]}.py'] = template.render(run_params)
+
+        vector_locations = sharding.planned_locations(plan, 'vectors')
+        transformed_locations = sharding.planned_locations(plan, 'transformed')
+        for vector in vector_locations:
+            platemap.append([run, vector, *vector_locations[vector], *transformed_locations[vector]])
+
+    #One platemap covers every run
+    files[f'{TEMPLATE_NAME}_PLATEMAP{now}.csv'] = sharding.platemap_csv(['Run', 'Vector', 'Vector Slot', 'Vector Well', 'Transformed Cell Slot', 'Transformed Cell Well'], platemap)
+
+    #The tips the last run leaves, for the next job
+    if params['deck_state'] is not None and not params['resume']:
+        files[f'{TEMPLATE_NAME}_STATE{now}.json'] = json.dumps(state.leftover(params['deck_state'], *runs[-1]), indent=2)
+
+    #Simulate every run to estimate robot time, tips and the volume to load in each source, when asked for
+    if params['estimate']:
+        estimate = estimator.estimate({name: content for name, content in files.items() if name.endswith('.py')}, [plan for run, (_, plan) in enumerate(runs, 1) if not checkpoints.skipped(params['resume'], run)], {'vectors': str})
+        files[f'{TEMPLATE_NAME}_ESTIMATE{now}.json'] = json.dumps(estimate, indent=2)
+        logging.info(estimator.summary(estimate))
+
+    return files
 
-    #Get procedure template
-    with open(os.path.join(APP_DIR, f'{TEMPLATE_NAME}.py')) as template_file:
-        protocol = template_file.read()
 
-    #Replace placeholders with values
-    for placeholder in params:
-        protocol = protocol.replace(placeholder, params[placeholder])
+def make_procedure(option_args = None, argv = None, output_dir = None): 
+    params = read_args(option_args, argv)
+    APP_DIR = output_dir or os.getcwd()
 
-    #Save finalized version of of the file
-    now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    unique_file_name = f'{TEMPLATE_NAME}_FILLED{now}.py'
-    with open(os.path.join(APP_DIR,unique_file_name),'w') as output_file:
-        output_file.write(protocol)
+    #Identical requests are served from the cache instead of being rendered again
+    cache = None if params['no_cache'] else ProtocolCache(params['cache_dir'] or os.path.join(APP_DIR, 'protocol_cache'))
+    files = None
+    if cache:
+        cache_key = cache.key(load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py')).source, params)
+        files = cache.get(cache_key)
+    if files is None:
+        files = render_procedure(params)
+        if cache:
+            cache.put(cache_key, files)
 
-    return os.path.join(APP_DIR,unique_file_name)
+    #Save finalized version of the files, the cache only keeps a copy
+    output_files = write_files(APP_DIR, files)
+    state.record(params, files)
+    return [path for path in output_files if path.endswith('.py')]
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    output_file = make_procedure()
-    logging.info(f'Success - file is {output_file}')
\ No newline at end of file
+    output_files = make_procedure()
+    logging.info(f'Success - files are {output_files}')
\ No newline at end of file
@@ -0,0 +1 @@
+"""Helpers shared by the protocol preprocessors. Templates are uploaded to the robot on their own and must not import from here."""
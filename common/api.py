@@ -0,0 +1,60 @@
+"""
+Python API for generating protocols in memory.
+
+    from common import api
+    result = api.generate('glycerol_stock', {'num_samples': 24, 'repeats': 2})
+    result['protocols'] # {file name: filled protocol}, one per run
+    result['platemap']  # csv text mapping every sample to its run, slot and well
+    result['estimate']  # robot time, tips and reagent volumes with {'estimate': True}, see common/estimator.py
+
+Options are the same as the long command line options of each protocol_preprocessor.py.
+Nothing is read from or written to the working directory unless `save` is used, or files are named in the options.
+"""
+import json
+
+from common.protocols import load_preprocessor, to_argv
+from common.output import write_files
+from common import state
+
+
+def render(protocol, options=None):
+    """
+    Every file the preprocessor would write, as a dict of file name to content.
+    With a `state_file` the state the job leaves on the deck is saved to it, like the command line does
+    """
+    preprocessor = load_preprocessor(protocol)
+    try:
+        params = preprocessor.read_args(None, to_argv(options or {}))
+    except SystemExit:
+        #argparse exits on options it doesn't understand
+        raise ValueError(f'Invalid options for {protocol}: {sorted(options or {})}') from None
+    files = preprocessor.render_procedure(params)
+    state.record(params, files)
+    return files
+
+
+def generate(protocol, options=None, out=None, platemap_out=None):
+    """
+    Renders a protocol and returns {'protocols': {file name: content}, 'platemap': content}.
+    The protocol and platemap are also written to the file-like `out` and `platemap_out` when given,
+    which only works for jobs that fit in a single run.
+    """
+    files = render(protocol, options)
+    result = {
+              'protocols': {name: content for name, content in files.items() if name.endswith('.py')},
+              'platemap': next((content for name, content in files.items() if name.endswith('.csv')), None),
+              'estimate': next((json.loads(content) for name, content in files.items() if '_ESTIMATE' in name), None), #only when asked for
+             }
+    if out is not None:
+        if len(result['protocols']) > 1:
+            raise ValueError(f'This job needs {len(result["protocols"])} runs, use the returned protocols instead of `out`')
+        out.write(next(iter(result['protocols'].values())))
+    if platemap_out is not None:
+        platemap_out.write(result['platemap'])
+    return result
+
+
+def save(protocol, options, directory):
+    """Writes the protocols and platemap to `directory`, returning the paths of the protocols"""
+    paths = write_files(directory, render(protocol, options))
+    return [path for path in paths if path.endswith('.py')]
@@ -0,0 +1,78 @@
+"""
+Generates many protocols from one manifest, in parallel.
+
+Run from the repository root:
+    python -m common.batch jobs.jsonl --output_dir filled/
+
+Each JSONL line is one job, naming the protocol folder and its command line options:
+    {"protocol": "glycerol_stock", "options": {"num_samples": 24, "repeats": 2}}
+    {"protocol": "golden_gate_moclo", "options": {"constructs": {"uuid351": ["fuGFP", "RBS1"]}, "master_mix": true}}
+
+A CSV manifest has a `protocol` column and one column per option, blank cells are left out:
+    protocol,num_samples,repeats,num_vectors
+    glycerol_stock,24,2,
+    cell_transform,,,12
+"""
+import logging
+import argparse
+import json
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.protocols import load_preprocessor, to_argv
+
+
+def read_manifest(path):
+    with open(path, newline='') as manifest:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(manifest))
+            return [{'protocol': row.pop('protocol'), 'options': row} for row in rows]
+        return [json.loads(line) for line in manifest if line.strip()]
+
+
+def run_job(job_number, job, output_dir):
+    start = time.perf_counter()
+    result = {'job': job_number, 'protocol': job['protocol'], 'files': [], 'error': None}
+    try:
+        preprocessor = load_preprocessor(job['protocol'])
+        result['files'] = preprocessor.make_procedure(argv=to_argv(job.get('options', {})), output_dir=output_dir)
+    except SystemExit:
+        #argparse exits on options it doesn't understand, which only fails this job
+        result['error'] = f'Invalid options for {job["protocol"]}: {sorted(job.get("options", {}))}'
+    except Exception as error:
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def run_batch(jobs, output_dir, workers=None):
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job_number, job, output_dir) for job_number, job in enumerate(jobs, 1)]
+        return [future.result() for future in futures]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', help='JSONL or CSV file with one job per line')
+    parser.add_argument('--output_dir', '-o', default=os.getcwd(), help='Folder to write the filled protocols to')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Number of processes. Defaults to one per core')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_batch(read_manifest(args.manifest), args.output_dir, args.workers)
+    for result in results:
+        status = result['error'] or ', '.join(os.path.basename(path) for path in result['files'])
+        logging.info(f'JOB {result["job"]} | {result["protocol"]} | {result["seconds"]}s | {status}')
+
+    report_path = os.path.join(args.output_dir, 'batch_report.json')
+    with open(report_path, 'w') as report_file:
+        json.dump(results, report_file, indent=2)
+    failures = sum(1 for result in results if result['error'])
+    logging.info(f'{len(results) - failures} of {len(results)} jobs succeeded in {time.perf_counter() - start:.2f}s, report is {report_path}')
+    sys.exit(1 if failures else 0)
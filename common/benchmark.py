@@ -0,0 +1,115 @@
+"""
+Benchmarks every protocol across a sweep of sizes with the offline simulator.
+
+Run from the repository root:
+    python -m common.benchmark --output benchmark_report.json
+    python -m common.benchmark --save_baseline          # after an intended change
+    python -m common.benchmark --baseline benchmark_baseline.json
+
+Each protocol is rendered for every size (constructs, vectors or samples), then every run it
+needs is executed in common/simulation.py. The report lists commands, tips, aspirates, dispenses,
+estimated robot seconds and preprocessing wall time per protocol and size.
+Robot metrics that grow by more than --tolerance against the baseline are flagged as regressions,
+preprocessing time by more than --time_tolerance since it depends on the machine. Any regression exits 1.
+"""
+import logging
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import api
+from common.protocols import PROTOCOLS, load_preprocessor
+from common.simulation import simulate
+
+SIZES = [1, 8, 24, 96, 192, 384]
+ROBOT_METRICS = ['commands', 'tips', 'aspirates', 'dispenses', 'seconds']
+MIN_TIME_INCREASE = 0.05 # s, anything less is noise
+
+
+def benchmark_constructs(size):
+    """A deterministic library mixing shared and unique parts, like a real MoClo design"""
+    return {f'construct{index}': [f'promoter{index % 4}', f'rbs{index % 3}', f'cds{index % 16}', f'terminator{index % 2}', 'backbone']
+            for index in range(size)}
+
+
+OPTIONS = {
+           'golden_gate_moclo': lambda size: {'constructs': benchmark_constructs(size)},
+           'cell_transform': lambda size: {'num_vectors': size},
+           'glycerol_stock': lambda size: {'num_samples': size, 'repeats': 2},
+          }
+
+
+def run_benchmark(protocol, size):
+    start = time.perf_counter()
+    files = api.render(protocol, OPTIONS[protocol](size))
+    result = {'protocol': protocol, 'size': size, 'preprocess_seconds': round(time.perf_counter() - start, 4)}
+
+    runs = {name: source for name, source in files.items() if name.endswith('.py')}
+    result['runs'] = len(runs)
+    for metric in ROBOT_METRICS:
+        result[metric] = 0
+    for name, source in runs.items():
+        stats = simulate(source, name)
+        for metric in ROBOT_METRICS:
+            result[metric] += stats.get(metric, 0)
+    result['seconds'] = round(result['seconds'], 1)
+    return result
+
+
+def find_regressions(results, baseline, tolerance, time_tolerance):
+    """Every metric that grew past its tolerance, as readable lines"""
+    previous = {(entry['protocol'], entry['size']): entry for entry in baseline}
+    regressions = list()
+    for result in results:
+        before = previous.get((result['protocol'], result['size']))
+        if not before:
+            continue
+        for metric in ROBOT_METRICS:
+            if metric in before and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append(f'{result["protocol"]} x{result["size"]}: {metric} {before[metric]} -> {result[metric]}')
+        metric = 'preprocess_seconds'
+        if metric in before and result[metric] > before[metric] * (1 + time_tolerance) + MIN_TIME_INCREASE:
+            regressions.append(f'{result["protocol"]} x{result["size"]}: {metric} {before[metric]} -> {result[metric]}')
+    return regressions
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--protocols', '-p', nargs='+', default=PROTOCOLS, choices=PROTOCOLS, help='Protocols to benchmark')
+    parser.add_argument('--sizes', '-s', nargs='+', type=int, default=SIZES, help='Number of constructs, vectors or samples to render')
+    parser.add_argument('--output', '-o', default='benchmark_report.json', help='Where to write the report')
+    parser.add_argument('--baseline', '-b', default='benchmark_baseline.json', help='Report to compare against, if it exists')
+    parser.add_argument('--save_baseline', action='store_true', help='Store this report as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='Allowed growth of the robot metrics, as a fraction')
+    parser.add_argument('--time_tolerance', type=float, default=0.5, help='Allowed growth of the preprocessing time, as a fraction')
+    args = parser.parse_args()
+
+    results = list()
+    for protocol in args.protocols:
+        load_preprocessor(protocol) # keep the import out of the first timing
+        for size in args.sizes:
+            result = run_benchmark(protocol, size)
+            results.append(result)
+            print(f'{protocol:>18} x{size:<4} | {result["runs"]} run(s) | {result["commands"]:>6} commands | {result["tips"]:>5} tips | '
+                  f'{result["aspirates"]:>5} aspirates | {result["dispenses"]:>5} dispenses | {result["seconds"] / 60:>7.1f} min | '
+                  f'{result["preprocess_seconds"]:.3f}s preprocessing')
+
+    report = {'results': results, 'regressions': []}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f'Saved baseline to {args.baseline}')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            report['regressions'] = find_regressions(results, json.load(baseline_file), args.tolerance, args.time_tolerance)
+        for regression in report['regressions']:
+            print(f'REGRESSION {regression}')
+
+    with open(args.output, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f'Report is {args.output}')
+    sys.exit(1 if report['regressions'] else 0)
@@ -0,0 +1,121 @@
+"""
+Content-addressed cache of filled protocols.
+
+A request is identified by a hash of its template, its normalized parameters and the code that fills it
+(common/ and the preprocessors), so a change to the planning logic never serves protocols planned the old way.
+Every file a request produced (protocols and platemap) is kept in a folder named after
+that hash, so an identical request gets the same files back instead of rendering them again.
+The cache only ever hands out file contents, which the caller writes to its output folder,
+so evicting an entry never takes away a protocol somebody was given.
+"""
+import ast
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+MAX_ENTRIES = 256
+MAX_AGE_DAYS = 30
+# options that change where files go, not what is in them, and input files whose parsed content is hashed instead
+IGNORED_PARAMS = ('no_cache', 'cache_dir', 'constructs_file', 'vector_map_file', 'design_file', 'sample_map_file', 'state_file', 'resume_from')
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of every source file that takes part in filling a template"""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, 'common', '*.py')) + glob.glob(os.path.join(REPO_DIR, '*', 'protocol_preprocessor.py'))):
+        with open(path, 'rb') as source:
+            digest.update(os.path.relpath(path, REPO_DIR).encode() + source.read())
+    return digest.hexdigest()
+
+
+def normalize(value):
+    """Parses literal strings so `{'a': 1}`, `{"a": 1}` and `{ 'a':1 }` all hash the same"""
+    if isinstance(value, str):
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return value
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, range)):
+        return [normalize(item) for item in value]
+    return value
+
+
+class ProtocolCache:
+    def __init__(self, directory, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 60 * 60
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, template_source, params):
+        params = {key: normalize(value) for key, value in params.items() if key not in IGNORED_PARAMS}
+        content = code_version() + template_source + json.dumps(params, sort_keys=True, default=repr)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def get(self, key):
+        """The cached files for this key as a dict of name to content, or None if it hasn't been rendered yet"""
+        entry = os.path.join(self.directory, key)
+        try:
+            os.utime(entry) # mark as recently used
+            files = dict()
+            #shorter names first so RUN10 comes after RUN9
+            for name in sorted(os.listdir(entry), key=lambda name: (len(name), name)):
+                with open(os.path.join(entry, name)) as cached_file:
+                    files[name] = cached_file.read()
+        except OSError:
+            #never stored, or evicted by another process while it was being read
+            self._count('misses')
+            return None
+        self._count('hits')
+        return files
+
+    def put(self, key, files):
+        """Stores the files, a dict of name to content"""
+        entry = os.path.join(self.directory, key)
+        staging = f'{entry}.{os.getpid()}.tmp'
+        os.makedirs(staging, exist_ok=True)
+        for name, content in files.items():
+            with open(os.path.join(staging, name), 'w') as cached_file:
+                cached_file.write(content)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            #another process stored the same request first, keep theirs
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Drops entries older than the age limit, then the least recently used ones over the size limit"""
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        entries = sorted((os.path.getmtime(entry), entry) for entry in entries if os.path.isdir(entry) and not entry.endswith('.tmp'))
+        now = time.time()
+        for position, (used, entry) in enumerate(entries):
+            if now - used > self.max_age or position < len(entries) - self.max_entries:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def stats(self):
+        try:
+            with open(os.path.join(self.directory, 'stats.json')) as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {'hits': 0, 'misses': 0}
+
+    def _count(self, outcome):
+        stats = self.stats()
+        stats[outcome] += 1
+        stats_path = os.path.join(self.directory, 'stats.json')
+        with open(f'{stats_path}.{os.getpid()}', 'w') as stats_file:
+            json.dump(stats, stats_file)
+        os.replace(f'{stats_path}.{os.getpid()}', stats_path)
+        logging.info(f'Protocol cache {"hit" if outcome == "hits" else "miss"} ({stats["hits"]} hits, {stats["misses"]} misses)')
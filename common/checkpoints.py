@@ -0,0 +1,47 @@
+"""
+Reads the checkpoint logs protocols write on the robot, to resume a run that was interrupted.
+
+Every run of a filled protocol on the robot starts a log, {protocol file name}_CHECKPOINT_{start time}.jsonl,
+with the step it starts from and then appends a line as it finishes each step:
+    {"step": 41, "name": "uuid351 fuGFP", "tips": {"left": 44}}
+with the tips it had picked up on each mount by then. Every tip picked up adds a line too, with the last finished
+step and the new tip count, so a run stopped partway through a step never reuses a tip it already took. Copy the log off the robot and fill the job again
+with the same options and --resume_from pointing at it. Runs before the interrupted one are left out,
+and the interrupted run skips every logged step and starts at the next unused tip.
+Multi-dispenses log every destination well as a step, a step that was cut short is done again from its start.
+"""
+import json
+import os
+import re
+
+# {template}_FILLED{stamp}[_RUN{run}]_CHECKPOINT_{start time}.jsonl
+CHECKPOINT_NAME = re.compile(r'_FILLED.*?(?:_RUN(\d+))?_CHECKPOINT_[0-9-]+\.jsonl')
+
+
+def read_checkpoint(path, template_name):
+    """The run a log belongs to and the last step it finished, as {'run': 2, 'step': 41, 'tips': {'left': 44}}"""
+    name = os.path.basename(path)
+    match = CHECKPOINT_NAME.fullmatch(name[len(template_name):]) if name.startswith(template_name) else None
+    if not match:
+        raise ValueError(f'`{name}` is not the checkpoint log of a {template_name} protocol')
+    with open(path) as log:
+        lines = [line for line in log if line.strip()]
+    #every log opens with the step its run started from, an empty one was cut off as it was created
+    last = json.loads(lines[-1]) if lines else {'step': 0, 'tips': {}}
+    return {'run': int(match.group(1) or 1), 'step': last['step'], 'tips': last['tips']}
+
+
+def check_run(resume, runs):
+    if resume and resume['run'] > runs:
+        raise ValueError(f'The checkpoint is from run {resume["run"]} but the job only has {runs} runs. '
+                         'Fill it with the same options as the interrupted job')
+
+
+def resume_params(resume, run):
+    """The %%RESUME%% placeholder of a run, None unless it is the one being resumed"""
+    return repr({'step': resume['step'], 'tips': resume['tips']} if resume and resume['run'] == run else None)
+
+
+def skipped(resume, run):
+    """Runs before the interrupted one were already done"""
+    return bool(resume) and run < resume['run']
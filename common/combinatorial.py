@@ -0,0 +1,78 @@
+"""
+Expands combinatorial MoClo library designs into constructs, one at a time.
+
+A design lists the alternatives for each position of the assembly, in order:
+    {
+     "slots": {"promoter": ["pJ1", "pJ2"], "rbs": ["RBS1", "RBS2"], "cds": ["fuGFP"], "terminator": ["Term3"]},
+     "backbone": ["pOpen"],               # optional, parts added to every construct
+     "exclude": [["pJ2", "RBS1"]],        # optional, skip constructs containing all of these parts
+     "sample": 96, "seed": 1,             # optional, random subset of the library
+     "prefix": "lib"                      # optional, construct names are the prefix plus the library index
+    }
+`slots` may also be a plain list of lists. Constructs are generated one at a time, so the cross product
+of the slots is never built. What a job actually uses is held in full: sharding keeps every run's
+constructs, the CONSTRUCTS file lists them all, and a sample remembers every index it has drawn.
+Very large libraries should be sampled rather than expanded whole.
+"""
+import json
+import math
+import random
+
+
+class DesignError(ValueError):
+    pass
+
+
+def read_design(path):
+    with open(path) as design_file:
+        design = json.load(design_file)
+    slots = design.get('slots')
+    slots = list(slots.values()) if isinstance(slots, dict) else slots
+    if not slots or not all(isinstance(options, list) and options for options in slots):
+        raise DesignError(f'{path}: `slots` must list at least one part for every position')
+    design['slots'] = slots
+    return design
+
+
+def library_size(design):
+    return math.prod(len(options) for options in design['slots'])
+
+
+def parts_at(design, index):
+    """Decodes a library index into its parts, the last slot varying fastest like itertools.product"""
+    parts = list()
+    for options in reversed(design['slots']):
+        index, choice = divmod(index, len(options))
+        parts.append(options[choice])
+    return parts[::-1] + design.get('backbone', [])
+
+
+def library_indices(design):
+    """Every index in order, or a reproducible random sample of them in order of drawing"""
+    size = library_size(design)
+    if 'sample' not in design or design['sample'] >= size:
+        yield from range(size)
+        return
+    rng = random.Random(design.get('seed', 0))
+    drawn = set()
+    while len(drawn) < size:
+        index = rng.randrange(size)
+        if index not in drawn:
+            drawn.add(index)
+            yield index
+
+
+def expand(design):
+    """Yields (construct name, parts) for every construct of the design that passes the filters"""
+    exclusions = [set(excluded) for excluded in design.get('exclude', [])]
+    width = len(str(library_size(design) - 1))
+    wanted = design.get('sample', math.inf)
+    accepted = 0
+    for index in library_indices(design):
+        if accepted >= wanted:
+            return
+        parts = parts_at(design, index)
+        if any(excluded <= set(parts) for excluded in exclusions):
+            continue
+        accepted += 1
+        yield f'{design.get("prefix", "construct")}{index:0{width}d}', parts
@@ -0,0 +1,145 @@
+"""
+Plans the deck before a template is filled.
+
+Every piece of labware a run needs is requested up front, then packed onto
+the deck slots in the same order the templates used to claim them.
+The resulting plan is embedded in the protocol as constants, so a job that
+doesn't fit is rejected at preprocess time instead of partway through a run.
+"""
+import itertools
+import math
+
+from common.labware import get_labware
+from common.wells import well_index
+
+# slots are handed out from the top of the deck down
+AVAILABLE_SLOTS = range(11, 0, -1)
+TIPS_PER_RACK = 96
+
+
+class DeckCapacityError(IndexError):
+    pass
+
+
+class DeckPlan:
+    def __init__(self, available_slots=AVAILABLE_SLOTS):
+        self.available_slots = list(available_slots)
+        self.requests = [] # (role, load_name, count) in the order slots are claimed
+        self.wells = {}
+        self.columns = {}
+        self.load_names = {}
+        self.tips = {} # role: (first free tip on its first rack, tips the run uses)
+
+    def add_labware(self, role, load_name, count=1):
+        """Only takes slots, so any labware the robot knows will do. Planning its wells or volumes needs it in common/labware.py"""
+        self.requests.append((role, load_name, count))
+
+    def add_tipracks(self, role, load_name, tips, first_tip=0):
+        """`first_tip` tips of the first rack were already used up, by an earlier job left on the deck"""
+        self.tips[role] = (first_tip, tips)
+        self.add_labware(role, load_name, math.ceil((first_tip + tips) / TIPS_PER_RACK))
+
+    def resize_tipracks(self, role, tips):
+        """Re-sizes tipracks requested before the tip count was known, keeping their place on the deck"""
+        first_tip = self.tips[role][0]
+        self.tips[role] = (first_tip, tips)
+        self.requests = [(name, load_name, math.ceil((first_tip + tips) / TIPS_PER_RACK) if name == role else count)
+                         for name, load_name, count in self.requests]
+
+    def tips_left(self):
+        """The first free tip on the last rack of every tiprack role once the run is done, 0 if its racks are used up"""
+        return {role: (first_tip + tips) % TIPS_PER_RACK for role, (first_tip, tips) in self.tips.items()}
+
+    def add_wells(self, role, load_name, items, kept=None):
+        """
+        Assigns each item the next free well, provisioning as many plates as needed.
+        Items in `kept` stay in the well of the first plate they are already in, and nothing else goes in those wells.
+        """
+        names = well_index(load_name).names
+        items = list(items)
+        if kept:
+            taken = set(kept.values())
+            free = ((index // len(names), names[index % len(names)]) for index in itertools.count()
+                    if index >= len(names) or names[index] not in taken)
+            self.wells[role] = {item: (0, kept[item]) if item in kept else next(free) for item in items}
+        else:
+            self.wells[role] = {item: (index // len(names), names[index % len(names)]) for index, item in enumerate(items)}
+        self.load_names[role] = load_name
+        self.add_labware(role, load_name, 1 + max((plate for plate, _ in self.wells[role].values()), default=-1))
+
+    def add_named_wells(self, role, load_name, platemap):
+        """Uses wells the operator has already chosen, all on a single plate"""
+        wells = well_index(load_name)
+        unknown = [well for well in platemap.values() if well not in wells]
+        if unknown:
+            raise ValueError(f'Wells {unknown} do not exist on `{load_name}`')
+        self.wells[role] = {item: (0, well) for item, well in platemap.items()}
+        self.load_names[role] = load_name
+        self.add_labware(role, load_name, 1)
+
+    def add_aligned_wells(self, role, load_name, like):
+        """Puts every item in the same plate and well as in the `like` role, so the plates line up one to one"""
+        wells = well_index(load_name)
+        unknown = sorted({well for _, well in self.wells[like].values() if well not in wells})
+        if unknown:
+            raise ValueError(f'Wells {unknown} of `{self.load_names[like]}` do not exist on `{load_name}`')
+        self.wells[role] = dict(self.wells[like])
+        self.load_names[role] = load_name
+        self.add_labware(role, load_name, 1 + max((plate for plate, _ in self.wells[role].values()), default=-1))
+
+    def add_column_wells(self, role, load_name, columns):
+        """
+        Starts each group of items at the top of a fresh column, so a multichannel pipette serves a group in one move.
+        None in a group leaves its well empty, to keep the other items in the rows they came from.
+        """
+        wells = well_index(load_name)
+        rows = wells.rows
+        columns_per_plate = wells.columns
+        columns = list(columns)
+        self.wells[role] = dict()
+        for index, items in enumerate(columns):
+            if len(items) > rows:
+                raise ValueError(f'{len(items)} items do not fit in one column of `{load_name}`')
+            plate, column = divmod(index, columns_per_plate)
+            for row, item in enumerate(items):
+                if item is not None:
+                    self.wells[role][item] = (plate, wells.name_at(row, column))
+        self.load_names[role] = load_name
+        self.add_labware(role, load_name, math.ceil(len(columns) / columns_per_plate))
+        self.add_columns(role)
+
+    def add_columns(self, role):
+        """
+        Groups the planned wells of a role by plate column, for multichannel pipettes that address
+        a whole column through its top well. Each column is listed as (plate, top well, wells used).
+        """
+        wells = well_index(self.load_names[role])
+        used = dict()
+        for plate, well in self.wells[role].values():
+            column = (plate, wells.column(well))
+            used[column] = used.get(column, 0) + 1
+        self.columns[role] = [(plate, wells.column_top(column), used[(plate, column)]) for plate, column in sorted(used)]
+
+    def load_volumes(self, role, needs):
+        """(plate, well, ul) to load for the planned items of a role in `needs`, what is drawn from them plus the labware's dead volume"""
+        dead_volume = get_labware(self.load_names[role])['dead_volume']
+        return [(plate, well, round(needs[item] + dead_volume, 1)) for item, (plate, well) in self.wells[role].items() if item in needs]
+
+    def slots_needed(self):
+        return sum(count for _, _, count in self.requests)
+
+    def fits(self):
+        return self.slots_needed() <= len(self.available_slots)
+
+    def slots(self):
+        """Packs the requested labware onto the deck, raising if it doesn't fit"""
+        if not self.fits():
+            needs = ', '.join(f'{count} x {load_name} ({role})' for role, load_name, count in self.requests if count)
+            raise DeckCapacityError(f"There aren't enough slots on the deck to run all of the samples you're attempting to run. "
+                                    f"This run needs {self.slots_needed()} slots but only {len(self.available_slots)} are available: {needs}")
+        free_slots = iter(self.available_slots)
+        return {role: [next(free_slots) for _ in range(count)] for role, _, count in self.requests}
+
+    def layout(self):
+        """The plan as plain data, ready to be embedded in a template"""
+        return {'slots': self.slots(), 'wells': self.wells, 'columns': self.columns}
@@ -0,0 +1,78 @@
+"""
+Estimates run time and consumables for filled protocols before they go to the robot.
+
+Every run is executed in the offline simulator (common/simulation.py), so the figures follow the
+operations the template actually plans rather than a rule of thumb:
+    total and per-phase run time
+    tips per tiprack type, and the tipracks and other labware placed on the deck
+    the volume to load in every source well, including the dead volume of its labware
+
+Per-run figures let one deck be restocked at a time, the totals let many runs be batched.
+"""
+import collections
+
+from common.labware import get_labware
+from common.simulation import simulate
+from common.wells import well_index
+
+
+def estimate_run(source, plan, labels, name='<protocol>'):
+    """
+    Time, tips, labware and reagent volumes for one filled protocol and the deck plan it was filled from.
+    Sources in the roles of `labels` are named by calling it with their planned item, others by role and well.
+    """
+    stats = simulate(source, name)
+    load_names = {role: load_name for role, load_name, _ in plan.requests}
+    slot_roles = {slot: (role, plate) for role, slots in plan.slots().items() for plate, slot in enumerate(slots)}
+    planned_items = {(role, plate, well): item for role, wells in plan.wells.items() for item, (plate, well) in wells.items()}
+
+    def deck_order(source):
+        slot, well = source
+        return slot, well_index(load_names[slot_roles[slot][0]]).index(well)
+
+    reagents = dict()
+    for (slot, well), drawn in sorted(stats['drawn'].items(), key=lambda entry: deck_order(entry[0])):
+        role, plate = slot_roles[slot]
+        item = planned_items.get((role, plate, well))
+        label = labels[role](item) if role in labels and item is not None else f'{role} {well}'
+        reagents[label] = {
+                           'slot': slot,
+                           'well': well,
+                           'drawn_ul': round(drawn, 1),
+                           'load_ul': round(drawn + get_labware(load_names[role])['dead_volume'], 1),
+                          }
+
+    labware = collections.Counter()
+    for _, load_name, count in plan.requests:
+        labware[load_name] += count
+    return {
+            'seconds': stats['seconds'],
+            'phases': stats['phases'],
+            'tips': stats['tips_by_rack'],
+            'labware': {load_name: count for load_name, count in labware.items() if count},
+            'reagents': reagents,
+           }
+
+
+def estimate(protocols, plans, labels):
+    """Estimates every run (protocol source paired with its plan) and the totals across them"""
+    runs = [estimate_run(source, plan, labels, name) for (name, source), plan in zip(protocols.items(), plans)]
+    totals = {'seconds': 0, 'phases': collections.Counter(), 'tips': collections.Counter(),
+              'labware': collections.Counter(), 'reagents_ul': collections.Counter()}
+    for run in runs:
+        totals['seconds'] += run['seconds']
+        totals['phases'].update(run['phases'])
+        totals['tips'].update(run['tips'])
+        totals['labware'].update(run['labware'])
+        totals['reagents_ul'].update({label: reagent['load_ul'] for label, reagent in run['reagents'].items()})
+    totals = {key: round(value, 1) if key == 'seconds' else {k: round(v, 1) for k, v in value.items()} for key, value in totals.items()}
+    return {'runs': [{'run': number, 'protocol': name, **run} for number, (name, run) in enumerate(zip(protocols, runs), 1)],
+            'total': totals}
+
+
+def summary(estimate):
+    """One line for the preprocessor log"""
+    total = estimate['total']
+    tips = ', '.join(f'{count} x {rack}' for rack, count in total['tips'].items())
+    return (f'Estimated {total["seconds"] / 3600:.1f}h of robot time over {len(estimate["runs"])} run(s), '
+            f'using {tips or "no"} tips')
@@ -0,0 +1,106 @@
+"""
+Streams construct and platemap data from files instead of the command line.
+
+CSV and JSONL are both accepted, and `-` reads from stdin. Rows are read and validated
+one at a time, so errors point at the row they came from.
+
+    constructs CSV:    uuid351,fuGFP,RBS1,Term3,pOpen           (a `construct,...` header is optional)
+    constructs JSONL:  {"construct": "uuid351", "parts": ["fuGFP", "RBS1", "Term3", "pOpen"]}
+    vector map CSV:    VECTOR NAME,A1                           (a `vector,well` header is optional)
+    vector map JSONL:  {"vector": "VECTOR NAME", "well": "A1"}
+    sample maps are the same as vector maps, with a `sample,well` header or "sample" key
+"""
+import csv
+import itertools
+import json
+import sys
+
+from common.wells import WELL_NAME
+
+
+class InputError(ValueError):
+    pass
+
+
+def open_input(path):
+    return sys.stdin if path == '-' else open(path, newline='')
+
+
+def read_rows(path, columns):
+    """
+    Yields (row number, row) with each row as a dict of the given columns.
+    JSONL rows keep their own keys, CSV rows are matched to the columns by position,
+    with any extra cells collected under the last column as a list.
+    """
+    source = open_input(path)
+    try:
+        lines = (line for line in source)
+        first = next(lines, '')
+        lines = itertools.chain([first], lines)
+        is_jsonl = path.endswith('.jsonl') or first.lstrip().startswith('{')
+        if is_jsonl:
+            for row_number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    raise InputError(f'{path} row {row_number}: not valid JSON ({error})') from None
+                if not isinstance(row, dict):
+                    raise InputError(f'{path} row {row_number}: expected a JSON object, not {type(row).__name__}')
+                yield row_number, row
+        else:
+            for row_number, cells in enumerate(csv.reader(lines), 1):
+                cells = [cell.strip() for cell in cells]
+                if not any(cells) or (row_number == 1 and cells[0].lower() == columns[0]):
+                    continue
+                row = dict(zip(columns[:-1], cells))
+                row[columns[-1]] = [cell for cell in cells[len(columns) - 1:] if cell]
+                yield row_number, row
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+def read_constructs(path):
+    """Reads {construct: [parts]} from a file, rejecting empty or repeated constructs"""
+    constructs = dict()
+    for row_number, row in read_rows(path, ['construct', 'parts']):
+        construct, parts = row.get('construct'), row.get('parts')
+        if not construct:
+            raise InputError(f'{path} row {row_number}: missing construct name')
+        if not parts or not isinstance(parts, list) or not all(isinstance(part, str) and part for part in parts):
+            raise InputError(f'{path} row {row_number}: construct `{construct}` needs a list of part names')
+        if construct in constructs:
+            raise InputError(f'{path} row {row_number}: construct `{construct}` is listed twice')
+        constructs[construct] = parts
+    return constructs
+
+
+def read_well_map(path, item='vector'):
+    """Reads {item: well} from a file, rejecting malformed or repeated wells"""
+    well_map = dict()
+    used_wells = dict()
+    for row_number, row in read_rows(path, [item, 'well']):
+        name, well = row.get(item), row.get('well')
+        if isinstance(well, list): # CSV rows collect the last column as a list
+            well = well[0] if len(well) == 1 else None
+        if not name:
+            raise InputError(f'{path} row {row_number}: missing {item} name')
+        if not isinstance(well, str) or not WELL_NAME.fullmatch(well):
+            raise InputError(f'{path} row {row_number}: `{well}` is not a well name like A1')
+        if name in well_map:
+            raise InputError(f'{path} row {row_number}: {item} `{name}` is listed twice')
+        if well in used_wells:
+            raise InputError(f'{path} row {row_number}: well {well} is already used by `{used_wells[well]}`')
+        well_map[name] = well
+        used_wells[well] = name
+    return well_map
+
+
+def read_vector_map(path):
+    return read_well_map(path, 'vector')
+
+
+def read_sample_map(path):
+    return read_well_map(path, 'sample')
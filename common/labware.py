@@ -0,0 +1,38 @@
+"""Reference data about the pipettes and labware the templates use"""
+
+# Volume range in ul, number of channels and the default tiprack for each pipette
+PIPETTES = {
+    'p20_single_gen2': {'min_volume': 1, 'max_volume': 20, 'channels': 1, 'tiprack': 'opentrons_96_tiprack_20ul'},
+    'p300_single_gen2': {'min_volume': 20, 'max_volume': 300, 'channels': 1, 'tiprack': 'opentrons_96_tiprack_300ul'},
+    'p1000_single_gen2': {'min_volume': 100, 'max_volume': 1000, 'channels': 1, 'tiprack': 'opentrons_96_tiprack_1000ul'},
+    'p20_multi_gen2': {'min_volume': 1, 'max_volume': 20, 'channels': 8, 'tiprack': 'opentrons_96_tiprack_20ul'},
+    'p300_multi_gen2': {'min_volume': 20, 'max_volume': 300, 'channels': 8, 'tiprack': 'opentrons_96_tiprack_300ul'},
+}
+
+# Rows, columns, well capacity and the rough volume a pipette can't reach (dead volume) in ul, and well depth in mm for each labware.
+# Non-standard names are the lab's custom definitions
+LABWARE = {
+    'nest_96_wellplate_100ul_pcr_full_skirt': {'rows': 8, 'columns': 12, 'max_volume': 100, 'dead_volume': 5, 'depth': 14.78},
+    'corning_96_wellplate_360ul_flat': {'rows': 8, 'columns': 12, 'max_volume': 360, 'dead_volume': 20, 'depth': 10.67},
+    'nest_96_wellplate_2ml_deep': {'rows': 8, 'columns': 12, 'max_volume': 2000, 'dead_volume': 50, 'depth': 38.05},
+    'corning_384_wellplate_112ul_flat': {'rows': 16, 'columns': 24, 'max_volume': 112, 'dead_volume': 10, 'depth': 11.43},
+    'biorad_384_wellplate_50ul': {'rows': 16, 'columns': 24, 'max_volume': 50, 'dead_volume': 5, 'depth': 9.35},
+    'nunc_96_well_plate_v_bottom': {'rows': 8, 'columns': 12, 'max_volume': 300, 'dead_volume': 10, 'depth': 11.3},
+    'pcr_96_300ul_ondeepwell': {'rows': 8, 'columns': 12, 'max_volume': 300, 'dead_volume': 10, 'depth': 14.8},
+    'cryo_35_tuberack_2000ul': {'rows': 5, 'columns': 7, 'max_volume': 2000, 'dead_volume': 50, 'depth': 42.0},
+    'cryo_tube_rack': {'rows': 4, 'columns': 6, 'max_volume': 2000, 'dead_volume': 50, 'depth': 42.0},
+    'marburg_6_tuberack_50ml': {'rows': 2, 'columns': 3, 'max_volume': 50000, 'dead_volume': 2000, 'depth': 113.0},
+    'nest_12_reservoir_15ml': {'rows': 1, 'columns': 12, 'max_volume': 15000, 'dead_volume': 1000, 'depth': 26.85},
+    'agilent_1_reservoir_290ml': {'rows': 1, 'columns': 1, 'max_volume': 290000, 'dead_volume': 10000, 'depth': 39.22},
+    'opentrons_96_tiprack_20ul': {'rows': 8, 'columns': 12, 'max_volume': 20, 'dead_volume': 0, 'depth': 39.2},
+    'opentrons_96_tiprack_300ul': {'rows': 8, 'columns': 12, 'max_volume': 300, 'dead_volume': 0, 'depth': 59.3},
+    'opentrons_96_tiprack_1000ul': {'rows': 8, 'columns': 12, 'max_volume': 1000, 'dead_volume': 0, 'depth': 88.0},
+}
+
+
+def get_labware(load_name):
+    try:
+        return LABWARE[load_name]
+    except KeyError:
+        raise KeyError(f'Unknown labware `{load_name}`. Add its dimensions to common/labware.py') from None
+
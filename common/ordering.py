@@ -0,0 +1,119 @@
+"""
+Lays out reagents and orders transfers to cut down on head travel.
+
+Positions are estimated from the OT-2 slot grid and each labware's rows and columns,
+which is close enough to compare two orderings of the same transfers.
+Ties are broken by a generator with a fixed seed, so a job always gets the same layout.
+
+Every function works on a DeckPlan that already fits, so any protocol can use them:
+    arrange_by_use   - most used items in the columns closest to where they are dispensed
+    serpentine       - a role's wells in column order, snaking down one column and up the next
+    reorder          - a role's wells in a given visiting order
+    order_groups     - one-source-many-destination transfers chained nearest neighbour first
+"""
+import math
+import random
+
+from common.wells import well_index
+
+SEED = 0
+SLOT_PITCH = (132.5, 90.5) # mm between the origins of neighbouring slots
+FOOTPRINT = (127.76, 85.48) # every labware is assumed to have the standard plate footprint
+
+
+def slot_origin(slot):
+    """Front left corner of a slot. Slots 1-3 are the front row, numbered left to right"""
+    column, row = (slot - 1) % 3, (slot - 1) // 3
+    return column * SLOT_PITCH[0], row * SLOT_PITCH[1]
+
+
+def well_position(slot, load_name, well):
+    wells = well_index(load_name)
+    row, column = wells.row_col(wells.index(well))
+    x, y = slot_origin(slot)
+    return (x + (column + 0.5) * FOOTPRINT[0] / wells.columns,
+            y + FOOTPRINT[1] - (row + 0.5) * FOOTPRINT[1] / wells.rows)
+
+
+def positions(plan, role):
+    """Estimated (x, y) in mm of every item planned for a role"""
+    slots = plan.slots()[role]
+    load_name = plan.load_names[role]
+    return {item: well_position(slots[plate], load_name, well) for item, (plate, well) in plan.wells[role].items()}
+
+
+def path_length(points):
+    return sum(math.dist(start, end) for start, end in zip(points, points[1:]))
+
+
+def group_travel(groups, source_positions, dest_positions):
+    """Head travel for (source, [destinations]) transfers done in the order given"""
+    path = list()
+    for source, dests in groups:
+        path.append(source_positions[source])
+        path.extend(dest_positions[dest] for dest in dests)
+    return path_length(path)
+
+
+def serpentine(plan, role):
+    """Reorders a role's wells down the first column, up the next and so on, so neighbouring transfers stay close"""
+    wells = well_index(plan.load_names[role])
+    def snake(item):
+        plate, well = plan.wells[role][item]
+        row, column = wells.row_col(wells.index(well))
+        return plate, column, row if column % 2 == 0 else -row
+    reorder(plan, role, sorted(plan.wells[role], key=snake))
+    return list(plan.wells[role])
+
+
+def reorder(plan, role, items):
+    """Puts a role's wells in the order the template should visit them"""
+    plan.wells[role] = {item: plan.wells[role][item] for item in items}
+
+
+def arrange_by_use(plan, role, items, towards, kept=None):
+    """
+    Re-assigns a role's wells so that `items`, most used first, fill whole columns
+    starting from the columns closest to the `towards` role. Uses the same wells count, so the plan still fits.
+    Items in `kept` are already in those wells of the first plate, they stay and the rest go around them.
+    """
+    wells = well_index(plan.load_names[role])
+    slots = plan.slots()[role]
+    targets = list(positions(plan, towards).values())
+    target = (sum(x for x, _ in targets) / len(targets), sum(y for _, y in targets) / len(targets))
+
+    def column_distance(plate_column):
+        plate, column = plate_column
+        return math.dist(well_position(slots[plate], plan.load_names[role], wells.name_at(wells.rows // 2, column)), target)
+    columns = sorted(((plate, column) for plate in range(len(slots)) for column in range(wells.columns)), key=column_distance)
+
+    taken = {(0, well) for well in (kept or {}).values()}
+    free_wells = ((plate, wells.name_at(row, column)) for plate, column in columns for row in range(wells.rows)
+                  if (plate, wells.name_at(row, column)) not in taken)
+    plan.wells[role] = {item: (0, kept[item]) if kept and item in kept else next(free_wells) for item in items}
+    return plan.wells[role]
+
+
+def order_groups(groups, source_positions, dest_positions, seed=SEED):
+    """
+    Chains (source, [destinations]) transfers so each one starts at the source closest to where
+    the last one finished. Destinations keep their order (serpentine them first), but are walked
+    from whichever end is closer to the source.
+    The chain is only kept if it is shorter than the order it was given.
+    """
+    rng = random.Random(seed)
+    remaining = list(groups)
+    rng.shuffle(remaining) # equally close groups are taken in a reproducible order
+    ordered = list()
+    head = (0, 0)
+    while remaining:
+        source, dests = min(remaining, key=lambda group: math.dist(head, source_positions[group[0]]))
+        remaining.remove((source, dests))
+        dests = list(dests)
+        if math.dist(source_positions[source], dest_positions[dests[-1]]) < math.dist(source_positions[source], dest_positions[dests[0]]):
+            dests.reverse()
+        head = dest_positions[dests[-1]]
+        ordered.append((source, dests))
+    if group_travel(ordered, source_positions, dest_positions) >= group_travel(groups, source_positions, dest_positions):
+        return [(source, list(dests)) for source, dests in groups]
+    return ordered
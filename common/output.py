@@ -0,0 +1,19 @@
+"""Names for the files the preprocessors write"""
+import datetime
+import os
+import uuid
+
+
+def unique_stamp():
+    """A timestamp that stays readable, plus a random suffix so files written within the same second don't collide"""
+    return f'{datetime.datetime.now().strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:6]}'
+
+
+def write_files(directory, files):
+    """Writes a dict of file name to content, returning the paths written"""
+    paths = list()
+    for name, content in files.items():
+        paths.append(os.path.join(directory, name))
+        with open(paths[-1], 'w') as output_file:
+            output_file.write(content)
+    return paths
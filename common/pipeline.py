@@ -0,0 +1,154 @@
+"""
+Generates the Golden Gate, transformation and glycerol stock protocols for one construct set in one go.
+
+Run from the repository root:
+    python -m common.pipeline --constructs_file constructs.csv --repeats 2 --output_dir filled/
+
+Every stage takes its source wells from the PLATEMAP of the stage before, so plates move down the line without re-arraying:
+  - each Golden Gate product plate is the vector plate of one cell_transform job, vectors staying in their wells
+  - the transformed cells keep those wells too, and are grown out into a 96 well culture plate in the same layout
+    that the glycerol_stock job takes as its sample plate
+so the product plate has to be in 96 well format, other plates are rejected before anything is rendered.
+Extra options for a stage are given as JSON, e.g. --cell_transform '{"small_pipette": "p20_multi_gen2"}'
+
+PIPELINE{stamp}.json traces every construct through the stages, next to the options and files of each job.
+"""
+import logging
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.protocols import load_preprocessor, to_argv
+from common.output import unique_stamp, write_files
+from common.labware import get_labware
+from common import state
+
+#product wells are kept all the way to the 96 well culture plate
+PLATE_FORMAT = (8, 12)
+
+
+def render(protocol, options):
+    """The preprocessor's parameters and the files it renders from them, saving the deck state when a stage has a state_file"""
+    preprocessor = load_preprocessor(protocol)
+    params = preprocessor.read_args(None, to_argv(options))
+    files = preprocessor.render_procedure(params)
+    state.record(params, files)
+    return params, files
+
+
+def read_platemap(files):
+    """Rows of the PLATEMAP csv among a stage's files, as dicts"""
+    content = next(content for name, content in files.items() if '_PLATEMAP' in name)
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+def run_protocol(files, run):
+    """The protocol file of a run, which only has a _RUN suffix when the job was split"""
+    protocols = sorted(name for name in files if name.endswith('.py'))
+    return protocols[0] if len(protocols) == 1 else next(name for name in protocols if name.endswith(f'_RUN{run}.py'))
+
+
+def by_plate(rows, slot_column):
+    """Groups platemap rows by the run and slot of one of their plates, in the order the plates appear"""
+    plates = collections.OrderedDict()
+    for row in rows:
+        plates.setdefault((row['Run'], row[slot_column]), []).append(row)
+    return plates
+
+
+def run_pipeline(construct_options, repeats, stage_options=None):
+    """
+    Renders every stage, returning ({file name: content}, trace).
+    `construct_options` are the Golden Gate options naming the constructs, e.g. {'constructs_file': 'constructs.csv'}
+    """
+    stage_options = stage_options or {}
+    golden_gate = {**stage_options.get('golden_gate_moclo', {}), **construct_options}
+    product_plate = golden_gate.get('product_plate')
+    if product_plate and (get_labware(product_plate)['rows'], get_labware(product_plate)['columns']) != PLATE_FORMAT:
+        raise ValueError(f'`{product_plate}` is not a 96 well plate. The pipeline moves product plates onto the transformation deck '
+                         'and into culture plates well for well, so give golden_gate_moclo a 96 well product_plate, or run it on its own')
+    files = dict()
+    trace = {'stages': [], 'constructs': dict()}
+
+    def add_stage(protocol, options):
+        params, stage_files = render(protocol, options)
+        files.update(stage_files)
+        trace['stages'].append({'protocol': protocol, 'options': options, 'files': list(stage_files)})
+        return params, stage_files
+
+    assembly_params, assembly_files = add_stage('golden_gate_moclo', golden_gate)
+    for (run, slot), rows in by_plate(read_platemap(assembly_files), 'Product Slot').items():
+        protocol = run_protocol(assembly_files, run)
+        for row in rows:
+            trace['constructs'][row['Construct']] = {'golden_gate_moclo': {'protocol': protocol, 'run': int(run), 'slot': int(slot), 'well': row['Product Well']}}
+
+        #the product plate goes straight onto the transformation deck
+        transform = {
+                     **stage_options.get('cell_transform', {}),
+                     'vector_map': {row['Construct']: row['Product Well'] for row in rows},
+                     'vector_plate': assembly_params['%%PRODUCT PLATE%%'],
+                     'keep_wells': True,
+                    }
+        _, transform_files = add_stage('cell_transform', transform)
+        for (cell_run, cell_slot), cell_rows in by_plate(read_platemap(transform_files), 'Transformed Cell Slot').items():
+            protocol = run_protocol(transform_files, cell_run)
+            for row in cell_rows:
+                trace['constructs'][row['Vector']]['cell_transform'] = {'protocol': protocol, 'run': int(cell_run), 'slot': int(cell_slot), 'well': row['Transformed Cell Well']}
+
+            #cultures grown out from the transformation plate keep its layout
+            stocks = {
+                      **stage_options.get('glycerol_stock', {}),
+                      'sample_map': {row['Vector']: row['Transformed Cell Well'] for row in cell_rows},
+                      'repeats': repeats,
+                     }
+            _, stock_files = add_stage('glycerol_stock', stocks)
+            for row in read_platemap(stock_files):
+                protocol = run_protocol(stock_files, row['Run'])
+                construct = trace['constructs'][row['Sample']]
+                construct.setdefault('glycerol_stock', {'protocol': protocol, 'run': int(row['Run']), 'culture_slot': int(row['Sample Slot']),
+                                                        'culture_well': row['Sample Well'], 'stocks': []})
+                construct['glycerol_stock']['stocks'].append({'slot': int(row['Cryo Slot']), 'well': row['Cryo Well']})
+    return files, trace
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--constructs', '-c'
+                        ,default=None
+                        ,help='Constructs in JSON following the schema {CONSTRUCT NAME:[PART, ...], ...}'
+                        )
+    parser.add_argument('--constructs_file', '--constructs-file', '-cf'
+                        ,default=None
+                        ,help='CSV or JSONL file with one construct per row, see golden_gate_moclo/protocol_preprocessor.py'
+                        )
+    parser.add_argument('--repeats', '-r'
+                        ,default='1'
+                        ,help='Glycerol stocks per construct'
+                        )
+    parser.add_argument('--output_dir', '-o'
+                        ,default=os.getcwd()
+                        ,help='Folder to write every protocol, platemap and the pipeline trace to'
+                        )
+    for protocol in ['golden_gate_moclo', 'cell_transform', 'glycerol_stock']:
+        parser.add_argument(f'--{protocol}'
+                            ,default='{}'
+                            ,help=f'Extra options for the {protocol} stage in JSON, named as its long command line options'
+                            )
+    args = parser.parse_args()
+    if not (args.constructs or args.constructs_file):
+        parser.error('one of --constructs or --constructs_file is required')
+
+    construct_options = {'constructs': args.constructs} if args.constructs else {'constructs_file': args.constructs_file}
+    stage_options = {protocol: json.loads(getattr(args, protocol)) for protocol in ['golden_gate_moclo', 'cell_transform', 'glycerol_stock']}
+    files, trace = run_pipeline(construct_options, args.repeats, stage_options)
+
+    files[f'PIPELINE{unique_stamp()}.json'] = json.dumps(trace, indent=2)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for path in write_files(args.output_dir, files):
+        logging.info(f'Wrote {path}')
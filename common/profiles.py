@@ -0,0 +1,67 @@
+"""
+Aggregates the step timings protocols save on the robot when filled with --profile.
+
+Copy the *_PROFILE_*.json (or .csv) files off the robot, then from the repository root:
+    python -m common.profiles profiles/*.json --top 10
+
+Steps are grouped by protocol, phase, step and pipette across every run given, and listed
+slowest first by total time. Phases are listed the same way, by their wall time.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+
+def read_profile(path):
+    """The steps of one profile, tagged with the protocol they came from"""
+    if path.endswith('.csv'):
+        with open(path, newline='') as profile_file:
+            rows = list(csv.DictReader(profile_file))
+        protocol = os.path.basename(path).split('_PROFILE_')[0]
+    else:
+        with open(path) as profile_file:
+            profile = json.load(profile_file)
+        rows, protocol = profile['steps'], profile['protocol']
+    return [{**row, 'protocol': protocol, 'seconds': float(row['seconds'] or 0)} for row in rows]
+
+
+def aggregate(rows):
+    """Count, total, mean and slowest time of every (protocol, phase, step, pipette), slowest total first"""
+    groups = dict()
+    for row in rows:
+        key = (row['protocol'], row['phase'], row['step'], row['pipette'])
+        groups.setdefault(key, []).append(row['seconds'])
+    summary = [{
+                'protocol': protocol, 'phase': phase, 'step': step, 'pipette': pipette,
+                'count': len(seconds), 'total_seconds': round(sum(seconds), 3),
+                'mean_seconds': round(sum(seconds) / len(seconds), 3), 'max_seconds': max(seconds),
+               } for (protocol, phase, step, pipette), seconds in groups.items()]
+    return sorted(summary, key=lambda entry: -entry['total_seconds'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('profiles', nargs='+', help='Profile JSON or CSV files saved by profiled protocols')
+    parser.add_argument('--top', '-t', type=int, default=10, help='Number of slowest steps and phases to list')
+    parser.add_argument('--output', '-o', default=None, help='Also write the full aggregate to this JSON file')
+    args = parser.parse_args()
+
+    rows = [row for path in args.profiles for row in read_profile(path)]
+    summary = aggregate(rows)
+    phases = [entry for entry in summary if entry['step'] == 'PHASE']
+    steps = [entry for entry in summary if entry['step'] != 'PHASE']
+
+    print(f'Slowest phases across {len(args.profiles)} profiles:')
+    for entry in phases[:args.top]:
+        print(f'  {entry["protocol"]} | {entry["phase"]} | {entry["count"]} runs | {entry["total_seconds"]}s total | {entry["mean_seconds"]}s mean')
+    print('Slowest steps:')
+    for entry in steps[:args.top]:
+        print(f'  {entry["protocol"]} | {entry["phase"]} | {entry["pipette"]} {entry["step"]} | {entry["count"]}x | '
+              f'{entry["total_seconds"]}s total | {entry["mean_seconds"]}s mean | {entry["max_seconds"]}s max')
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+    sys.exit(0)
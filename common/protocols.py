@@ -0,0 +1,24 @@
+"""Finds the preprocessor for each protocol folder and drives it without a real command line"""
+import importlib
+import json
+
+PROTOCOLS = ['golden_gate_moclo', 'cell_transform', 'glycerol_stock']
+
+
+def load_preprocessor(protocol):
+    if protocol not in PROTOCOLS:
+        raise ValueError(f'Unknown protocol `{protocol}`, expected one of {PROTOCOLS}')
+    return importlib.import_module(f'{protocol}.protocol_preprocessor')
+
+
+def to_argv(options):
+    """Turns a dict of options into the command line the preprocessor would normally get"""
+    argv = list()
+    for option, value in options.items():
+        if value is None or value is False or value == '' or str(value).lower() == 'false':
+            continue
+        argv.append(f'--{option}')
+        if value is True or str(value).lower() == 'true':
+            continue
+        argv.append(json.dumps(value) if isinstance(value, (dict, list)) else str(value))
+    return argv
@@ -0,0 +1,194 @@
+"""
+Schedules the reagent transfers of the Golden Gate MoClo protocol.
+
+Instead of loading construct by construct, the grouped schedule inverts the loop
+so every reagent is multi-dispensed to all of the constructs using it, with a fresh tip
+for each aspiration so nothing from the product wells is carried back into a stock.
+"""
+import collections
+import math
+
+from common.labware import PIPETTES
+
+# ul for a REACTION_VOLUME reaction, golden_gate_moclo.py is filled with them scaled to the one asked for
+PART_VOLUME = 0.5
+SHARED_REAGENTS = {
+                   'T4_DNA_Ligase': 0.5,
+                   'T4_DNA_Ligase_buffer': 1.0,
+                   'BsaI-HFv2': 0.5,
+                  }
+REACTION_VOLUME = 10 # water tops every product well up to this. The volumes above are for a reaction this size
+MIX_OVERAGE = 1.1
+
+
+def scaled_volumes(reaction_volume=REACTION_VOLUME):
+    """(part volume, {shared reagent: volume}) for a reaction of `reaction_volume` ul, every reagent scaled alike"""
+    scale = reaction_volume / REACTION_VOLUME
+    return PART_VOLUME * scale, {reagent: volume * scale for reagent, volume in SHARED_REAGENTS.items()}
+
+
+def part_schedule(constructs, master_mix=False):
+    """
+    Maps each reagent to the constructs that use it, in order of first use.
+    Shared reagents are only scheduled when they are not premixed.
+    """
+    schedule = {} if master_mix else {reagent: list(constructs) for reagent in SHARED_REAGENTS}
+    for construct, parts in constructs.items():
+        for part in parts:
+            schedule.setdefault(part, []).append(construct)
+    return list(schedule.items())
+
+
+def dispenses_per_aspiration(pipette, volume):
+    """How many wells one full tip can serve when distributing, keeping the default disposal volume"""
+    spec = PIPETTES[pipette]
+    return max(1, math.floor((spec['max_volume'] - spec['min_volume']) / volume))
+
+
+def count_per_construct(constructs, pipette, master_mix=False):
+    """Aspirations and tips used loading reagents one construct at a time, with a new tip for every transfer"""
+    transfers = sum(len(parts) for parts in constructs.values())
+    if not master_mix:
+        transfers += len(constructs) * len(SHARED_REAGENTS)
+    return {'aspirations': transfers, 'tips': transfers}
+
+
+def count_grouped(schedule, constructs, pipette, reaction_volume=REACTION_VOLUME):
+    """Aspirations and tips used by a grouped schedule, a tip per aspiration and then one per product well for the final mix"""
+    part_volume, shared = scaled_volumes(reaction_volume)
+    aspirations = 0
+    for reagent, construct_ids in schedule:
+        volume = shared.get(reagent, part_volume)
+        aspirations += math.ceil(len(construct_ids) / dispenses_per_aspiration(pipette, volume))
+    return {'aspirations': aspirations, 'tips': aspirations + len(constructs)}
+
+
+def schedule_report(constructs, pipette, master_mix=False, reaction_volume=REACTION_VOLUME):
+    """Compares the grouped schedule to the per-construct one"""
+    schedule = part_schedule(constructs, master_mix)
+    grouped = count_grouped(schedule, constructs, pipette, reaction_volume)
+    per_construct = count_per_construct(constructs, pipette, master_mix)
+    return (f'Reagent loading: grouped plan uses {grouped["aspirations"]} aspirations and {grouped["tips"]} tips, '
+            f'per-construct plan uses {per_construct["aspirations"]} aspirations and {per_construct["tips"]} tips')
+
+
+def count_tips(constructs, master_mix=False, mix_water=False, group_parts=False, water_groups=None, pipette=None,
+               reaction_volume=REACTION_VOLUME):
+    """
+    Total tips the protocol picks up, matching the order of operations in golden_gate_moclo.py.
+    `water_groups` is the water_split of the constructs. Premix transfers larger than the pipette
+    are split by the robot and take a new tip for every part, and grouped parts take one per aspiration,
+    so those need the pipette to count.
+    """
+    water_groups = water_groups or water_split(constructs)
+    if group_parts:
+        #one tip per aspiration of every scheduled reagent, then one per well for the final mix
+        reagent_tips = count_grouped(part_schedule(constructs, master_mix), constructs, pipette, reaction_volume)['tips']
+    else:
+        reagent_tips = sum(len(parts) for parts in constructs.values()) #inserts
+        if not master_mix:
+            reagent_tips += len(constructs) * len(SHARED_REAGENTS) #shared reagents
+    premix_tips = 0
+    if master_mix:
+        max_volume = PIPETTES[pipette]['max_volume'] if pipette else math.inf
+        _, shared = scaled_volumes(reaction_volume)
+        premix = [volume * len(constructs) for volume in shared.values()]
+        if mix_water:
+            #water added to the premix from every water well
+            water = water_volumes(constructs, reaction_volume).values()
+            premix += [min(water, default=0) * len(topped_up) for topped_up in water_groups.values()]
+        premix_tips = (
+                       sum(max(1, math.ceil(volume * MIX_OVERAGE / max_volume)) for volume in premix) #one transfer per premix source
+                       + 2 #mixing the premix, then distributing it with one tip
+                      )
+    return reagent_tips + premix_tips + len(water_groups) #water is distributed with a single tip per well
+
+
+def water_wells(count):
+    """Names of the reagent wells water is split over, the first keeps the plain name"""
+    return ['water', *(f'water {number}' for number in range(2, count + 1))]
+
+
+def water_split(constructs, per_well=None):
+    """Which constructs each water well tops up, `per_well` at a time in the order given, like the template does"""
+    constructs = list(constructs)
+    per_well = per_well or max(1, len(constructs))
+    groups = [constructs[start:start + per_well] for start in range(0, len(constructs), per_well)] or [[]]
+    return dict(zip(water_wells(len(groups)), groups))
+
+
+def reagent_list(constructs, water_per_well=None):
+    """Every reagent that needs a well, parts in order of first use"""
+    parts = dict.fromkeys(part for construct in constructs.values() for part in construct)
+    return [*parts, *SHARED_REAGENTS, *water_split(constructs, water_per_well)]
+
+
+def reagents_by_use(constructs, water_per_well=None):
+    """Every reagent that needs a well, most used first. Water and the shared reagents go into every construct"""
+    uses = collections.Counter(part for parts in constructs.values() for part in parts)
+    for reagent in [*SHARED_REAGENTS, *water_split(constructs, water_per_well)]:
+        uses[reagent] = len(constructs)
+    return sorted(reagent_list(constructs, water_per_well), key=lambda reagent: -uses[reagent])
+
+
+def transfer_groups(constructs, master_mix=False, group_parts=False):
+    """The (reagent, [constructs]) transfers in the order the template makes them"""
+    if group_parts:
+        return part_schedule(constructs, master_mix)
+    return [(reagent, [construct])
+            for construct, parts in constructs.items()
+            for reagent in (parts if master_mix else [*SHARED_REAGENTS, *parts])]
+
+
+def water_volumes(constructs, reaction_volume=REACTION_VOLUME):
+    """Water each construct is topped up with, as the template calculates it. Too many parts make it negative"""
+    part_volume, shared = scaled_volumes(reaction_volume)
+    return {construct: reaction_volume - part_volume * len(parts) - sum(shared.values()) for construct, parts in constructs.items()}
+
+
+def distributed(pipette, volumes):
+    """ul aspirated distributing `volumes` from one well, including the disposal volume every aspiration carries"""
+    if pipette is None:
+        return sum(volumes)
+    spec = PIPETTES[pipette]
+    return sum(volumes) + spec['min_volume'] * math.ceil(sum(volumes) / (spec['max_volume'] - spec['min_volume']))
+
+
+def water_per_well(constructs, capacity, master_mix=False, mix_water=False, pipette=None, reaction_volume=REACTION_VOLUME):
+    """
+    The most constructs one water well holding `capacity` ul can top up.
+    Every construct is counted as needing as much water as the thirstiest one, so the answer doesn't depend on their order.
+    """
+    water = water_volumes(constructs, reaction_volume).values()
+    if not water:
+        return 1
+    mix_water_vol = min(water) if master_mix and mix_water else 0
+    def drawn(count):
+        return distributed(pipette, [max(water) - mix_water_vol] * count) + mix_water_vol * count * MIX_OVERAGE
+    per_well = len(water)
+    while per_well > 1 and drawn(per_well) > capacity:
+        per_well -= 1
+    return per_well
+
+
+def reagent_volumes(constructs, master_mix=False, mix_water=False, pipette=None, group_parts=False, reaction_volume=REACTION_VOLUME,
+                    water_per_well=None):
+    """
+    ul drawn from every reagent well, and from the master mix well if there is one.
+    Disposal volumes of the distributes are included when the pipette is known.
+    Water is split over wells `water_per_well` constructs at a time, in the order of `constructs`.
+    """
+    part_volume, shared = scaled_volumes(reaction_volume)
+    uses = collections.Counter(part for parts in constructs.values() for part in parts)
+    needs = {part: distributed(pipette, [part_volume] * count) if group_parts else part_volume * count for part, count in uses.items()}
+    water = water_volumes(constructs, reaction_volume)
+    mix_water_vol = min(water.values()) if master_mix and mix_water else 0
+    for reagent, volume in shared.items():
+        if master_mix:
+            needs[reagent] = volume * len(constructs) * MIX_OVERAGE
+        else:
+            needs[reagent] = distributed(pipette, [volume] * len(constructs)) if group_parts else volume * len(constructs)
+    for well, topped_up in water_split(constructs, water_per_well).items():
+        needs[well] = distributed(pipette, [water[construct] - mix_water_vol for construct in topped_up]) + mix_water_vol * len(topped_up) * MIX_OVERAGE
+    mix = (sum(shared.values()) + mix_water_vol) * len(constructs) * MIX_OVERAGE if master_mix else 0
+    return needs, mix
@@ -0,0 +1,93 @@
+"""
+Local HTTP service that generates protocols without a new interpreter per request.
+
+Run from the repository root:
+    python -m common.service --port 8765
+
+POST the command line options of a protocol as JSON to its endpoint:
+    curl -X POST localhost:8765/glycerol_stock -d '{"num_samples": 24, "repeats": 2}'
+
+The response holds every filled protocol and the platemap:
+    {"protocols": {"glycerol_stock_protocol_FILLED....py": "..."}, "platemap": "Run,Sample,..."}
+
+Rendering runs in a process pool, where each worker keeps the compiled templates in memory.
+"""
+import logging
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.protocols import PROTOCOLS, load_preprocessor
+from common.templating import load_template
+from common.api import generate
+
+
+def warm_up():
+    """Compiles every template once when a worker starts"""
+    for protocol in PROTOCOLS:
+        preprocessor = load_preprocessor(protocol)
+        load_template(os.path.join(preprocessor.TEMPLATE_DIR, f'{preprocessor.TEMPLATE_NAME}.py'))
+
+
+class ProtocolService:
+    def __init__(self, workers=None):
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+
+    async def handle(self, reader, writer):
+        try:
+            status, body = await self.respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, body = HTTPStatus.BAD_REQUEST, {'error': 'Malformed request'}
+        payload = json.dumps(body).encode()
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n'
+                     f'Connection: close\r\n\r\n'.encode() + payload)
+        await writer.drain()
+        writer.close()
+
+    async def respond(self, reader):
+        method, path, _ = (await reader.readline()).decode().split(' ', 2)
+        headers = dict()
+        while (line := (await reader.readline()).decode().strip()):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        protocol = path.strip('/')
+        if method == 'GET' and protocol == '':
+            return HTTPStatus.OK, {'protocols': PROTOCOLS}
+        if protocol not in PROTOCOLS:
+            return HTTPStatus.NOT_FOUND, {'error': f'Unknown protocol `{protocol}`, expected one of {PROTOCOLS}'}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use POST with the protocol options as a JSON object'}
+
+        options = json.loads(body or b'{}')
+        if not isinstance(options, dict):
+            return HTTPStatus.BAD_REQUEST, {'error': f'Expected the protocol options as a JSON object, not {type(options).__name__}'}
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.pool, generate, protocol, options)
+        except Exception as error:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {'error': f'{type(error).__name__}: {error}'}
+        return HTTPStatus.OK, result
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        logging.info(f'Serving {PROTOCOLS} on http://{host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Keep it local unless the network is trusted')
+    parser.add_argument('--port', '-p', type=int, default=8765)
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Number of rendering processes. Defaults to one per core')
+    args = parser.parse_args()
+    asyncio.run(ProtocolService(args.workers).serve(args.host, args.port))
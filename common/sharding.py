@@ -0,0 +1,74 @@
+"""
+Splits jobs that don't fit on one deck into several runs.
+
+Each preprocessor supplies the items to split (samples, vectors or constructs),
+a function that narrows its arguments down to a subset of them, and its deck planner.
+"""
+import csv
+import io
+import itertools
+
+from common.deck_planner import DeckCapacityError
+
+
+def largest_fitting_prefix(take, fits):
+    """
+    Finds the most leading items that fit, relying on bigger jobs never needing fewer slots.
+    `take(n)` returns up to n leading items. The search gallops up from one item before bisecting,
+    so each probe stays about the size of a run rather than the size of the whole job.
+    """
+    low, high = 1, 2
+    while len(take(high)) == high and fits(take(high)):
+        low, high = high, high * 2
+    high = min(high - 1, len(take(high)))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(take(middle)):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def make_runs(args, items, shard_args, plan_deck):
+    """
+    Packs the items into as few deck-sized runs as possible, filling each run before starting the next.
+    Items may be any iterable, only about one run's worth of them is read ahead at a time.
+    Returns the arguments and deck plan of every run.
+    """
+    def fits(subset):
+        try:
+            return plan_deck(shard_args(args, subset)).fits()
+        except DeckCapacityError:
+            return False
+
+    items = iter(items)
+    buffer = list()
+    def take(count):
+        buffer.extend(itertools.islice(items, max(0, count - len(buffer))))
+        return buffer[:count]
+
+    runs = []
+    while take(1):
+        if not fits(take(1)):
+            #even a single item is too big, so let the planner explain why
+            plan_deck(shard_args(args, take(1))).slots()
+        size = largest_fitting_prefix(take, fits)
+        run_args = shard_args(args, take(size))
+        runs.append((run_args, plan_deck(run_args)))
+        del buffer[:size]
+    return runs
+
+
+def planned_locations(plan, role):
+    """Maps each item of a role to the (slot, well) it was planned into"""
+    slots = plan.slots()[role]
+    return {item: (slots[plate], well) for item, (plate, well) in plan.wells[role].items()}
+
+
+def platemap_csv(header, rows):
+    csvfile = io.StringIO()
+    writer = csv.writer(csvfile)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return csvfile.getvalue()
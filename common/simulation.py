@@ -0,0 +1,372 @@
+"""
+A lightweight stand-in for the Opentrons ProtocolContext, for running filled protocols offline.
+
+It only implements what the templates use, and instead of moving anything it counts commands,
+tip pickups, aspirates and dispenses and estimates how long the robot would take:
+    stats = simulate(open('glycerol_stock_protocol_FILLED....py').read())
+    stats['seconds'], stats['tips']
+    stats['phases']       # seconds per `PHASE | name` comment the template makes
+    stats['tips_by_rack'] # tips picked up per tiprack type
+    stats['drawn']        # ul aspirated from each (slot, well) the operator fills, mixing excluded
+A protocol that needs more tips than its racks hold raises OutOfTipsError, like the robot would stop.
+
+Transfers and distributes are broken into steps the same way the Opentrons API plans them
+(splitting volumes above the pipette's capacity, packing dispenses into one aspiration),
+so the counts track the real protocol closely. Time comes from the per-step durations below
+plus head travel between estimated well positions, including moving down into each well to the
+height it is pipetted at. It is for comparing templates, not for planning a day.
+"""
+import collections
+import functools
+import math
+import os
+import sys
+import tempfile
+import types
+
+from common.labware import PIPETTES, get_labware
+from common.wells import well_index
+from common.ordering import well_position, slot_origin
+
+# seconds per step, measured roughly on an OT-2
+STEP_SECONDS = {
+                'pick_up_tip': 6.0,
+                'drop_tip': 5.0,
+                'aspirate': 1.5,
+                'dispense': 1.0,
+                'blow_out': 1.0,
+                'touch_tip': 2.5,
+                'air_gap': 1.0,
+               }
+HEAD_SPEED = 400 # mm/s
+Z_SPEED = 100 # mm/s, moving into and out of wells
+DEFAULT_HEIGHT = 1 # mm above the bottom of the well, where the robot aspirates and dispenses unless told otherwise
+# default gen2 aspirate flow rates in ul/s, dispensing is about twice as fast
+FLOW_RATES = {20: 7.6, 300: 92.86, 1000: 274.7}
+TRASH = slot_origin(12)
+TIPS_PER_RACK = 96
+
+
+class OutOfTipsError(RuntimeError):
+    pass
+
+
+class SimulatedWell:
+    def __init__(self, parent, well_name):
+        self.parent = parent
+        self.well_name = well_name
+        self.max_volume = get_labware(parent.load_name)['max_volume']
+        self.depth = get_labware(parent.load_name)['depth']
+
+    def top(self, z=0):
+        return SimulatedLocation(self, self.depth + z)
+
+    def bottom(self, z=0):
+        return SimulatedLocation(self, z)
+
+    @functools.cached_property
+    def position(self):
+        return well_position(self.parent.slot, self.parent.load_name, self.well_name)
+
+    def __repr__(self):
+        return f'{self.well_name} of {self.parent}'
+
+
+class SimulatedLocation:
+    """A point `height` mm above the bottom of a well, like the Location that well.top() and well.bottom() return"""
+    def __init__(self, well, height):
+        self.well = well
+        self.height = height
+        self.point = types.SimpleNamespace(x=well.position[0], y=well.position[1], z=height)
+
+    def __repr__(self):
+        return f'{self.well} at {self.height}mm'
+
+
+def as_well(location):
+    if isinstance(location, SimulatedLocation):
+        return location.well
+    return location if isinstance(location, SimulatedWell) else None
+
+
+class SimulatedLabware:
+    def __init__(self, load_name, slot):
+        self.load_name = load_name
+        self.slot = int(slot)
+        self.index = well_index(load_name)
+        self._wells = [SimulatedWell(self, name) for name in self.index.names]
+
+    def wells(self, *names):
+        if names:
+            return [self._wells[self.index.index(name)] for name in names]
+        return list(self._wells)
+
+    def wells_by_name(self):
+        return {well.well_name: well for well in self._wells}
+
+    def __getitem__(self, name):
+        return self._wells[self.index.index(name)]
+
+    def columns(self, *indexes):
+        columns = [self._wells[column * self.index.rows:(column + 1) * self.index.rows] for column in range(self.index.columns)]
+        return [columns[index] for index in indexes] if indexes else columns
+
+    def rows(self):
+        return [self._wells[row::self.index.rows] for row in range(self.index.rows)]
+
+    def __repr__(self):
+        return f'{self.load_name} on {self.slot}'
+
+
+class SimulatedPipette:
+    def __init__(self, context, name, mount, tip_racks):
+        spec = PIPETTES[name]
+        self.context = context
+        self.name = name
+        self.mount = mount
+        self.tip_racks = list(tip_racks)
+        self.channels = spec['channels']
+        self.max_volume = spec['max_volume']
+        self.min_volume = spec['min_volume']
+        self.starting_tip = None
+        self.next_tip = None # position of the next tip across the racks, once the first is picked up
+        rate = FLOW_RATES[self.max_volume]
+        self.flow_rate = types.SimpleNamespace(aspirate=rate, dispense=rate * 2, blow_out=rate * 2)
+        self.has_tip = False
+
+    def _step(self, step, location=None, volume=0, rate=None):
+        self.context.record(step, location, STEP_SECONDS.get(step, 0) + (volume / rate if rate else 0))
+
+    def pick_up_tip(self, location=None):
+        """Takes the next tip, or column of tips, from `starting_tip` on like the robot does, and fails once the racks are used up"""
+        if self.next_tip is None:
+            start = self.starting_tip
+            self.next_tip = self.tip_racks.index(start.parent) * TIPS_PER_RACK + start.parent.index.index(start.well_name) if start else 0
+        rack_number, tip = divmod(self.next_tip, TIPS_PER_RACK)
+        tip = math.ceil(tip / self.channels) * self.channels # a multichannel pipette needs a whole column
+        if tip >= TIPS_PER_RACK:
+            rack_number, tip = rack_number + 1, 0
+        if rack_number >= len(self.tip_racks):
+            raise OutOfTipsError(f'{self.name} has used every tip in its {len(self.tip_racks)} tipracks')
+        rack = self.tip_racks[rack_number]
+        self.next_tip = rack_number * TIPS_PER_RACK + tip + self.channels
+        self.context.record('pick_up_tip', rack.wells()[tip].top(), STEP_SECONDS['pick_up_tip'])
+        self.context.stats['tips'] += self.channels
+        self.context.tips_by_rack[rack.load_name] += self.channels
+        self.has_tip = True
+
+    def drop_tip(self, location=None):
+        self.context.record('drop_tip', TRASH, STEP_SECONDS['drop_tip'])
+        self.has_tip = False
+
+    def return_tip(self):
+        self.drop_tip()
+
+    def aspirate(self, volume=None, location=None, rate=1.0, mixing=False):
+        self.context.stats['aspirates'] += 1
+        if not mixing and as_well(location):
+            self.context.draw(as_well(location), volume or 0, self.channels)
+        self._step('aspirate', location, volume or 0, self.flow_rate.aspirate * rate)
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self.context.stats['dispenses'] += 1
+        if as_well(location):
+            self.context.filled.add((as_well(location).parent.slot, as_well(location).well_name))
+        self._step('dispense', location, volume or 0, self.flow_rate.dispense * rate)
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        for _ in range(repetitions):
+            self.aspirate(volume, location, rate, mixing=True)
+            self.dispense(volume, location, rate)
+
+    def blow_out(self, location=None):
+        self._step('blow_out', location)
+
+    def touch_tip(self, location=None, *args, **kwargs):
+        self._step('touch_tip', as_well(location).top() if as_well(location) else None)
+
+    def air_gap(self, volume=None, height=None):
+        self._step('air_gap')
+
+    def move_to(self, location, *args, **kwargs):
+        self.context.record('move_to', location, 0)
+
+    def _tip_for(self, new_tip, first):
+        if new_tip == 'always' or (new_tip == 'once' and first):
+            if self.has_tip:
+                self.drop_tip()
+            self.pick_up_tip()
+
+    def transfer(self, volume, source, dest, new_tip='once', touch_tip=False, mix_after=None, mix_before=None,
+                 blow_out=False, air_gap=0, **kwargs):
+        sources = source if isinstance(source, list) else [source]
+        dests = dest if isinstance(dest, list) else [dest]
+        pairs = max(len(sources), len(dests))
+        sources = sources * pairs if len(sources) == 1 else sources
+        dests = dests * pairs if len(dests) == 1 else dests
+        volumes = volume if isinstance(volume, list) else [volume] * pairs
+        first = True
+        for source_well, dest_well, pair_volume in zip(sources, dests, volumes):
+            steps = max(1, math.ceil(pair_volume / self.max_volume))
+            for _ in range(steps):
+                self._tip_for(new_tip, first)
+                first = False
+                if mix_before:
+                    self.mix(mix_before[0], mix_before[1], source_well)
+                self.aspirate(pair_volume / steps, source_well)
+                if air_gap:
+                    self.air_gap(air_gap)
+                if touch_tip:
+                    self.touch_tip(source_well)
+                self.dispense(pair_volume / steps, dest_well)
+                if mix_after:
+                    self.mix(mix_after[0], mix_after[1], dest_well)
+                if blow_out:
+                    self.blow_out(dest_well)
+                if touch_tip:
+                    self.touch_tip(dest_well)
+                if new_tip == 'always':
+                    self.drop_tip()
+        if new_tip == 'once' and self.has_tip:
+            self.drop_tip()
+
+    def distribute(self, volume, source, dest, new_tip='once', disposal_volume=None, touch_tip=False,
+                   blow_out=False, air_gap=0, **kwargs):
+        source = source[0] if isinstance(source, list) else source
+        dests = dest if isinstance(dest, list) else [dest]
+        volumes = volume if isinstance(volume, list) else [volume] * len(dests)
+        disposal = self.min_volume if disposal_volume is None else disposal_volume
+        capacity = self.max_volume - disposal
+        # pack as many dispenses as fit into each aspiration, larger volumes are split like a transfer
+        aspirations = list()
+        for dest_well, dest_volume in zip(dests, volumes):
+            if dest_volume <= 0:
+                continue
+            steps = max(1, math.ceil(dest_volume / capacity))
+            for _ in range(steps):
+                if aspirations and sum(v for _, v in aspirations[-1]) + dest_volume / steps <= capacity:
+                    aspirations[-1].append((dest_well, dest_volume / steps))
+                else:
+                    aspirations.append([(dest_well, dest_volume / steps)])
+        for index, dispenses in enumerate(aspirations):
+            self._tip_for(new_tip, index == 0)
+            self.aspirate(sum(v for _, v in dispenses) + disposal, source)
+            if touch_tip:
+                self.touch_tip(source)
+            for dest_well, dest_volume in dispenses:
+                if air_gap:
+                    self.air_gap(air_gap)
+                self.dispense(dest_volume, dest_well)
+                if touch_tip:
+                    self.touch_tip(dest_well)
+            if disposal or blow_out:
+                self.blow_out()
+            if new_tip == 'always':
+                self.drop_tip()
+        if new_tip == 'once' and self.has_tip:
+            self.drop_tip()
+
+
+class SimulatedContext:
+    def __init__(self):
+        self.deck = dict()
+        self.head = TRASH
+        self.head_in = None # (well, height) the tip is in, if any
+        self.stats = collections.Counter()
+        self.phase = 'setup'
+        self.phases = collections.Counter()
+        self.tips_by_rack = collections.Counter()
+        self.drawn = collections.Counter()
+        self.filled = set() # wells the robot has dispensed into, drawing from them again isn't a reagent to load
+        self.fixed_trash = {'A1': TRASH} # disposal volumes are blown out here
+
+    def record(self, command, location, seconds):
+        self.stats['commands'] += 1
+        if location is not None:
+            well = as_well(location)
+            position = well.position if well else location
+            seconds += math.dist(self.head, position) / HEAD_SPEED
+            self.head = position
+            if well:
+                height = location.height if isinstance(location, SimulatedLocation) else DEFAULT_HEIGHT
+                if self.head_in and self.head_in[0] is well:
+                    seconds += abs(self.head_in[1] - height) / Z_SPEED
+                else:
+                    seconds += 2 * max(0, well.depth - height) / Z_SPEED # down into the well and back out
+                self.head_in = (well, height)
+            else:
+                self.head_in = None
+        self.stats['seconds'] += seconds
+        self.phases[self.phase] += seconds
+
+    def draw(self, well, volume, channels):
+        """A single well reservoir feeds every channel, otherwise each channel draws from its own row of the column"""
+        labware = well.parent
+        if (labware.slot, well.well_name) in self.filled:
+            return
+        if channels == 1:
+            self.drawn[(labware.slot, well.well_name)] += volume
+        elif labware.index.rows == 1:
+            self.drawn[(labware.slot, well.well_name)] += volume * channels
+        else:
+            row, column = labware.index.row_col(labware.index.index(well.well_name))
+            for channel in range(min(channels, labware.index.rows - row)):
+                self.drawn[(labware.slot, labware.index.name_at(row + channel, column))] += volume
+
+    def load_labware(self, load_name, location, label=None):
+        if location in self.deck:
+            raise ValueError(f'Slot {location} is already taken by {self.deck[location]}')
+        self.deck[location] = SimulatedLabware(load_name, location)
+        return self.deck[location]
+
+    def load_instrument(self, instrument_name, mount, tip_racks=()):
+        return SimulatedPipette(self, instrument_name, mount, tip_racks)
+
+    def comment(self, msg):
+        self.stats['commands'] += 1
+        if msg.startswith('PHASE | '):
+            self.phase = msg[len('PHASE | '):]
+
+    def pause(self, msg=None):
+        self.stats['commands'] += 1
+        self.stats['pauses'] += 1
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self.record('delay', None, seconds + minutes * 60)
+
+    def is_simulating(self):
+        return True
+
+    def home(self):
+        self.record('home', TRASH, 0)
+
+
+def simulate(source, name='<protocol>'):
+    """Runs a filled protocol against the stand-in and returns what it counted"""
+    opentrons = types.ModuleType('opentrons')
+    opentrons.protocol_api = types.SimpleNamespace(ProtocolContext=SimulatedContext)
+    previous = {module: sys.modules.get(module) for module in ('opentrons', 'opentrons.protocol_api')}
+    sys.modules['opentrons'] = opentrons
+    sys.modules['opentrons.protocol_api'] = opentrons.protocol_api
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            # some templates write files on the robot, their relative paths go to a scratch directory
+            # instead of the working directory, which stays the same for any other thread
+            def scratch_open(file, *args, **kwargs):
+                return open(os.path.join(scratch, file) if isinstance(file, str) else file, *args, **kwargs)
+            namespace = dict(__name__='protocol', open=scratch_open)
+            exec(compile(source, name, 'exec'), namespace)
+            context = SimulatedContext()
+            namespace['run'](context)
+    finally:
+        for module, original in previous.items():
+            if original is None:
+                sys.modules.pop(module, None)
+            else:
+                sys.modules[module] = original
+    stats = dict(context.stats)
+    stats['seconds'] = round(stats.get('seconds', 0), 1)
+    stats['phases'] = {phase: round(seconds, 1) for phase, seconds in context.phases.items()}
+    stats['tips_by_rack'] = dict(context.tips_by_rack)
+    stats['drawn'] = dict(context.drawn)
+    return stats
@@ -0,0 +1,153 @@
+"""
+What a job leaves on the deck for the next one, so back-to-back runs finish partly used tipracks
+and golden_gate_moclo keeps using the reagent plate of the run before.
+
+The preprocessors read it with --state_file and update it once their files are written:
+    {
+     "tipracks": {"opentrons_96_tiprack_20ul": 20},
+     "reagent_plate": {"load_name": "corning_96_wellplate_360ul_flat", "wells": {"fuGFP": "A1", "water": "B1"}}
+    }
+Tipracks map to the first free tip of the rack left partly used, counting down each column (A1, B1 ... H1, A2).
+That rack goes in the first tiprack slot of the next protocol using the same tips.
+Each job also keeps the state it started from under "previous", so the last job can be filled again to resume it.
+
+Generate jobs in the order they are run, and clear the state along with the deck:
+    python -m common.state deck_state.json --clear
+"""
+import logging
+import argparse
+import json
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.deck_planner import DeckCapacityError, TIPS_PER_RACK
+from common.labware import PIPETTES
+
+
+def empty_state():
+    return {'tipracks': {}, 'reagent_plate': None}
+
+
+def read_state(path):
+    """The recorded state, empty if nothing was recorded yet. None when no state file is used"""
+    if not path:
+        return None
+    if not os.path.exists(path):
+        return empty_state()
+    with open(path) as state_file:
+        return {**empty_state(), **json.load(state_file)}
+
+
+def write_state(path, deck_state):
+    with open(f'{path}.{os.getpid()}', 'w') as state_file:
+        json.dump(deck_state, state_file, indent=2)
+    os.replace(f'{path}.{os.getpid()}', path)
+
+
+def starting_tips(deck_state, tipracks):
+    """
+    The first free tip of every tiprack role, from {role: (tiprack, pipette)} in the order the racks are loaded.
+    Multichannel pipettes start at the next whole column. Only the first role using a kind of tips gets the partly used rack.
+    """
+    first_tips = dict()
+    claimed = set()
+    for role, (load_name, pipette) in tipracks.items():
+        if not deck_state or load_name in claimed:
+            continue
+        claimed.add(load_name)
+        channels = PIPETTES[pipette]['channels']
+        first_tip = math.ceil(deck_state['tipracks'].get(load_name, 0) / channels) * channels % TIPS_PER_RACK
+        if first_tip:
+            first_tips[role] = first_tip
+    return first_tips
+
+
+def kept_wells(deck_state, load_name):
+    """Reagents still in the wells of the plate left on the deck, if it is the kind of plate the job uses"""
+    plate = (deck_state or {}).get('reagent_plate')
+    return dict(plate['wells']) if plate and plate['load_name'] == load_name else {}
+
+
+def carry_over(run_params, plan_deck, carried):
+    """
+    Re-plans a later run of a job to start with what the run before left on the deck.
+    If that takes more slots than there are, the run starts on fresh labware instead.
+    """
+    continued = {**run_params, **carried}
+    try:
+        plan = plan_deck(continued)
+        if plan.fits():
+            return continued, plan
+    except DeckCapacityError:
+        pass
+    logging.info('What the last run left on the deck does not fit alongside the next one, which starts on fresh labware')
+    fresh = {**run_params, **{key: {} for key in carried}}
+    return fresh, plan_deck(fresh)
+
+
+def plate_wells(plan, kept):
+    """Every reagent on the first reagent plate once a run is done, including ones it found there but didn't use"""
+    return {**kept, **{item: well for item, (plate, well) in plan.wells['reagents'].items() if plate == 0}}
+
+
+def carried(run_params, plan, reagents=False):
+    """What a run leaves on the deck, as the parameters the next run of the same job starts from"""
+    carry = {'first_tips': {role: first_tip for role, first_tip in plan.tips_left().items() if first_tip}}
+    if reagents:
+        carry['kept_reagents'] = plate_wells(plan, run_params['kept_reagents'])
+    return carry
+
+
+def leftover(deck_state, run_params, plan, reagents=False):
+    """The state once the last run of a job is done, keeping the one it started from in case it has to be resumed"""
+    previous = {'tipracks': deck_state['tipracks'], 'reagent_plate': deck_state['reagent_plate']}
+    deck_state = {'tipracks': dict(deck_state['tipracks']), 'reagent_plate': deck_state['reagent_plate'], 'previous': previous}
+    load_names = {role: load_name for role, load_name, _ in plan.requests}
+    for role, first_tip in plan.tips_left().items():
+        deck_state['tipracks'][load_names[role]] = first_tip
+        if not first_tip:
+            del deck_state['tipracks'][load_names[role]]
+    if reagents:
+        #only the first plate stays, any others are cleared away
+        deck_state['reagent_plate'] = {'load_name': plan.load_names['reagents'], 'wells': plate_wells(plan, run_params['kept_reagents'])}
+    return deck_state
+
+
+def resumed(deck_state):
+    """
+    The state the last job started from, to fill it again when resuming it.
+    Only the last job recorded can be resumed this way
+    """
+    if deck_state is None:
+        return None
+    if 'previous' not in deck_state:
+        if deck_state != empty_state():
+            logging.warning('The state file does not say what the last job started from, resuming from what it left instead')
+        return deck_state
+    return {**empty_state(), **deck_state['previous']}
+
+
+def record(params, files):
+    """Stores the state the job leaves, from the _STATE file among the job's {file name: content}. Resumed jobs were recorded already"""
+    if not params.get('state_file') or params.get('resume'):
+        return
+    content = next((content for name, content in files.items() if '_STATE' in name), None)
+    if content:
+        write_state(params['state_file'], json.loads(content))
+        logging.info(f'Deck state saved to {params["state_file"]}')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('state_file', help='State file the preprocessors were given with --state_file')
+    parser.add_argument('--clear', action='store_true', help='Forget everything on the deck, for fresh tipracks and reagent plates')
+    args = parser.parse_args()
+
+    if args.clear:
+        write_state(args.state_file, empty_state())
+        logging.info(f'Cleared {args.state_file}')
+    else:
+        print(json.dumps(read_state(args.state_file), indent=2))
@@ -0,0 +1,85 @@
+"""
+Compiles protocol templates once and fills them in a single pass.
+
+A template is split into literal text and `%%PLACEHOLDER%%` segments when it is first loaded,
+and kept in memory until the file on disk changes. Its `%%PROTOCOL HELPERS%%` line is replaced
+with common/protocol_helpers.py.tmpl first, so every template shares one copy of those helpers.
+"""
+import logging
+import os
+import re
+
+PLACEHOLDER = re.compile(r'%%[A-Z0-9 _-]+%%')
+HELPERS = re.compile(r'^( *)%%PROTOCOL HELPERS%%\n', re.MULTILINE)
+HELPERS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'protocol_helpers.py.tmpl')
+# placeholders that became plain preprocessor options, still accepted from callers passing them in option_args
+RENAMED_KEYS = {
+                '%%VECTOR PLATEMAP%%': 'vector_map',
+                '%%NUM OF VECTORS%%': 'num_vectors',
+                '%%NUM OF SAMPLES%%': 'num_samples',
+               }
+
+
+class TemplateError(KeyError):
+    pass
+
+
+class Template:
+    def __init__(self, source):
+        self.source = source
+        # literals[i] comes before placeholders[i], the final literal closes the template
+        self.literals = PLACEHOLDER.split(source)
+        self.placeholders = PLACEHOLDER.findall(source)
+
+    def render(self, params):
+        """
+        Fills every placeholder from params. Keys that aren't shaped like placeholders are
+        ignored, so preprocessor-only arguments can travel in the same dict.
+        """
+        values = {key: value for key, value in params.items() if PLACEHOLDER.fullmatch(key)}
+        missing = set(self.placeholders) - values.keys()
+        unused = values.keys() - set(self.placeholders)
+        if missing or unused:
+            raise TemplateError(f'Template placeholders do not match the parameters. Missing: {sorted(missing)}, unused: {sorted(unused)}')
+
+        pieces = [self.literals[0]]
+        for placeholder, literal in zip(self.placeholders, self.literals[1:]):
+            pieces.append(values[placeholder])
+            pieces.append(literal)
+        return ''.join(pieces)
+
+
+def rename_keys(explicit_args):
+    """option_args with any keys from before the rename moved to their current names"""
+    renamed = dict()
+    for key, value in (explicit_args or {}).items():
+        if key in RENAMED_KEYS:
+            logging.warning(f'`{key}` is now `{RENAMED_KEYS[key]}`, please pass it under the new name')
+            key = RENAMED_KEYS[key]
+        renamed[key] = value
+    return renamed
+
+
+def include_helpers(source):
+    """The template source with the shared helpers pasted in at its placeholder line, indented to match"""
+    match = HELPERS.search(source)
+    if not match:
+        return source
+    with open(HELPERS_PATH) as helpers_file:
+        helpers = helpers_file.read().partition('\n\n')[2] # without the header comment about the file itself
+    indent = match.group(1)
+    helpers = ''.join(indent + line if line.strip() else line for line in helpers.splitlines(keepends=True))
+    return source[:match.start()] + helpers + source[match.end():]
+
+
+_compiled = dict() # path -> (mtimes, Template)
+
+def load_template(path):
+    mtimes = (os.stat(path).st_mtime_ns, os.stat(HELPERS_PATH).st_mtime_ns)
+    cached = _compiled.get(path)
+    if cached and cached[0] == mtimes:
+        return cached[1]
+    with open(path) as template_file:
+        template = Template(include_helpers(template_file.read()))
+    _compiled[path] = (mtimes, template)
+    return template
@@ -0,0 +1,100 @@
+"""
+Pre-flight checks of the volumes a protocol plans, so impossible jobs are caught by the
+preprocessor instead of failing halfway through a run on the robot.
+
+    choose_pipette - keeps the requested pipette if it can make every transfer, otherwise picks one that can
+    check_tiprack  - the tips have to match the pipette
+    check_wells    - the final volume has to fit the wells it ends up in
+    check_sources  - what a run draws from each well, plus the labware's dead volume, has to fit in the well
+
+Problems no pipette or run size can fix raise VolumeError and reject the job.
+Sources that overflow raise SourceCapacityError, which sharding treats like a full deck,
+so the job is split into runs small enough for every source well.
+"""
+import logging
+import math
+
+from common.deck_planner import DeckCapacityError
+from common.labware import LABWARE, PIPETTES, get_labware
+
+MAX_ASPIRATIONS = 3 # splitting a transfer into more aspirations than this is too slow to be worth it
+MIN_FRACTION = 0.25 # below this share of its minimum volume a pipette can't be trusted to dispense anything at all
+
+
+class VolumeError(ValueError):
+    pass
+
+
+class SourceCapacityError(DeckCapacityError):
+    pass
+
+
+def aspirations(pipette, volume):
+    return math.ceil(volume / PIPETTES[pipette]['max_volume'])
+
+
+def below_minimum(pipette, volumes):
+    return sorted(volume for volume in set(volumes) if volume < PIPETTES[pipette]['min_volume'])
+
+
+def too_large(pipette, volumes):
+    return sorted(volume for volume in set(volumes) if aspirations(pipette, volume) > MAX_ASPIRATIONS)
+
+
+def choose_pipette(pipette, volumes, candidates, what, allow_below_minimum=False):
+    """
+    The pipette to use for `volumes`, out of the requested one and the `candidates` with as many channels.
+    A pipette that can make every transfer is preferred, the fewer aspirations the better.
+    Volumes below every pipette's minimum are rejected, unless `allow_below_minimum` trades accuracy for them.
+    Then the pipette with the lowest minimum is used with a warning, as long as they are at least MIN_FRACTION of that minimum.
+    """
+    if pipette not in PIPETTES:
+        raise VolumeError(f'Unknown pipette `{pipette}`. Add its volume range to common/labware.py')
+    options = [candidate for candidate in dict.fromkeys([pipette, *candidates]) if PIPETTES[candidate]['channels'] == PIPETTES[pipette]['channels']]
+    fitting = [candidate for candidate in options if not below_minimum(candidate, volumes) and not too_large(candidate, volumes)]
+    if pipette in fitting:
+        return pipette
+    if fitting:
+        choice = min(fitting, key=lambda candidate: (max(aspirations(candidate, volume) for volume in volumes), PIPETTES[candidate]['max_volume']))
+        logging.warning(f'`{pipette}` cannot pipette {", ".join(f"{volume}ul" for volume in below_minimum(pipette, volumes) + too_large(pipette, volumes))} '
+                        f'for the {what}, using `{choice}` instead')
+        return choice
+
+    usable = [candidate for candidate in options if not too_large(candidate, volumes)]
+    if not usable:
+        raise VolumeError(f'No pipette out of {options} can pipette {max(volumes)}ul for the {what} in {MAX_ASPIRATIONS} aspirations or less')
+    choice = min(usable, key=lambda candidate: (PIPETTES[candidate]['min_volume'], candidate != pipette))
+    if min(volumes) < PIPETTES[choice]['min_volume'] * MIN_FRACTION:
+        raise VolumeError(f'{min(volumes)}ul for the {what} is too far below the {PIPETTES[choice]["min_volume"]}ul minimum of `{choice}`, '
+                          f'the most sensitive pipette that can be used')
+    if not allow_below_minimum:
+        raise VolumeError(f'{", ".join(f"{volume}ul" for volume in below_minimum(choice, volumes))} for the {what} is below the '
+                          f'{PIPETTES[choice]["min_volume"]}ul minimum of `{choice}`, the most sensitive pipette that can be used. '
+                          f'Scale the volumes up, or allow volumes below the minimum (--allow_below_minimum) to pipette them with poor accuracy')
+    if choice != pipette:
+        logging.warning(f'`{pipette}` cannot pipette {max(volumes)}ul for the {what}, using `{choice}` instead')
+    logging.warning(f'{", ".join(f"{volume}ul" for volume in below_minimum(choice, volumes))} for the {what} is below the '
+                    f'{PIPETTES[choice]["min_volume"]}ul minimum of `{choice}`, expect poor accuracy')
+    return choice
+
+
+def check_tiprack(pipette, tiprack):
+    #tipracks only take up slots, so one missing from common/labware.py can't be checked but still works
+    if tiprack in LABWARE and LABWARE[tiprack]['max_volume'] != PIPETTES[pipette]['max_volume']:
+        raise VolumeError(f'`{tiprack}` tips do not fit `{pipette}`, use `{PIPETTES[pipette]["tiprack"]}`')
+
+
+def check_wells(load_name, volume, what):
+    """The volume every well of the labware ends up holding"""
+    max_volume = get_labware(load_name)['max_volume']
+    if volume > max_volume:
+        raise VolumeError(f'The {what} need {volume}ul per well, but wells of `{load_name}` only hold {max_volume}ul')
+
+
+def check_sources(load_name, needs, what):
+    """`needs` maps every source item to the ul one run draws from its well"""
+    spec = get_labware(load_name)
+    for item, volume in needs.items():
+        if volume + spec['dead_volume'] > spec['max_volume']:
+            raise SourceCapacityError(f'{what} {item} needs {volume:.1f}ul plus {spec["dead_volume"]}ul dead volume, '
+                                      f'but wells of `{load_name}` only hold {spec["max_volume"]}ul')
@@ -0,0 +1,74 @@
+"""
+Well name <-> index <-> (row, column) tables for rectangular labware.
+
+Indexes follow the column-wise order of Opentrons' `Labware.wells()`: A1, B1, ... H1, A2, ...
+Rows past Z continue as AA, AB, ... so the same code serves 96, 384 and larger formats.
+Tables are built once per labware and shared by every lookup after that.
+"""
+import functools
+import re
+
+from common.labware import get_labware
+
+WELL_NAME = re.compile(r'([A-Z]+)([1-9][0-9]*)')
+
+
+def row_letters(row):
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letters = ''
+    row += 1
+    while row:
+        row, remainder = divmod(row - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def row_col(name):
+    """Zero based (row, column) of a well name, whatever labware it belongs to"""
+    match = WELL_NAME.fullmatch(name)
+    if not match:
+        raise ValueError(f'`{name}` is not a well name like A1')
+    row = 0
+    for letter in match.group(1):
+        row = row * 26 + ord(letter) - ord('A') + 1
+    return row - 1, int(match.group(2)) - 1
+
+
+class WellIndex:
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+        self.names = [f'{row_letters(row)}{column + 1}' for column in range(columns) for row in range(rows)]
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.indexes
+
+    def index(self, name):
+        try:
+            return self.indexes[name]
+        except KeyError:
+            raise KeyError(f'Well `{name}` does not exist on a {self.rows}x{self.columns} plate') from None
+
+    def row_col(self, index):
+        column, row = divmod(index, self.rows)
+        return row, column
+
+    def name_at(self, row, column):
+        return self.names[column * self.rows + row]
+
+    def column(self, name):
+        return self.index(name) // self.rows
+
+    def column_top(self, column):
+        """The well a multichannel pipette is sent to for a whole column"""
+        return self.names[column * self.rows]
+
+
+@functools.lru_cache(maxsize=None)
+def well_index(load_name):
+    labware = get_labware(load_name)
+    return WellIndex(labware['rows'], labware['columns'])
@@ -1,5 +1,9 @@
 from opentrons import protocol_api
+import time
+import datetime
 import math
+import csv
+import json
 
 metadata = {
     'apiLevel': '2.8',
@@ -10,67 +14,113 @@ metadata = {
     }
 
 def run(protocol: protocol_api.ProtocolContext):  
-    num_of_samples = %%NUM OF SAMPLES%%
     repeats_per_sample = %%REPEATS PER SAMPLE%%    
+    multichannel = %%MULTICHANNEL MODE%% # move whole columns of cultures at once
+    glycerol_from_top = %%GLYCEROL FROM TOP%% # glycerol goes in from the top of each tube, blown out there
+    AIR_GAP = 10 # ul drawn in behind a dispense from the top, so nothing drips on the way
+    glycerol_volume = %%GLYCEROL VOLUME%% # ul of glycerol and of culture in every cryo tube
+    culture_volume = %%CULTURE VOLUME%%
     
-    # a function that gets us the next available slot on the deck
-    available_slots = range(11,0,-1)
-    
-    def slot_generator(available_slots):
-        for slot in available_slots:
-            yield slot
-    get_slot = slot_generator(available_slots)
+    # slots and wells for all labware were planned by the preprocessor
+    deck_plan = %%DECK PLAN%%
+    def load_plates(role, labware_type):
+        return [protocol.load_labware(labware_type, slot) for slot in deck_plan['slots'][role]]
+    # indexing a plate by name rebuilds its whole name -> well map, so look wells up in one table per plate
+    def planned_wells(role, plates):
+        tables = [plate.wells_by_name() for plate in plates]
+        return {item: tables[plate][well] for item, (plate, well) in deck_plan['wells'][role].items()}
+    def planned_columns(role, plates):
+        # multichannel pipettes address a column through its top well
+        tables = [plate.wells_by_name() for plate in plates]
+        return [tables[plate][top_well] for plate, top_well, _ in deck_plan['columns'][role]]
+
+    # opt-in liquid tracking: sources start with the volume the preprocessor planned and aspirates follow the meniscus down
+    liquid_tracking = %%LIQUID TRACKING%%
+    liquid_volumes = %%LIQUID VOLUMES%%
+    # opt-in profiling: every pipette step and phase is timed and saved next to the platemap on the robot
+    profile = %%PROFILE%%
+    # every finished step is logged on the robot, a protocol filled with --resume_from that log skips the steps it lists
+    checkpoint = %%CHECKPOINT%%
+    run_name = '%%RUN NAME%%'
+    resume = %%RESUME%% # the last step an interrupted run finished and the tips it had used by then
 
-    # a function that gets us the next available well on a plate
-    # if the plate is full, the functions provisions another plate
-    def well_generator(labware_type):
-        while True:
-            try:
-                plate = protocol.load_labware(labware_type, next(get_slot))
-            except StopIteration:
-                 raise IndexError("""There aren't enough slots on the deck to run
-                                        all of the samples you're attempting to run.
-                                        Try doing it on two seperate runs."""
-                                    ) #Would prefer to raise StopIteration, but OT seems to be weird about handling it
-            for well in plate.wells():
-                yield well
-    get_cryo_well = well_generator('%%CRYO RACK%%')
-    get_sample_well = well_generator('%%SAMPLE PLATE%%')
+    # liquid tracking, flow rate, profiling and checkpoint helpers shared by every protocol, from common/protocol_helpers.py.tmpl
+    %%PROTOCOL HELPERS%%
 
     # load a tiprack and glycerol resevoir
-    tipracks = list()
-    for rack in range(math.ceil(num_of_samples / 95)):
-        tipracks.append(protocol.load_labware('%%TIPRACK%%', next(get_slot)))
+    tipracks = load_plates('tipracks', '%%TIPRACK%%')
         
     protocol.comment('**CHECK BEFORE RUNNING**')
-    protocol.comment('Ensure you have enough glycerol (500ul for each cryo tube)')
-    glycerol_resevoir = protocol.load_labware('%%GLYCEROL PLATE%%', next(get_slot))
+    glycerol_resevoir = load_plates('glycerol', '%%GLYCEROL PLATE%%')[0]
+    load_volumes = track_liquid('glycerol', [glycerol_resevoir])
+    if load_volumes:
+        protocol.comment(f'Load exactly {load_volumes[str(glycerol_resevoir.wells("A1")[0])]}ul of glycerol')
+    else:
+        protocol.comment(f'Ensure you have enough glycerol ({glycerol_volume}ul for each cryo tube)')
 
     # set the pipette we will be using
-    pipette = protocol.load_instrument(
+    pipette = resumable(profiled(protocol.load_instrument(
             '%%PIPETTE%%',
             mount='left',
             tip_racks=tipracks
-    )
+    )))
+    # the first rack may be one an earlier run left partly used
+    start_tips(pipette, tipracks, %%STARTING TIP%%)
 
     protocol.comment('Ensure you have matched the expected culture platemap:')
-    source_list = list()
-    for sample in range(num_of_samples):
-        source_well = next(get_sample_well)
-        source_list.append(source_well)
-        protocol.comment(f'SAMPLE {sample + 1} -> {source_well}')
+    sample_plates = load_plates('samples', '%%SAMPLE PLATE%%')
+    sample_map = planned_wells('samples', sample_plates)
+    for sample in sample_map:
+        # numbered samples count from 1, mapped ones keep their name
+        protocol.comment(f'{"SAMPLE " + str(sample + 1) if isinstance(sample, int) else sample} -> {sample_map[sample]}')
 
+    cryo_plates = load_plates('cryo', '%%CRYO RACK%%')
+    cryo_map = planned_wells('cryo', cryo_plates)
     well_mapping = {}
-    for source in source_list:
-        destination_list = []
-        for repeat in range(repeats_per_sample):
-            destination_list.append(next(get_cryo_well))
-        well_mapping[source] = destination_list
+    if multichannel:
+        # each column of cultures goes to the next `repeats_per_sample` cryo columns
+        cryo_columns = planned_columns('cryo', cryo_plates)
+        sample_columns = planned_columns('samples', sample_plates)
+        for column, source in enumerate(sample_columns):
+            well_mapping[source] = cryo_columns[column * repeats_per_sample:(column + 1) * repeats_per_sample]
+        for (plate, _, wells_used), top_well in zip(deck_plan['columns']['samples'], sample_columns):
+            if wells_used < len(sample_plates[plate].columns()[0]):
+                protocol.comment(f'NOTE: only {wells_used} wells in the column of {top_well} hold samples. '
+                                 'The multichannel pipette also fills the cryo tubes below them, which can be ignored')
+    else:
+        for sample in sample_map:
+            well_mapping[sample_map[sample]] = [cryo_map[(sample, repeat)] for repeat in range(repeats_per_sample)]
 
     #load glycerol into all of the necessary tubes
+    phase('glycerol')
     flat_well_list = [well for sublist in well_mapping.values() for well in sublist]
-    pipette.distribute(source=glycerol_resevoir.wells("A1"),dest=flat_well_list,volume=500, disposal_volume=0)
+    flow_profile(pipette, 'viscous')
+    if glycerol_from_top:
+        #one tube per aspiration so every one is blown out, the tip stays clear of the tubes and is kept throughout
+        for well in flat_well_list:
+            step(f'glycerol {well}')
+            if not pipette.has_tip:
+                pipette.pick_up_tip()
+            pipette.transfer(source=below_meniscus(pipette, glycerol_resevoir.wells("A1")[0], glycerol_volume),
+                             dest=well.top(),
+                             volume=glycerol_volume,
+                             new_tip='never',
+                             air_gap=AIR_GAP,
+                             blow_out=True,
+                             blowout_location='destination well'
+                             )
+        if pipette.has_tip:
+            pipette.drop_tip()
+    else:
+        distribute_steps(pipette, source=glycerol_resevoir.wells("A1")[0],dest=flat_well_list,volume=glycerol_volume, disposal_volume=0,
+                         names=[f'glycerol {well}' for well in flat_well_list])
 
     #load cultures into each appropriate tubes
+    phase('cultures')
+    flow_profile(pipette, None)
     for source in well_mapping:
-        pipette.distribute(source=source,dest=well_mapping[source],volume=500, disposal_volume=0)
\ No newline at end of file
+        distribute_steps(pipette, source=source,dest=well_mapping[source],volume=culture_volume, disposal_volume=0,
+                         names=[f'culture {well}' for well in well_mapping[source]])
+    step()
+
+    save_profile('GLYCEROL_STOCK')
@@ -1,16 +1,57 @@
 import logging
 import argparse
-import datetime
+import json
 import os
+import sys
+import ast
 
-def read_args(explicit_args):
+#the shared helpers live one level up, next to the protocol folders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.deck_planner import DeckPlan
+from common import sharding
+from common import ordering
+from common.output import unique_stamp, write_files
+from common.cache import ProtocolCache
+from common.templating import load_template, rename_keys
+from common import estimator
+from common import validation
+from common import state
+from common import checkpoints
+from common import inputs
+from common.labware import LABWARE, PIPETTES, get_labware
+from common.wells import row_col, well_index
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = 'glycerol_stock_protocol'
+TIPRACKS = {
+            'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
+            ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
+            ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
+            ,'p300_multi_gen2':'opentrons_96_tiprack_300ul'
+           }
+# ul per cryo tube, filled into glycerol_stock_protocol.py as placeholders
+GLYCEROL_VOLUME = 500
+CULTURE_VOLUME = 500
+
+
+def read_args(explicit_args, argv=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--num_samples', '-n'
-                        ,dest='%%NUM OF SAMPLES%%'
+                        ,dest='num_samples'
                         ,default=None
                         ,help='Number of samples'
                         )
+    parser.add_argument('--sample_map', '-sm'
+                        ,dest='sample_map'
+                        ,default='None'
+                        ,help='Culture platemap in JSON following the schema {SAMPLE NAME:"A1", ...}. Use instead of --num_samples to keep the cultures in the wells they are in.'
+                        )
+    parser.add_argument('--sample_map_file', '--sample-map-file', '-smf'
+                        ,dest='sample_map_file'
+                        ,default=None
+                        ,help='CSV or JSONL file with one sample and its well per row, or - for stdin. Use instead of --sample_map.'
+                        )
     parser.add_argument('--repeats', '-r'
                         ,dest='%%REPEATS PER SAMPLE%%'
                         ,default=None
@@ -19,71 +60,301 @@ def read_args(explicit_args):
     parser.add_argument('--cryo_rack', '-cr'
                         ,dest='%%CRYO RACK%%'
                         ,default='cryo_tube_rack'
-                        ,help='Name of labware to use to store glycerol stocks. Use Opentrons standard names.'
+                        ,help='Name of labware to use to store glycerol stocks. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--sample_plate', '-sa'
                         ,dest='%%SAMPLE PLATE%%'
                         ,default='nest_96_wellplate_2ml_deep'
-                        ,help='Name of labware to use to hold the liquid culture. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the liquid culture. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--glycerol_res', '-gly'
                         ,dest='%%GLYCEROL PLATE%%'
                         ,default='agilent_1_reservoir_290ml'
-                        ,help='Name of labware to use to hold the glycerol source. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the glycerol source. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--pipette', '-pi'
                         ,dest='%%PIPETTE%%'
                         ,default='p1000_single_gen2'
-                        ,help='Specify the pipette type. Use Opentrons standard names.'
+                        ,help='Specify the pipette type. Use Opentrons standard names listed in common/labware.py.'
                         )
     parser.add_argument('--tiprack', '-tr'
                         ,dest='%%TIPRACK%%'
                         ,default= None
                         ,help='Specify the tiprack type. Use Opentrons standard names. An option is inferred if nothing is provided.'
                         )
+    parser.add_argument('--track_liquid'
+                        ,dest='%%LIQUID TRACKING%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Aspirate glycerol from just below its surface, following the volume planned for it, with flow rates tuned for viscous liquid. Load exactly the volume the protocol lists.'
+                        )
+    parser.add_argument('--glycerol_from_top'
+                        ,dest='%%GLYCEROL FROM TOP%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Dispense glycerol from the top of each cryo tube behind an air gap and blow it out there, one tube per aspiration with the same tip.'
+                        )
+    parser.add_argument('--profile'
+                        ,dest='%%PROFILE%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Time every pipette step and phase on the robot, saved as CSV and JSON next to the platemap. Aggregate them with `python -m common.profiles`.'
+                        )
+    parser.add_argument('--estimate'
+                        ,dest='estimate'
+                        ,action='store_true'
+                        ,help='Simulate every run to estimate robot time, tips and the volume to load in each source, saved as JSON next to the platemap. Takes a while on very large jobs.'
+                        )
+    parser.add_argument('--no_cache'
+                        ,dest='no_cache'
+                        ,action='store_true'
+                        ,help='Always render a new protocol instead of reusing an identical one from the cache.'
+                        )
+    parser.add_argument('--cache_dir'
+                        ,dest='cache_dir'
+                        ,default=None
+                        ,help='Folder to cache filled protocols in. Defaults to protocol_cache/ in the output folder.'
+                        )
+    parser.add_argument('--state_file'
+                        ,dest='state_file'
+                        ,default=None
+                        ,help='JSON file of the tips left on the deck, read and updated so back-to-back jobs use up partly used tipracks. See common/state.py.'
+                        )
+    parser.add_argument('--no_checkpoint'
+                        ,dest='%%CHECKPOINT%%'
+                        ,action='store_const'
+                        ,const='False'
+                        ,default='True'
+                        ,help='Do not log each finished step on the robot. Without the log an interrupted run can only be started over.'
+                        )
+    parser.add_argument('--resume_from', '--resume-from'
+                        ,dest='resume_from'
+                        ,default=None
+                        ,help='Checkpoint log of an interrupted run, copied off the robot. Give the options of the interrupted job and only the runs it has left are filled, skipping the steps already done. See common/checkpoints.py.'
+                        )
 
-    args = vars(parser.parse_args())
-    if explicit_args: args |= explicit_args
+    args = vars(parser.parse_args(argv))
+    if explicit_args: args |= rename_keys(explicit_args)
 
+    #Check every volume before planning anything, the robot is the most expensive place to find out
+    pipette = validation.choose_pipette(args['%%PIPETTE%%'], [GLYCEROL_VOLUME, CULTURE_VOLUME], TIPRACKS, 'glycerol stocks')
+    if pipette != args['%%PIPETTE%%']:
+        args['%%PIPETTE%%'], args['%%TIPRACK%%'] = pipette, None
     if not args['%%TIPRACK%%']:
-        args['%%TIPRACK%%'] = {
-                               'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
-                               ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
-                               ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
-                              }[args['%%PIPETTE%%']]
+        args['%%TIPRACK%%'] = TIPRACKS[args['%%PIPETTE%%']]
         logging.info(f'Inferring tiprack as `{args["%%TIPRACK%%"]}` based on pipette')
+    validation.check_tiprack(args['%%PIPETTE%%'], args['%%TIPRACK%%'])
 
-    if not args['%%NUM OF SAMPLES%%']:
-        args['%%NUM OF SAMPLES%%'] = input('Number of samples? ')
+    #Start with the tips earlier jobs left on the deck
+    args['deck_state'] = state.read_state(args['state_file'])
+    #a resumed job is filled again from the state it started from
+    args['resume'] = checkpoints.read_checkpoint(args['resume_from'], TEMPLATE_NAME) if args['resume_from'] else None
+    if args['resume']:
+        args['deck_state'] = state.resumed(args['deck_state'])
+    args['first_tips'] = state.starting_tips(args['deck_state'], {'tipracks': (args['%%TIPRACK%%'], args['%%PIPETTE%%'])})
 
-    if not args['%%REPEATS PER SAMPLE%%']:
-        args['%%REPEATS PER SAMPLE%%'] = input('Stocks per sample? ')
+    #a multichannel pipette moves a whole column of cultures at once, so every plate has to be in 96 well format
+    args['%%MULTICHANNEL MODE%%'] = str(PIPETTES[args['%%PIPETTE%%']]['channels'] > 1)
+    if args['%%MULTICHANNEL MODE%%'] == 'True':
+        channels = PIPETTES[args['%%PIPETTE%%']]['channels']
+        if get_labware(args['%%CRYO RACK%%'])['rows'] != channels:
+            #stocks are the product, so never swap in other labware for them, only name the known labware that would do
+            fitting = [name for name, labware in LABWARE.items() if labware['rows'] == channels and 'tiprack' not in name
+                       and labware['max_volume'] >= GLYCEROL_VOLUME + CULTURE_VOLUME]
+            raise ValueError(f'`{args["%%CRYO RACK%%"]}` does not fit a {channels} channel pipette. Give --cryo_rack labware with {channels} rows '
+                             f'that holds {GLYCEROL_VOLUME + CULTURE_VOLUME}ul per well, out of {", ".join(fitting)}, '
+                             'or add the dimensions of your 96 format cryo tube rack to common/labware.py')
+        if get_labware(args['%%GLYCEROL PLATE%%'])['rows'] != 1:
+            args['%%GLYCEROL PLATE%%'] = 'agilent_1_reservoir_290ml'
+            logging.info(f'Inferring glycerol reservoir as `{args["%%GLYCEROL PLATE%%"]}` based on use of multichannel pipette')
+        if get_labware(args['%%SAMPLE PLATE%%'])['rows'] != channels:
+            raise ValueError(f'`{args["%%SAMPLE PLATE%%"]}` does not fit a {channels} channel pipette. Use a 96 well sample plate')
+    validation.check_wells(args['%%CRYO RACK%%'], GLYCEROL_VOLUME + CULTURE_VOLUME, 'glycerol stocks')
+    args['%%GLYCEROL VOLUME%%'], args['%%CULTURE VOLUME%%'] = str(GLYCEROL_VOLUME), str(CULTURE_VOLUME)
+
+    if args['sample_map_file']:
+        args['sample_map'] = inputs.read_sample_map(args['sample_map_file'])
+    else:
+        args['sample_map'] = ast.literal_eval(args['sample_map'])
+    if args['sample_map']:
+        args['num_samples'] = str(len(args['sample_map']))
+
+    #only prompt when run from the command line, batch jobs must provide everything
+    for placeholder, prompt in [('num_samples', 'Number of samples? '), ('%%REPEATS PER SAMPLE%%', 'Stocks per sample? ')]:
+        if not args[placeholder]:
+            if argv is not None:
+                raise ValueError(f'`{placeholder}` is required. use `python protocol_preprocessor.py --help` for more info')
+            args[placeholder] = input(prompt)
 
     return args
 
 
-def make_procedure(option_args = None): 
-    params = read_args(option_args)
-    APP_DIR = os.getcwd()
-    TEMPLATE_NAME = 'glycerol_stock_protocol'
+def sample_list(args):
+    """Every sample, numbered from 0 or by name in plate order if they come with a platemap"""
+    if args['sample_map']:
+        def column_then_row(sample):
+            row, column = row_col(args['sample_map'][sample])
+            return column, row
+        return sorted(args['sample_map'], key=column_then_row)
+    return range(int(args['num_samples']))
+
+
+def sample_label(sample):
+    return f'SAMPLE {sample + 1}' if isinstance(sample, int) else sample
+
+
+def add_samples(plan, args, samples):
+    if args['sample_map']:
+        plan.add_named_wells('samples', args['%%SAMPLE PLATE%%'], {sample: args['sample_map'][sample] for sample in samples})
+    else:
+        plan.add_wells('samples', args['%%SAMPLE PLATE%%'], samples)
+
+
+def plan_deck(args):
+    samples = args.get('samples', sample_list(args))
+    repeats_per_sample = int(args['%%REPEATS PER SAMPLE%%'])
+
+    plan = DeckPlan()
+    if args['%%MULTICHANNEL MODE%%'] == 'True':
+        channels = PIPETTES[args['%%PIPETTE%%']]['channels']
+        plan.add_tipracks('tipracks', args['%%TIPRACK%%'], 0, args['first_tips'].get('tipracks', 0)) #sized once the columns are known
+        plan.add_labware('glycerol', args['%%GLYCEROL PLATE%%'])
+        add_samples(plan, args, samples)
+        plan.add_columns('samples')
+        #every sample keeps its row, since the pipette moves the whole column at once
+        wells = well_index(args['%%SAMPLE PLATE%%'])
+        columns = dict()
+        for sample, (plate, well) in plan.wells['samples'].items():
+            row, column = wells.row_col(wells.index(well))
+            columns.setdefault((plate, column), [None] * wells.rows)[row] = sample
+        columns = [columns[column] for column in sorted(columns)]
+        #one pickup to distribute glycerol, then one per sample column.
+        #the stocks of a column go to as many consecutive cryo columns as there are repeats
+        plan.resize_tipracks('tipracks', (len(columns) + 1) * channels)
+        plan.add_column_wells('cryo', args['%%CRYO RACK%%'],
+                              [[(sample, repeat) if sample is not None else None for sample in column] for column in columns for repeat in range(repeats_per_sample)])
+        check_sources(args, plan)
+        return plan
+
+    #one tip to distribute glycerol, then one per sample
+    plan.add_tipracks('tipracks', args['%%TIPRACK%%'], len(samples) + 1, args['first_tips'].get('tipracks', 0))
+    plan.add_labware('glycerol', args['%%GLYCEROL PLATE%%'])
+    add_samples(plan, args, samples)
+    plan.add_wells('cryo', args['%%CRYO RACK%%'],
+                   [(sample, repeat) for sample in samples for repeat in range(repeats_per_sample)])
+    check_sources(args, plan)
+    return plan
+
+
+def glycerol_needed(args, plan):
+    """ul of glycerol a run draws, a multichannel pipette also fills the unused tubes of partial columns"""
+    if args['%%MULTICHANNEL MODE%%'] == 'True':
+        return len(plan.columns['cryo']) * PIPETTES[args['%%PIPETTE%%']]['channels'] * GLYCEROL_VOLUME
+    return len(plan.wells['cryo']) * GLYCEROL_VOLUME
+
+
+def check_sources(args, plan):
+    """Too much glycerol for the reservoir makes for smaller runs, too little culture for its repeats rejects the job"""
+    repeats_per_sample = int(args['%%REPEATS PER SAMPLE%%'])
+    validation.check_sources(args['%%GLYCEROL PLATE%%'], {'glycerol': glycerol_needed(args, plan)}, 'The')
+    validation.check_sources(args['%%SAMPLE PLATE%%'], {sample_label(sample): repeats_per_sample * CULTURE_VOLUME for sample in plan.wells['samples']}, 'The culture of')
+
+
+def shard_args(args, samples):
+    return {**args, 'samples': samples}
+
+
+def render_procedure(params):
+    """Fills the template for every run, returning the protocols and platemap as a dict of file name to content"""
+    #Get procedure template, compiled once per change to the file
+    template = load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py'))
+
+    #Split the samples into as many runs as it takes to fit them on the deck
+    runs = sharding.make_runs(params, sample_list(params), shard_args, plan_deck)
+    checkpoints.check_run(params['resume'], len(runs))
+    if len(runs) > 1:
+        logging.info(f'Samples do not fit on one deck, splitting them into {len(runs)} runs')
+
+    now = unique_stamp()
+    files = dict()
+    platemap = list()
+    for run, (run_params, plan) in enumerate(runs, 1):
+        if run > 1 and params['deck_state'] is not None:
+            #back-to-back runs go on with the tipracks the run before left
+            run_params, plan = state.carry_over(run_params, plan_deck, state.carried(*runs[run - 2]))
+            runs[run - 1] = (run_params, plan)
+        if run_params['%%MULTICHANNEL MODE%%'] == 'False':
+            #Take the cultures in the order that keeps the head closest to its last cryo tube
+            sample_positions = ordering.positions(plan, 'samples')
+            cryo_positions = ordering.positions(plan, 'cryo')
+            transfers = [(sample, [(sample, repeat) for repeat in range(int(run_params['%%REPEATS PER SAMPLE%%']))]) for sample in plan.wells['samples']]
+            ordered = ordering.order_groups(transfers, sample_positions, cryo_positions)
+            logging.info(f'Run {run}: estimated head travel for loading cultures {ordering.group_travel(transfers, sample_positions, cryo_positions) / 1000:.1f}m, '
+                         f'{ordering.group_travel(ordered, sample_positions, cryo_positions) / 1000:.1f}m after reordering')
+            ordering.reorder(plan, 'samples', [sample for sample, _ in ordered])
+        run_params['%%DECK PLAN%%'] = repr(plan.layout())
+        run_params['%%STARTING TIP%%'] = str(plan.tips['tipracks'][0])
+        #The reservoir starts with the glycerol the run draws, for tracking its liquid level
+        dead_volume = get_labware(run_params['%%GLYCEROL PLATE%%'])['dead_volume']
+        run_params['%%LIQUID VOLUMES%%'] = repr({'glycerol': [(0, 'A1', round(glycerol_needed(run_params, plan) + dead_volume, 1))]})
+        if run_params['%%MULTICHANNEL MODE%%'] == 'True' and any(used < PIPETTES[run_params['%%PIPETTE%%']]['channels'] for _, _, used in plan.columns['samples']):
+            logging.warning(f'Run {run}: sample columns are only partly used. '
+                            f'The multichannel pipette also fills the cryo tubes below it, which can be ignored')
+
+        #Every run logs its steps under its own name, only the interrupted run of a resumed job skips any
+        run_suffix = f'_RUN{run}' if len(runs) > 1 else ''
+        run_params['%%RUN NAME%%'] = f'{TEMPLATE_NAME}_FILLED{now}{run_suffix}'
+        run_params['%%RESUME%%'] = checkpoints.resume_params(params['resume'], run)
+
+        #Replace placeholders with values, leaving out the runs a resumed job already did
+        if not checkpoints.skipped(params['resume'], run):
+            files[f'{run_params["%%RUN NAME%%"]}.py'] = template.render(run_params)
+
+        sample_locations = sharding.planned_locations(plan, 'samples')
+        cryo_locations = sharding.planned_locations(plan, 'cryo')
+        for (sample, repeat), (cryo_slot, cryo_well) in cryo_locations.items():
+            platemap.append([run, sample + 1 if isinstance(sample, int) else sample, *sample_locations[sample], repeat + 1, cryo_slot, cryo_well])
+
+    #One platemap covers every run
+    files[f'{TEMPLATE_NAME}_PLATEMAP{now}.csv'] = sharding.platemap_csv(['Run', 'Sample', 'Sample Slot', 'Sample Well', 'Stock', 'Cryo Slot', 'Cryo Well'], platemap)
+
+    #The tips the last run leaves, for the next job
+    if params['deck_state'] is not None and not params['resume']:
+        files[f'{TEMPLATE_NAME}_STATE{now}.json'] = json.dumps(state.leftover(params['deck_state'], *runs[-1]), indent=2)
+
+    #Simulate every run to estimate robot time, tips and the volume to load in each source, when asked for
+    if params['estimate']:
+        estimate = estimator.estimate({name: content for name, content in files.items() if name.endswith('.py')}, [plan for run, (_, plan) in enumerate(runs, 1) if not checkpoints.skipped(params['resume'], run)], {'samples': sample_label})
+        files[f'{TEMPLATE_NAME}_ESTIMATE{now}.json'] = json.dumps(estimate, indent=2)
+        logging.info(estimator.summary(estimate))
+
+    return files
 
-    #Get procedure template
-    with open(os.path.join(APP_DIR, f'{TEMPLATE_NAME}.py')) as template_file:
-        protocol = template_file.read()
 
-    #Replace placeholders with values
-    for placeholder in params:
-        protocol = protocol.replace(placeholder, params[placeholder])
+def make_procedure(option_args = None, argv = None, output_dir = None): 
+    params = read_args(option_args, argv)
+    APP_DIR = output_dir or os.getcwd()
 
-    #Save finalized version of of the file
-    now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    unique_file_name = f'{TEMPLATE_NAME}_FILLED{now}.py'
-    with open(os.path.join(APP_DIR,unique_file_name),'w') as output_file:
-        output_file.write(protocol)
+    #Identical requests are served from the cache instead of being rendered again
+    cache = None if params['no_cache'] else ProtocolCache(params['cache_dir'] or os.path.join(APP_DIR, 'protocol_cache'))
+    files = None
+    if cache:
+        cache_key = cache.key(load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py')).source, params)
+        files = cache.get(cache_key)
+    if files is None:
+        files = render_procedure(params)
+        if cache:
+            cache.put(cache_key, files)
 
-    return os.path.join(APP_DIR,'procedures',unique_file_name)
+    #Save finalized version of the files, the cache only keeps a copy
+    output_files = write_files(APP_DIR, files)
+    state.record(params, files)
+    return [path for path in output_files if path.endswith('.py')]
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    output_file = make_procedure()
-    logging.info(f'Success - file is {output_file}')
\ No newline at end of file
+    output_files = make_procedure()
+    logging.info(f'Success - files are {output_files}')
\ No newline at end of file
@@ -1,5 +1,9 @@
 from opentrons import protocol_api
+import time
+import datetime
 import math
+import csv
+import json
 
 metadata = {
     'apiLevel': '2.8',
@@ -12,12 +16,17 @@ metadata = {
                     A nice video description hereof MoClo:
                     https://www.youtube.com/playlist?list=PLvzzMEb3Zsn-n-ItduNGJzghAJsgsnd4Q
 
-                    Materials:
+                    Materials, for the default 10ul reaction. Every volume
+                    scales with the reaction volume:
                     T4 DNA Ligase buffer (1ul per construct) [from NEB]
                     T4 DNA Ligase (0.5ul per construct) [from NEB]
                     BsaI-HFv2 (0.5ul per construct) [from NEB]
                     Water (10ul per construct)
 
+                    In master mix mode, ligase, buffer and enzyme (and optionally
+                    the water shared by all constructs) are premixed once in a
+                    reservoir well and distributed to every product well
+
                     DNA insert (0.5ul per construct using it) [concentration?]
                     Entry Vector at 15ng/ul (0.5ul per construct)
                    """
@@ -33,111 +42,194 @@ def run(protocol: protocol_api.ProtocolContext):
     #A dict mapping desired construct uids to lists of parts
     constructs = %%CONSTRUCT DATA%%
 
+    # premix the shared reagents once instead of adding them to each construct
+    master_mix = %%MASTER MIX%%
+    mix_water = %%MIX WATER%%
+    mix_overage = 1.1 # make extra master mix to cover pipetting losses
+
+    # load each reagent into all of its constructs at once, then mix every well at the end
+    group_parts = %%GROUP PARTS%%
+    part_schedule = %%PART SCHEDULE%%
+
+    # reagent volumes come scaled to the reaction volume from the preprocessor, mixes are scaled from a 10ul reaction here
+    reaction_volume = %%REACTION VOLUME%%
+    scale = reaction_volume / 10
+    part_volume = %%PART VOLUME%%
+
     def make_flat_material_list(constructs):
         return [insert for construct in constructs.values() for insert in construct]
     def make_unique_material_list(constructs):
         flat_list = make_flat_material_list(constructs)
         unique_material_list = list(set(flat_list))
         return unique_material_list
-    inserts = {insert: 0.5 for insert in make_unique_material_list(constructs)}
-    shared_reagents = {
-                        'T4_DNA_Ligase': 0.5, 
-                        'T4_DNA_Ligase_buffer': 1.0,
-                        'BsaI-HFv2': 0.5,
-                       }
-    dilution = {'water': 10} # we will add water until each final well has this volume
+    inserts = {insert: part_volume for insert in make_unique_material_list(constructs)}
+    shared_reagents = %%SHARED REAGENTS%%
+    dilution = {'water': reaction_volume} # we will add water until each final well has this volume
+    viscous_reagents = ['T4_DNA_Ligase', 'BsaI-HFv2'] # enzymes come in 50% glycerol
     reagents = {**inserts, **shared_reagents, **dilution}
     
-    # a function that gets us the next available slot on the deck
-    available_slots = range(11,0,-1)
-    def slot_generator(available_slots):
-        for slot in available_slots:
-            yield slot
-    get_slot = slot_generator(available_slots)
-
-    # a function that gets us the next available well on a plate
-    # if the plate is full, the functions provisions another plate
-    def well_generator(labware_type):
-        while True:
-            try:
-                plate = protocol.load_labware(labware_type, next(get_slot))
-            except StopIteration:
-                 raise IndexError("""There aren't enough slots on the deck to run
-                                        all of the samples you're attempting to run.
-                                        Try doing it on two seperate runs."""
-                                    ) #Would prefer to raise StopIteration, but OT seems to be weird about handling it
-            for well in plate.wells():
-                yield well
-    get_reagent_well = well_generator('%%REAGENT PLATE%%')
-    get_product_well = well_generator('%%PRODUCT PLATE%%')
-
-
-    # load a tiprack
-    # assume every transfer will be mixed, meaning the tip will need to be replaced
-    total_tips = (
-                  len(make_flat_material_list(constructs)) #inserts
-                  + (len(constructs) * len(shared_reagents)) #shared reagents
-                  + len(dilution) #we'll distribute first and thus use just one tip
-                 )
-    tipracks = list()
-    for rack in range(math.ceil(total_tips / 95)):
-        tipracks.append(protocol.load_labware('%%TIPRACK%%', next(get_slot)))
-        
-    
+    # slots and wells for all labware were planned by the preprocessor
+    deck_plan = %%DECK PLAN%%
+    def load_plates(role, labware_type):
+        return [protocol.load_labware(labware_type, slot) for slot in deck_plan['slots'][role]]
+    # indexing a plate by name rebuilds its whole name -> well map, so look wells up in one table per plate
+    def planned_wells(role, plates):
+        tables = [plate.wells_by_name() for plate in plates]
+        return {item: tables[plate][well] for item, (plate, well) in deck_plan['wells'][role].items()}
+
+    # opt-in liquid tracking: sources start with the volume the preprocessor planned and aspirates follow the meniscus down
+    liquid_tracking = %%LIQUID TRACKING%%
+    liquid_volumes = %%LIQUID VOLUMES%%
+    # opt-in profiling: every pipette step and phase is timed and saved next to the platemap on the robot
+    profile = %%PROFILE%%
+    # every finished step is logged on the robot, a protocol filled with --resume_from that log skips the steps it lists
+    checkpoint = %%CHECKPOINT%%
+    run_name = '%%RUN NAME%%'
+    resume = %%RESUME%% # the last step an interrupted run finished and the tips it had used by then
+
+    # liquid tracking, flow rate, profiling and checkpoint helpers shared by every protocol, from common/protocol_helpers.py.tmpl
+    %%PROTOCOL HELPERS%%
+
+    tipracks = load_plates('tipracks', '%%TIPRACK%%')
+    reagent_plates = load_plates('reagents', '%%REAGENT PLATE%%')
+    product_plates = load_plates('products', '%%PRODUCT PLATE%%')
+
     # set the pipette we will be using
-    pipette = protocol.load_instrument(
+    pipette = resumable(profiled(protocol.load_instrument(
             '%%PIPETTE%%',
             mount='left',
             tip_racks=tipracks
-    )
+    )))
+    # the first rack may be one an earlier run left partly used
+    start_tips(pipette, tipracks, %%STARTING TIP%%)
 
     protocol.comment('**CHECK BEFORE RUNNING**')
     protocol.comment('Ensure you have matched the expected reagent platemap:')
 
+    # mixing draws up a share of the reaction, so small reactions are mixed with less
+    mix_volume = max(pipette.min_volume, 3 * scale)
+
     #load all reagents onto plates and output wellmap for them
-    reagent_map = dict()
-    for reagent in reagents:
-        reagent_well = next(get_reagent_well)
-        reagent_map[reagent] = reagent_well
-        protocol.comment(f'    REAGENT | {reagent} -> {reagent_well}')
+    reagent_map = planned_wells('reagents', reagent_plates)
+    load_volumes = track_liquid('reagents', reagent_plates)
+    kept_reagents = %%KEPT REAGENTS%% # still in their wells on the plate the last run left, only top them up
+    for reagent in reagent_map:
+        load_volume = f' ({load_volumes[str(reagent_map[reagent])]}ul)' if str(reagent_map[reagent]) in load_volumes else ''
+        kept = ' already on the plate' if reagent in kept_reagents else ''
+        protocol.comment(f'    REAGENT | {reagent} -> {reagent_map[reagent]}{load_volume}{kept}')
 
     #create wellmap for products
-    product_map = {}
-    for construct in constructs:
-        product_well = next(get_product_well)
-        product_map[construct] = product_well
+    product_map = planned_wells('products', product_plates)
 
     #load water into all of the necessary wells
     #Begin by calculating required water dilution for each construct
-    water_vols = list()
+    water_vols = dict()
     for construct in product_map:
         target_vol = dilution['water']
         vol_from_inserts = sum([inserts[insert] for insert in constructs[construct]])
         vol_from_shared_reagents = sum(shared_reagents.values())
-        water_vols.append(target_vol - vol_from_inserts - vol_from_shared_reagents)
-
-    pipette.distribute(source=reagent_map['water'],
-                       dest=list(product_map.values()),
-                       volume=water_vols,
-                       touch_tip=True
-                       )
+        water_vols[construct] = target_vol - vol_from_inserts - vol_from_shared_reagents
+
+    # each water well tops up this many products in turn, the preprocessor adds water wells until they all fit
+    water_per_well = %%WATER PER WELL%%
+    products = list(product_map)
+    water_groups = {('water' if number == 0 else f'water {number + 1}'): products[start:start + water_per_well]
+                    for number, start in enumerate(range(0, len(products), water_per_well))}
+
+    if master_mix:
+        #water every construct needs can go into the premix, only the remainder is added per well
+        mix_water_vol = min(water_vols.values()) if mix_water else 0
+        water_vols = {construct: vol - mix_water_vol for construct, vol in water_vols.items()}
+        mix_vol_per_well = sum(shared_reagents.values()) + mix_water_vol
+        mix_well = load_plates('mix_reservoir', '%%MIX RESERVOIR%%')[0].wells()[0]
+        protocol.comment(f'    MASTER MIX | {mix_vol_per_well}ul per construct -> {mix_well}')
+
+    phase('water')
+    flow_profile(pipette, 'aqueous')
+    for water, topped_up in water_groups.items():
+        distribute_steps(pipette,
+                         source=reagent_map[water],
+                         dest=[product_map[construct] for construct in topped_up],
+                         volume=[water_vols[construct] for construct in topped_up],
+                         names=[f'{construct} {water}' for construct in topped_up],
+                         touch_tip=True
+                         )
+
+    if master_mix:
+        phase('master mix')
+        #build the premix with one tip per reagent, then mix it thoroughly
+        mix_components = {**shared_reagents, 'water': mix_water_vol} if mix_water else shared_reagents
+        for reagent in mix_components:
+            flow_profile(pipette, 'viscous' if reagent in viscous_reagents else 'aqueous')
+            #premix water comes from every water well, in proportion to the products it tops up
+            sources = {water: len(topped_up) for water, topped_up in water_groups.items()} if reagent == 'water' else {reagent: len(constructs)}
+            for source, count in sources.items():
+                step(f'master mix {source}')
+                volume = mix_components[reagent] * count * mix_overage
+                pipette.transfer(source=below_meniscus(pipette, reagent_map[source], volume),
+                                 dest=mix_well,
+                                 volume=volume,
+                                 new_tip='always'
+                                 )
+        #the premix holds glycerol from the enzymes
+        flow_profile(pipette, 'viscous')
+        step('mix master mix')
+        pipette.pick_up_tip()
+        pipette.mix(5, pipette.max_volume, mix_well)
+        pipette.drop_tip()
+
+        #multi-dispense the premix, the pipette is filled to capacity on each aspiration
+        distribute_steps(pipette,
+                         source=mix_well,
+                         dest=list(product_map.values()),
+                         volume=mix_vol_per_well,
+                         names=[f'{construct} master mix' for construct in product_map]
+                         )
 
     #load reagents into each appropriate wells
-    for construct in constructs:
-        product_well = product_map[construct]
-        for reagent in constructs[construct]:
-            reagent_well = reagent_map[reagent]
-            pipette.transfer(source=reagent_well,
-                             dest=product_well,
+    phase('reagents')
+    if group_parts:
+        #multi-dispense each reagent into every construct using it. The tip dips into wells that may already
+        #hold other DNA, so every aspiration takes a fresh one instead of carrying that back into the stock
+        for reagent, construct_ids in part_schedule:
+            flow_profile(pipette, 'viscous' if reagent in viscous_reagents else 'aqueous')
+            distribute_steps(pipette,
+                             source=reagent_map[reagent],
+                             dest=[product_map[construct] for construct in construct_ids],
                              volume=reagents[reagent],
+                             names=[f'{construct} {reagent}' for construct in construct_ids],
                              new_tip='always',
-                             touch_tip=True,
-                             mix_after=(2,3)
+                             touch_tip=True
                              )
+        #nothing was mixed on the way in, so mix each well once everything is loaded
+        phase('mixing')
+        for product, product_well in product_map.items():
+            step(f'mix {product}')
+            pipette.pick_up_tip()
+            pipette.mix(2, mix_volume, product_well)
+            pipette.drop_tip()
+    else:
+        for construct in constructs:
+            product_well = product_map[construct]
+            construct_reagents = constructs[construct] if master_mix else [*shared_reagents, *constructs[construct]]
+            for reagent in construct_reagents:
+                step(f'{construct} {reagent}')
+                flow_profile(pipette, 'viscous' if reagent in viscous_reagents else 'aqueous')
+                reagent_well = below_meniscus(pipette, reagent_map[reagent], reagents[reagent])
+                pipette.transfer(source=reagent_well,
+                                 dest=product_well,
+                                 volume=reagents[reagent],
+                                 new_tip='always',
+                                 touch_tip=True,
+                                 mix_after=(2, mix_volume)
+                                 )
+    step()
 
     protocol.comment("""Loading complete.
                         Thermocycle product plate according to protocol schedule,
                         then transform to confirm assembly.
                         Construct platemap is as follows:""")
     for product in product_map:
-        protocol.comment(f'    CONSTRUCT | {product} -> {product_map[product]}')
\ No newline at end of file
+        protocol.comment(f'    CONSTRUCT | {product} -> {product_map[product]}')
+
+    save_profile('GOLDEN_GATE_MOCLO')
@@ -1,9 +1,38 @@
 import logging
 import argparse
-import datetime
 import os
+import sys
+import ast
+import json
+import collections
 
-def read_args(explicit_args):
+#the shared helpers live one level up, next to the protocol folders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import scheduling
+from common.deck_planner import DeckPlan
+from common import sharding
+from common import inputs
+from common import combinatorial
+from common import ordering
+from common.output import unique_stamp, write_files
+from common.cache import ProtocolCache
+from common.templating import load_template, rename_keys
+from common import estimator
+from common import validation
+from common import state
+from common import checkpoints
+from common.labware import get_labware
+
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_NAME = 'golden_gate_moclo'
+TIPRACKS = {
+            'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
+            ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
+            ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
+           }
+
+
+def read_args(explicit_args, argv=None):
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--constructs', '-c'
@@ -11,66 +40,324 @@ def read_args(explicit_args):
                         ,default='{}'
                         ,help='Construct data in JSON following the schema {construct_uuid:[insert_uuid, ...]}'
                         )
+    parser.add_argument('--constructs_file', '--constructs-file', '-cf'
+                        ,dest='constructs_file'
+                        ,default=None
+                        ,help='CSV or JSONL file with one construct per row, or - for stdin. Use instead of --constructs for large libraries.'
+                        )
+    parser.add_argument('--design_file', '-df'
+                        ,dest='design_file'
+                        ,default=None
+                        ,help='JSON combinatorial library design (alternatives per slot, optional sampling and exclusions). See common/combinatorial.py.'
+                        )
     parser.add_argument('--product_plate', '-pr'
                         ,dest='%%PRODUCT PLATE%%'
                         ,default='nest_96_wellplate_100ul_pcr_full_skirt'
-                        ,help='Name of labware to use to hold the liquid culture. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the liquid culture. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
                         )
     parser.add_argument('--reagent_plate', '-reg'
                         ,dest='%%REAGENT PLATE%%'
                         ,default='corning_96_wellplate_360ul_flat'
-                        ,help='Name of labware to use to hold the glycerol source. Use Opentrons standard names.'
+                        ,help='Name of labware to use to hold the glycerol source. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
+                        )
+    parser.add_argument('--reaction_volume', '-rv'
+                        ,dest='%%REACTION VOLUME%%'
+                        ,default=str(scheduling.REACTION_VOLUME)
+                        ,help='Final volume of each reaction in ul, every reagent is scaled to it. 5ul reactions fit 384 well plates, e.g. --product_plate biorad_384_wellplate_50ul, with --allow_below_minimum'
+                        )
+    parser.add_argument('--allow_below_minimum'
+                        ,dest='allow_below_minimum'
+                        ,action='store_true'
+                        ,help='Pipette the reagents of reactions smaller than 10ul even when they drop below the minimum of every pipette, with poor accuracy, instead of rejecting the job. The 0.5ul volumes of a 10ul reaction or larger are always pipetted, with a warning.'
+                        )
+    parser.add_argument('--master_mix', '-mm'
+                        ,dest='%%MASTER MIX%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Premix ligase, buffer and enzyme once and distribute the premix to every construct.'
+                        )
+    parser.add_argument('--mix_water', '-mw'
+                        ,dest='%%MIX WATER%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='In master mix mode, also add the water shared by every construct to the premix.'
+                        )
+    parser.add_argument('--mix_reservoir', '-mr'
+                        ,dest='%%MIX RESERVOIR%%'
+                        ,default='nest_12_reservoir_15ml'
+                        ,help='Name of labware to build the master mix in. Use Opentrons standard names. Its dimensions have to be listed in common/labware.py, since its wells and volumes are planned ahead.'
+                        )
+    parser.add_argument('--group_parts', '-gp'
+                        ,dest='%%GROUP PARTS%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Multi-dispense each part into all of its constructs, with a fresh tip for every aspiration, then mix every well at the end.'
                         )
     parser.add_argument('--pipette', '-pi'
                         ,dest='%%PIPETTE%%'
                         ,default='p20_single_gen2'
-                        ,help='Specify the pipette type. Use Opentrons standard names.'
+                        ,help='Specify the pipette type. Use Opentrons standard names listed in common/labware.py.'
                         )
     parser.add_argument('--tiprack', '-tr'
                         ,dest='%%TIPRACK%%'
                         ,default= None
                         ,help='Specify the tiprack type. Use Opentrons standard names. An option is inferred if nothing is provided.'
                         )
+    parser.add_argument('--track_liquid'
+                        ,dest='%%LIQUID TRACKING%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Aspirate reagents from just below their surface, following the volume planned for each well, and tune flow rates for watery and glycerol based reagents. Load exactly the volumes the protocol lists.'
+                        )
+    parser.add_argument('--profile'
+                        ,dest='%%PROFILE%%'
+                        ,action='store_const'
+                        ,const='True'
+                        ,default='False'
+                        ,help='Time every pipette step and phase on the robot, saved as CSV and JSON next to the platemap. Aggregate them with `python -m common.profiles`.'
+                        )
+    parser.add_argument('--estimate'
+                        ,dest='estimate'
+                        ,action='store_true'
+                        ,help='Simulate every run to estimate robot time, tips and the volume to load in each source, saved as JSON next to the platemap. Takes a while on very large jobs.'
+                        )
+    parser.add_argument('--no_cache'
+                        ,dest='no_cache'
+                        ,action='store_true'
+                        ,help='Always render a new protocol instead of reusing an identical one from the cache.'
+                        )
+    parser.add_argument('--cache_dir'
+                        ,dest='cache_dir'
+                        ,default=None
+                        ,help='Folder to cache filled protocols in. Defaults to protocol_cache/ in the output folder.'
+                        )
+    parser.add_argument('--state_file'
+                        ,dest='state_file'
+                        ,default=None
+                        ,help='JSON file of the tips and reagent plate left on the deck, read and updated so back-to-back jobs use them up. See common/state.py.'
+                        )
+    parser.add_argument('--no_checkpoint'
+                        ,dest='%%CHECKPOINT%%'
+                        ,action='store_const'
+                        ,const='False'
+                        ,default='True'
+                        ,help='Do not log each finished step on the robot. Without the log an interrupted run can only be started over.'
+                        )
+    parser.add_argument('--resume_from', '--resume-from'
+                        ,dest='resume_from'
+                        ,default=None
+                        ,help='Checkpoint log of an interrupted run, copied off the robot. Give the options of the interrupted job and only the runs it has left are filled, skipping the steps already done. See common/checkpoints.py.'
+                        )
 
-    args = vars(parser.parse_args())
-    if explicit_args: args |= explicit_args
+    args = vars(parser.parse_args(argv))
+    if explicit_args: args |= rename_keys(explicit_args)
 
+    #Check every volume before planning anything, the robot is the most expensive place to find out
+    args['reaction_volume'] = float(args['%%REACTION VOLUME%%'])
+    if args['reaction_volume'] <= 0:
+        raise validation.VolumeError(f'Reaction volume has to be positive, not {args["reaction_volume"]}ul')
+    part_volume, shared = scheduling.scaled_volumes(args['reaction_volume'])
+    args['%%PART VOLUME%%'], args['%%SHARED REAGENTS%%'] = repr(part_volume), repr(shared)
+    #premixed shared reagents reach the products all at once
+    shared_volumes = [sum(shared.values())] if args['%%MASTER MIX%%'] == 'True' else list(shared.values())
+    #the 0.5ul volumes of a 10ul reaction were always pipetted with a warning, smaller reactions have to be allowed
+    pipette = validation.choose_pipette(args['%%PIPETTE%%'], [part_volume, *shared_volumes], TIPRACKS, f'reagents of a {args["reaction_volume"]:g}ul reaction',
+                                        args['allow_below_minimum'] or args['reaction_volume'] >= scheduling.REACTION_VOLUME)
+    if pipette != args['%%PIPETTE%%']:
+        args['%%PIPETTE%%'], args['%%TIPRACK%%'] = pipette, None
     if not args['%%TIPRACK%%']:
-        args['%%TIPRACK%%'] = {
-                               'p1000_single_gen2':'opentrons_96_tiprack_1000ul'
-                               ,'p300_single_gen2':'opentrons_96_tiprack_300ul'
-                               ,'p20_single_gen2':'opentrons_96_tiprack_20ul'
-                              }[args['%%PIPETTE%%']]
+        args['%%TIPRACK%%'] = TIPRACKS[args['%%PIPETTE%%']]
         logging.info(f'Inferring tiprack as `{args["%%TIPRACK%%"]}` based on pipette')
+    validation.check_tiprack(args['%%PIPETTE%%'], args['%%TIPRACK%%'])
+    validation.check_wells(args['%%PRODUCT PLATE%%'], args['reaction_volume'], 'products')
+
+    #Start with what earlier jobs left on the deck
+    args['deck_state'] = state.read_state(args['state_file'])
+    #a resumed job is filled again from the state it started from
+    args['resume'] = checkpoints.read_checkpoint(args['resume_from'], TEMPLATE_NAME) if args['resume_from'] else None
+    if args['resume']:
+        args['deck_state'] = state.resumed(args['deck_state'])
+    args['first_tips'] = state.starting_tips(args['deck_state'], {'tipracks': (args['%%TIPRACK%%'], args['%%PIPETTE%%'])})
+    args['kept_reagents'] = state.kept_wells(args['deck_state'], args['%%REAGENT PLATE%%'])
+
+    args['design'] = None
+    if args['design_file']:
+        #constructs are only expanded from the design as runs are filled
+        args['design'] = combinatorial.read_design(args['design_file'])
+        args['constructs'] = dict()
+        logging.info(f'Design has a library of {combinatorial.library_size(args["design"])} constructs')
+        return args
+    if args['constructs_file']:
+        args['constructs'] = inputs.read_constructs(args['constructs_file'])
+    else:
+        args['constructs'] = ast.literal_eval(args['%%CONSTRUCT DATA%%'])
+    if not args['constructs']:
+        raise ValueError("No construct data was provided. use `python protocol_preprocessor.py --help` for more info")
 
-    if not args['%%CONSTRUCT DATA%%']:
-        raise(AttributeError, "No construct data was provided. use `python protocol_preprocessor.py --help` for more info")
+    logging.info(scheduling.schedule_report(args['constructs'], args['%%PIPETTE%%'], args['%%MASTER MIX%%'] == 'True', args['reaction_volume']))
 
     return args
 
 
-def make_procedure(option_args = None): 
-    params = read_args(option_args)
-    APP_DIR = os.getcwd()
-    TEMPLATE_NAME = 'golden_gate_moclo'
+def water_per_well(args, constructs):
+    """Constructs topped up from each water well, so small reagent wells (384 well plates) don't limit the run size"""
+    spec = get_labware(args['%%REAGENT PLATE%%'])
+    return scheduling.water_per_well(constructs, spec['max_volume'] - spec['dead_volume'], args['%%MASTER MIX%%'] == 'True',
+                                     args['%%MIX WATER%%'] == 'True', args['%%PIPETTE%%'], args['reaction_volume'])
+
+
+def plan_deck(args):
+    constructs = args['constructs']
+    master_mix = args['%%MASTER MIX%%'] == 'True'
+    per_well = water_per_well(args, constructs)
+    plan = DeckPlan()
+    plan.add_tipracks('tipracks', args['%%TIPRACK%%'], scheduling.count_tips(constructs,
+                                                                            master_mix,
+                                                                            args['%%MIX WATER%%'] == 'True',
+                                                                            args['%%GROUP PARTS%%'] == 'True',
+                                                                            scheduling.water_split(constructs, per_well),
+                                                                            args['%%PIPETTE%%'],
+                                                                            args['reaction_volume']),
+                       args['first_tips'].get('tipracks', 0))
+    plan.add_wells('reagents', args['%%REAGENT PLATE%%'], scheduling.reagent_list(constructs, per_well), args['kept_reagents'])
+    plan.add_wells('products', args['%%PRODUCT PLATE%%'], constructs)
+    plan.add_labware('mix_reservoir', args['%%MIX RESERVOIR%%'], 1 if master_mix else 0)
+
+    #Constructs with too many parts leave no room for water, no run size fixes that
+    overfull = {construct: water for construct, water in scheduling.water_volumes(constructs, args['reaction_volume']).items() if water < 0}
+    if overfull:
+        raise validation.VolumeError(f'Constructs {list(overfull)[:5]} have too many parts for a {args["reaction_volume"]:g}ul reaction '
+                                     f'(over by {-min(overfull.values())}ul)')
+    #Reagent wells that would run dry make for smaller runs instead
+    needs, mix = scheduling.reagent_volumes(constructs, master_mix, args['%%MIX WATER%%'] == 'True', args['%%PIPETTE%%'], args['%%GROUP PARTS%%'] == 'True',
+                                            args['reaction_volume'], per_well)
+    validation.check_sources(args['%%REAGENT PLATE%%'], needs, 'Reagent')
+    if master_mix:
+        validation.check_sources(args['%%MIX RESERVOIR%%'], {'master mix': mix}, 'The')
+    return plan
+
+
+def shard_args(args, constructs):
+    return {**args, 'constructs': dict(constructs)}
+
+
+def render_procedure(params):
+    """Fills the template for every run, returning the protocols and platemap as a dict of file name to content"""
+    #Get procedure template, compiled once per change to the file
+    template = load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py'))
+
+    #Split the constructs into as many runs as it takes to fit them on the deck.
+    #Each run only needs the parts its own constructs use
+    if params['design']:
+        constructs = combinatorial.expand(params['design'])
+    else:
+        constructs = params['constructs'].items()
+    runs = sharding.make_runs(params, constructs, shard_args, plan_deck)
+    checkpoints.check_run(params['resume'], len(runs))
+    if len(runs) > 1:
+        logging.info(f'Constructs do not fit on one deck, splitting them into {len(runs)} runs')
+
+    now = unique_stamp()
+    files = dict()
+    platemap = list()
+    part_usage = collections.Counter()
+    for run, (run_params, plan) in enumerate(runs, 1):
+        if run > 1 and params['deck_state'] is not None:
+            #back-to-back runs go on with the tipracks and reagent plate the run before left
+            run_params, plan = state.carry_over(run_params, plan_deck, state.carried(*runs[run - 2], reagents=True))
+            runs[run - 1] = (run_params, plan)
+        master_mix = run_params['%%MASTER MIX%%'] == 'True'
+        group_parts = run_params['%%GROUP PARTS%%'] == 'True'
+        constructs = run_params['constructs']
+        per_well = water_per_well(run_params, constructs)
+        part_usage.update(part for parts in constructs.values() for part in parts)
+
+        #Put the most used reagents next to the products and chain the transfers to keep the head close to its work
+        travel_before = ordering.group_travel(scheduling.transfer_groups(constructs, master_mix, group_parts),
+                                              ordering.positions(plan, 'reagents'), ordering.positions(plan, 'products'))
+        constructs = {construct: constructs[construct] for construct in ordering.serpentine(plan, 'products')}
+        ordering.arrange_by_use(plan, 'reagents', scheduling.reagents_by_use(constructs, per_well), towards='products', kept=run_params['kept_reagents'])
+        schedule = ordering.order_groups(scheduling.part_schedule(constructs, master_mix),
+                                         ordering.positions(plan, 'reagents'), ordering.positions(plan, 'products'))
+        travel_after = ordering.group_travel(schedule if group_parts else scheduling.transfer_groups(constructs, master_mix),
+                                             ordering.positions(plan, 'reagents'), ordering.positions(plan, 'products'))
+        logging.info(f'Run {run}: estimated head travel for reagent loading {travel_before / 1000:.1f}m, {travel_after / 1000:.1f}m after reordering')
+
+        #Reagent wells start with what the run draws from them, for tracking their liquid level.
+        #Water wells top up the products in the order the template walks them
+        needs, _ = scheduling.reagent_volumes({construct: constructs[construct] for construct in plan.wells['products']}, master_mix,
+                                              run_params['%%MIX WATER%%'] == 'True', run_params['%%PIPETTE%%'], group_parts,
+                                              run_params['reaction_volume'], per_well)
+        run_params['%%LIQUID VOLUMES%%'] = repr({'reagents': plan.load_volumes('reagents', needs)})
+
+        run_params['constructs'] = constructs
+        run_params['%%CONSTRUCT DATA%%'] = repr(constructs)
+        run_params['%%PART SCHEDULE%%'] = repr(schedule)
+        run_params['%%WATER PER WELL%%'] = str(per_well)
+        run_params['%%STARTING TIP%%'] = str(plan.tips['tipracks'][0])
+        run_params['%%KEPT REAGENTS%%'] = repr([reagent for reagent in plan.wells['reagents'] if reagent in run_params['kept_reagents']])
+        run_params['%%DECK PLAN%%'] = repr(plan.layout())
+
+        #Every run logs its steps under its own name, only the interrupted run of a resumed job skips any
+        run_suffix = f'_RUN{run}' if len(runs) > 1 else ''
+        run_params['%%RUN NAME%%'] = f'{TEMPLATE_NAME}_FILLED{now}{run_suffix}'
+        run_params['%%RESUME%%'] = checkpoints.resume_params(params['resume'], run)
+
+        #Replace placeholders with values, leaving out the runs a resumed job already did
+        if not checkpoints.skipped(params['resume'], run):
+            files[f'{run_params["%%RUN NAME%%"]}.py'] = template.render(run_params)
+
+        for construct, (slot, well) in sharding.planned_locations(plan, 'products').items():
+            platemap.append([run, construct, slot, well, ' '.join(constructs[construct])])
+
+    #One platemap covers every run
+    files[f'{TEMPLATE_NAME}_PLATEMAP{now}.csv'] = sharding.platemap_csv(['Run', 'Construct', 'Product Slot', 'Product Well', 'Parts'], platemap)
+
+    #The tips and reagent plate the last run leaves, for the next job
+    if params['deck_state'] is not None and not params['resume']:
+        files[f'{TEMPLATE_NAME}_STATE{now}.json'] = json.dumps(state.leftover(params['deck_state'], *runs[-1], reagents=True), indent=2)
+
+    #Simulate every run to estimate robot time, tips and the volume to load in each source, when asked for
+    if params['estimate']:
+        estimate = estimator.estimate({name: content for name, content in files.items() if name.endswith('.py')}, [plan for run, (_, plan) in enumerate(runs, 1) if not checkpoints.skipped(params['resume'], run)], {'reagents': str})
+        files[f'{TEMPLATE_NAME}_ESTIMATE{now}.json'] = json.dumps(estimate, indent=2)
+        logging.info(estimator.summary(estimate))
+
+    #Designs also get the constructs each run was given and how often every part is used
+    if params['design']:
+        files[f'{TEMPLATE_NAME}_CONSTRUCTS{now}.json'] = json.dumps({
+            'runs': [run_params['constructs'] for run_params, _ in runs],
+            'part_usage': dict(part_usage.most_common()),
+        })
+
+    return files
 
-    #Get procedure template
-    with open(os.path.join(APP_DIR, f'{TEMPLATE_NAME}.py')) as template_file:
-        protocol = template_file.read()
 
-    #Replace placeholders with values
-    for placeholder in params:
-        protocol = protocol.replace(placeholder, params[placeholder])
+def make_procedure(option_args = None, argv = None, output_dir = None): 
+    params = read_args(option_args, argv)
+    APP_DIR = output_dir or os.getcwd()
 
-    #Save finalized version of of the file
-    now = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    unique_file_name = f'{TEMPLATE_NAME}_FILLED{now}.py'
-    with open(os.path.join(APP_DIR,unique_file_name),'w') as output_file:
-        output_file.write(protocol)
+    #Identical requests are served from the cache instead of being rendered again
+    cache = None if params['no_cache'] else ProtocolCache(params['cache_dir'] or os.path.join(APP_DIR, 'protocol_cache'))
+    files = None
+    if cache:
+        cache_key = cache.key(load_template(os.path.join(TEMPLATE_DIR, f'{TEMPLATE_NAME}.py')).source, params)
+        files = cache.get(cache_key)
+    if files is None:
+        files = render_procedure(params)
+        if cache:
+            cache.put(cache_key, files)
 
-    return os.path.join(APP_DIR,'procedures',unique_file_name)
+    #Save finalized version of the files, the cache only keeps a copy
+    output_files = write_files(APP_DIR, files)
+    state.record(params, files)
+    return [path for path in output_files if path.endswith('.py')]
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
-    output_file = make_procedure()
-    logging.info(f'Success - file is {output_file}')
\ No newline at end of file
+    output_files = make_procedure()
+    logging.info(f'Success - files are {output_files}')
\ No newline at end of file
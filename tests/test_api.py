@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+from common import api
+
+
+def test_generate_returns_the_protocol_and_platemap():
+    out, platemap_out = io.StringIO(), io.StringIO()
+    result = api.generate('glycerol_stock', {'num_samples': 8, 'repeats': 1}, out, platemap_out)
+    [protocol] = result['protocols'].values()
+    assert out.getvalue() == protocol
+    assert platemap_out.getvalue() == result['platemap']
+    assert result['estimate'] is None
+
+
+def test_invalid_options_raise():
+    with pytest.raises(ValueError, match='Invalid options'):
+        api.render('glycerol_stock', {'no_such_option': 1})
+
+
+def test_the_deck_state_is_saved_for_the_next_job(tmp_path):
+    state_file = str(tmp_path / 'deck_state.json')
+    api.generate('glycerol_stock', {'num_samples': 8, 'repeats': 1, 'state_file': state_file})
+    with open(state_file) as saved:
+        tipracks = json.load(saved)['tipracks']
+    assert tipracks
+    api.generate('glycerol_stock', {'num_samples': 8, 'repeats': 1, 'state_file': state_file})
+    with open(state_file) as saved:
+        assert json.load(saved)['tipracks'] != tipracks
+
+
+def test_save_writes_to_the_directory(tmp_path):
+    [path] = api.save('glycerol_stock', {'num_samples': 8, 'repeats': 1}, str(tmp_path))
+    assert path.startswith(str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
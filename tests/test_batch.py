@@ -0,0 +1,24 @@
+import os
+
+from common.batch import read_manifest, run_batch
+
+
+def test_manifests_are_read_from_jsonl_and_csv(tmp_path):
+    jsonl = tmp_path / 'jobs.jsonl'
+    jsonl.write_text('{"protocol": "glycerol_stock", "options": {"num_samples": 24, "repeats": 2}}\n\n')
+    assert read_manifest(str(jsonl)) == [{'protocol': 'glycerol_stock', 'options': {'num_samples': 24, 'repeats': 2}}]
+    csv = tmp_path / 'jobs.csv'
+    csv.write_text('protocol,num_samples,repeats,num_vectors\nglycerol_stock,24,2,\ncell_transform,,,12\n')
+    assert read_manifest(str(csv)) == [{'protocol': 'glycerol_stock', 'options': {'num_samples': '24', 'repeats': '2', 'num_vectors': ''}},
+                                       {'protocol': 'cell_transform', 'options': {'num_samples': '', 'repeats': '', 'num_vectors': '12'}}]
+
+
+def test_a_failing_job_does_not_stop_the_batch(tmp_path):
+    jobs = [{'protocol': 'glycerol_stock', 'options': {'num_samples': 8, 'repeats': 1}},
+            {'protocol': 'glycerol_stock', 'options': {'no_such_option': 1}},
+            {'protocol': 'golden_gate_moclo', 'options': {}}]
+    results = run_batch(jobs, str(tmp_path), workers=1)
+    assert [result['job'] for result in results] == [1, 2, 3]
+    assert results[0]['error'] is None and all(os.path.exists(path) for path in results[0]['files'])
+    assert results[1]['error'].startswith('Invalid options')
+    assert results[2]['error'].startswith('ValueError')
@@ -0,0 +1,69 @@
+import os
+
+from common.cache import ProtocolCache, code_version, normalize
+from common.protocols import load_preprocessor, to_argv
+
+
+def test_equivalent_parameters_share_a_key(tmp_path):
+    cache = ProtocolCache(str(tmp_path))
+    assert cache.key('template', {'a': "{'x': 1}", 'b': 2}) == cache.key('template', {'b': 2, 'a': '{"x": 1}'})
+
+
+def test_output_options_and_input_file_names_are_ignored(tmp_path):
+    cache = ProtocolCache(str(tmp_path))
+    assert cache.key('template', {'a': 1, 'no_cache': True, 'constructs_file': 'x.csv'}) == cache.key('template', {'a': 1})
+
+
+def test_the_template_and_parameters_change_the_key(tmp_path):
+    cache = ProtocolCache(str(tmp_path))
+    key = cache.key('template', {'a': 1})
+    assert cache.key('other template', {'a': 1}) != key
+    assert cache.key('template', {'a': 2}) != key
+
+
+def test_the_key_depends_on_the_code_version(tmp_path, monkeypatch):
+    cache = ProtocolCache(str(tmp_path))
+    key = cache.key('template', {'a': 1})
+    monkeypatch.setattr('common.cache.code_version', lambda: 'changed')
+    assert cache.key('template', {'a': 1}) != key
+
+
+def test_code_version_is_stable():
+    assert code_version() == code_version()
+    assert len(code_version()) == 64
+
+
+def test_normalize_parses_literals():
+    assert normalize("{'a': (1, 2)}") == {'a': [1, 2]}
+    assert normalize('not a literal') == 'not a literal'
+
+
+def test_stored_files_come_back(tmp_path):
+    cache = ProtocolCache(str(tmp_path))
+    key = cache.key('template', {'a': 1})
+    assert cache.get(key) is None
+    cache.put(key, {'protocol_RUN10.py': 'ten', 'protocol_RUN9.py': 'nine'})
+    assert list(cache.get(key).items()) == [('protocol_RUN9.py', 'nine'), ('protocol_RUN10.py', 'ten')]
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_old_entries_are_evicted(tmp_path):
+    cache = ProtocolCache(str(tmp_path), max_entries=1)
+    cache.put('first', {'protocol.py': 'first'})
+    os.utime(tmp_path / 'first', (0, 0))
+    cache.put('second', {'protocol.py': 'second'})
+    assert cache.get('first') is None
+    assert cache.get('second') == {'protocol.py': 'second'}
+
+
+def test_protocols_are_written_to_the_output_folder_even_when_cached(tmp_path):
+    preprocessor = load_preprocessor('glycerol_stock')
+    argv = to_argv({'num_samples': 8, 'repeats': 1, 'cache_dir': str(tmp_path / 'cache')})
+    for output_dir in ['first', 'second']:
+        os.makedirs(tmp_path / output_dir)
+        [path] = preprocessor.make_procedure(argv=argv, output_dir=str(tmp_path / output_dir))
+        assert os.path.dirname(path) == str(tmp_path / output_dir)
+    #evicting every cached copy leaves the protocols that were handed out alone
+    ProtocolCache(str(tmp_path / 'cache'), max_entries=0).evict()
+    assert os.path.exists(path)
+    assert sorted(os.listdir(tmp_path / 'first')) == sorted(os.listdir(tmp_path / 'second'))
@@ -0,0 +1,19 @@
+import ast
+import re
+
+from common import simulation
+from common.labware import get_labware
+from common.protocols import load_preprocessor, to_argv
+
+
+def test_untracked_soc_wells_are_loaded_with_their_dead_volume():
+    preprocessor = load_preprocessor('cell_transform')
+    params = preprocessor.read_args(None, to_argv({'num_vectors': 96, 'large_pipette': 'p300_multi_gen2', 'no_cache': True}))
+    [protocol] = [content for name, content in preprocessor.render_procedure(params).items() if name.endswith('.py')]
+    load_volumes = ast.literal_eval(re.search(r'soc_load_volumes = (\{.*?\})', protocol).group(1))
+    slots = ast.literal_eval(re.search(r'deck_plan = (\{.*\})', protocol).group(1))['slots']
+    drawn = simulation.simulate(protocol)['drawn']
+    dead_volume = get_labware('nest_12_reservoir_15ml')['dead_volume']
+    assert len(load_volumes) == 2
+    for well, volume in load_volumes.items():
+        assert volume >= drawn[(slots['soc'][0], well)] + dead_volume
@@ -0,0 +1,107 @@
+import contextlib
+import glob
+import json
+import os
+import types
+
+import pytest
+
+from common import simulation
+from common.checkpoints import check_run, read_checkpoint, resume_params, skipped
+from common.protocols import load_preprocessor, to_argv
+
+
+def write_log(path, lines):
+    path.write_text(''.join(json.dumps(line) + '\n' for line in lines))
+    return str(path)
+
+
+def test_the_last_finished_step_is_read(tmp_path):
+    log = write_log(tmp_path / 'golden_gate_moclo_FILLED20260101-120000_RUN2_CHECKPOINT_20260102-090000.jsonl', [
+        {'step': 0, 'name': 'start', 'tips': {}},
+        {'step': 1, 'name': 'c1 water', 'tips': {'left': 1}},
+        {'step': 2, 'name': 'c2 water', 'tips': {'left': 2}},
+    ])
+    assert read_checkpoint(log, 'golden_gate_moclo') == {'run': 2, 'step': 2, 'tips': {'left': 2}}
+
+
+def test_a_job_that_was_not_split_is_run_one(tmp_path):
+    log = write_log(tmp_path / 'glycerol_stock_FILLED20260101-120000_CHECKPOINT_20260102-090000.jsonl', [
+        {'step': 3, 'name': 'start', 'tips': {'right': 3}},
+    ])
+    assert read_checkpoint(log, 'glycerol_stock') == {'run': 1, 'step': 3, 'tips': {'right': 3}}
+
+
+def test_an_empty_log_starts_from_the_beginning(tmp_path):
+    log = tmp_path / 'cell_transform_FILLED20260101-120000_CHECKPOINT_20260102-090000.jsonl'
+    log.write_text('')
+    assert read_checkpoint(str(log), 'cell_transform') == {'run': 1, 'step': 0, 'tips': {}}
+
+
+def test_logs_of_other_protocols_are_rejected(tmp_path):
+    log = write_log(tmp_path / 'glycerol_stock_FILLED20260101-120000_CHECKPOINT_20260102-090000.jsonl', [])
+    with pytest.raises(ValueError):
+        read_checkpoint(log, 'cell_transform')
+    with pytest.raises(ValueError):
+        read_checkpoint(write_log(tmp_path / 'glycerol_stock_FILLED20260101-120000.jsonl', []), 'glycerol_stock')
+
+
+def test_only_the_interrupted_run_resumes():
+    resume = {'run': 2, 'step': 41, 'tips': {'left': 44}}
+    assert resume_params(resume, 1) == 'None'
+    assert eval(resume_params(resume, 2)) == {'step': 41, 'tips': {'left': 44}}
+    assert resume_params(None, 1) == 'None'
+    assert skipped(resume, 1) and not skipped(resume, 2) and not skipped(None, 1)
+
+
+def test_checkpoints_from_a_bigger_job_are_rejected():
+    check_run({'run': 2}, 2)
+    with pytest.raises(ValueError):
+        check_run({'run': 3}, 2)
+
+
+PICK_UP_TIP = simulation.SimulatedPipette.pick_up_tip
+ASPIRATE = simulation.SimulatedPipette.aspirate
+
+
+class Stop(Exception):
+    pass
+
+
+def run_on_robot(monkeypatch, directory, source, stop_after_tips=None):
+    """
+    Runs a filled protocol in the simulator as if on the robot, so it logs its steps into `directory`.
+    Returns the (mount, tip) of every tip picked up. With `stop_after_tips` the run stops once it has
+    that many tips, at its next aspirate, which is partway through a step
+    """
+    taken = list()
+    def counted_pick_up_tip(self, location=None):
+        PICK_UP_TIP(self, location)
+        taken.append((self.mount, self.next_tip - self.channels))
+    def stopping_aspirate(self, *args, **kwargs):
+        if stop_after_tips is not None and len(taken) >= stop_after_tips:
+            raise Stop()
+        return ASPIRATE(self, *args, **kwargs)
+    monkeypatch.setattr(simulation.SimulatedPipette, 'pick_up_tip', counted_pick_up_tip)
+    monkeypatch.setattr(simulation.SimulatedPipette, 'aspirate', stopping_aspirate)
+    monkeypatch.setattr(simulation.SimulatedContext, 'is_simulating', lambda self: False)
+    monkeypatch.setattr(simulation, 'tempfile', types.SimpleNamespace(TemporaryDirectory=lambda: contextlib.nullcontext(directory)))
+    with contextlib.suppress(Stop):
+        simulation.simulate(source)
+    return taken
+
+
+def test_a_run_stopped_partway_through_a_step_resumes_with_fresh_tips(tmp_path, monkeypatch):
+    preprocessor = load_preprocessor('glycerol_stock')
+    options = {'num_samples': 8, 'repeats': 1, 'no_cache': True}
+    [source] = [content for name, content in preprocessor.render_procedure(preprocessor.read_args(None, to_argv(options))).items()
+                if name.endswith('.py')]
+    interrupted = run_on_robot(monkeypatch, str(tmp_path), source, stop_after_tips=3)
+    assert len(interrupted) == 3
+
+    [log] = glob.glob(os.path.join(tmp_path, '*_CHECKPOINT_*.jsonl'))
+    params = preprocessor.read_args(None, to_argv({**options, 'resume_from': log}))
+    [resumed] = [content for name, content in preprocessor.render_procedure(params).items() if name.endswith('.py')]
+    rest = run_on_robot(monkeypatch, str(tmp_path), resumed)
+    assert rest
+    assert not set(interrupted) & set(rest)
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from common.combinatorial import DesignError, expand, library_size, read_design
+
+DESIGN = {'slots': [['pJ1', 'pJ2'], ['RBS1', 'RBS2'], ['fuGFP']], 'backbone': ['pOpen']}
+
+
+def test_the_whole_library_in_product_order():
+    assert library_size(DESIGN) == 4
+    assert list(expand(DESIGN)) == [('construct0', ['pJ1', 'RBS1', 'fuGFP', 'pOpen']),
+                                    ('construct1', ['pJ1', 'RBS2', 'fuGFP', 'pOpen']),
+                                    ('construct2', ['pJ2', 'RBS1', 'fuGFP', 'pOpen']),
+                                    ('construct3', ['pJ2', 'RBS2', 'fuGFP', 'pOpen'])]
+
+
+def test_excluded_combinations_are_skipped():
+    design = {**DESIGN, 'exclude': [['pJ2', 'RBS1']], 'prefix': 'lib'}
+    assert [name for name, _ in expand(design)] == ['lib0', 'lib1', 'lib3']
+
+
+def test_samples_are_reproducible_and_distinct():
+    design = {'slots': [[f'p{number}' for number in range(10)], [f'r{number}' for number in range(10)]], 'sample': 5, 'seed': 3}
+    sample = list(expand(design))
+    assert sample == list(expand(design))
+    assert len({name for name, _ in sample}) == 5
+
+
+def test_expansion_is_lazy():
+    huge = {'slots': [[str(number) for number in range(1000)]] * 6}
+    constructs = expand(huge)
+    assert next(constructs) == ('construct000000000000000000', ['0'] * 6)
+
+
+def test_designs_need_parts_for_every_slot(tmp_path):
+    path = tmp_path / 'design.json'
+    path.write_text(json.dumps({'slots': {'promoter': ['pJ1'], 'rbs': ['RBS1']}}))
+    assert read_design(str(path))['slots'] == [['pJ1'], ['RBS1']]
+    path.write_text(json.dumps({'slots': {'promoter': ['pJ1'], 'rbs': []}}))
+    with pytest.raises(DesignError):
+        read_design(str(path))
@@ -0,0 +1,89 @@
+import pytest
+
+from common.deck_planner import DeckCapacityError, DeckPlan
+from common.protocols import load_preprocessor, to_argv
+
+
+def test_slots_are_claimed_top_down_in_request_order():
+    plan = DeckPlan()
+    plan.add_labware('reagents', 'nest_96_wellplate_100ul_pcr_full_skirt')
+    plan.add_tipracks('tips', 'opentrons_96_tiprack_20ul', 200)
+    assert plan.slots() == {'reagents': [11], 'tips': [10, 9, 8]}
+
+
+def test_tipracks_count_tips_used_by_an_earlier_job():
+    plan = DeckPlan()
+    plan.add_tipracks('tips', 'opentrons_96_tiprack_20ul', 90, first_tip=10)
+    assert plan.slots_needed() == 2
+    assert plan.tips_left() == {'tips': 4}
+
+
+def test_resized_tipracks_keep_their_place():
+    plan = DeckPlan()
+    plan.add_tipracks('tips', 'opentrons_96_tiprack_20ul', 1)
+    plan.add_labware('reagents', 'nest_96_wellplate_100ul_pcr_full_skirt')
+    plan.resize_tipracks('tips', 100)
+    assert plan.slots() == {'tips': [11, 10], 'reagents': [9]}
+
+
+def test_wells_fill_plates_column_wise_and_spill_onto_new_plates():
+    plan = DeckPlan()
+    plan.add_wells('products', 'nest_96_wellplate_100ul_pcr_full_skirt', range(98))
+    assert plan.wells['products'][0] == (0, 'A1')
+    assert plan.wells['products'][8] == (0, 'A2')
+    assert plan.wells['products'][97] == (1, 'B1')
+    assert plan.slots() == {'products': [11, 10]}
+
+
+def test_kept_items_stay_put_and_their_wells_are_skipped():
+    plan = DeckPlan()
+    plan.add_wells('vectors', 'nest_96_wellplate_100ul_pcr_full_skirt', ['a', 'b', 'c'], kept={'b': 'A1'})
+    assert plan.wells['vectors'] == {'a': (0, 'B1'), 'b': (0, 'A1'), 'c': (0, 'C1')}
+
+
+def test_column_wells_start_each_group_in_a_fresh_column():
+    plan = DeckPlan()
+    plan.add_column_wells('cells', 'nest_96_wellplate_100ul_pcr_full_skirt', [['a', 'b'], [None, 'c']])
+    assert plan.wells['cells'] == {'a': (0, 'A1'), 'b': (0, 'B1'), 'c': (0, 'B2')}
+    assert plan.columns['cells'] == [(0, 'A1', 2), (0, 'A2', 1)]
+
+
+def test_column_wells_reject_groups_taller_than_a_column():
+    plan = DeckPlan()
+    with pytest.raises(ValueError):
+        plan.add_column_wells('cells', 'nest_96_wellplate_100ul_pcr_full_skirt', [list(range(9))])
+
+
+def test_named_wells_must_exist():
+    plan = DeckPlan()
+    with pytest.raises(ValueError):
+        plan.add_named_wells('samples', 'nest_96_wellplate_100ul_pcr_full_skirt', {'a': 'I1'})
+
+
+def test_load_volumes_add_the_dead_volume():
+    plan = DeckPlan()
+    plan.add_wells('reagents', 'nest_96_wellplate_100ul_pcr_full_skirt', ['water', 'buffer'])
+    assert plan.load_volumes('reagents', {'water': 40}) == [(0, 'A1', 45)]
+
+
+def test_unknown_labware_only_takes_slots():
+    plan = DeckPlan()
+    plan.add_tipracks('tips', 'other_96_tiprack_20ul', 100)
+    assert plan.slots() == {'tips': [11, 10]}
+    with pytest.raises(KeyError, match='common/labware.py'):
+        plan.add_wells('reagents', 'no_such_plate', ['water'])
+
+
+def test_overfull_deck_raises_with_what_it_needs():
+    plan = DeckPlan(available_slots=[2, 1])
+    plan.add_labware('reagents', 'nest_96_wellplate_100ul_pcr_full_skirt', 3)
+    assert not plan.fits()
+    with pytest.raises(DeckCapacityError, match='needs 3 slots but only 2'):
+        plan.slots()
+
+
+def test_golden_gate_takes_tipracks_missing_from_the_labware_table():
+    preprocessor = load_preprocessor('golden_gate_moclo')
+    params = preprocessor.read_args(None, to_argv({'constructs': {'uuid351': ['fuGFP', 'RBS1']}, 'tiprack': 'other_96_tiprack_20ul'}))
+    [protocol] = [content for name, content in preprocessor.render_procedure(params).items() if name.endswith('.py')]
+    assert 'other_96_tiprack_20ul' in protocol
@@ -0,0 +1,32 @@
+import pytest
+
+from common import api, estimator
+from common.labware import get_labware
+
+
+@pytest.fixture(scope='module')
+def estimate():
+    return api.generate('glycerol_stock', {'num_samples': 96, 'repeats': 2, 'estimate': True})['estimate']
+
+
+def test_every_run_is_estimated(estimate):
+    assert len(estimate['runs']) == 2
+    assert all(run['seconds'] > 0 and run['tips'] for run in estimate['runs'])
+    assert estimate['total']['seconds'] == pytest.approx(sum(run['seconds'] for run in estimate['runs']), abs=0.2)
+    assert estimate['total']['tips'] == {'opentrons_96_tiprack_1000ul': sum(sum(run['tips'].values()) for run in estimate['runs'])}
+
+
+def test_sources_are_loaded_with_their_dead_volume(estimate):
+    reagents = estimate['runs'][0]['reagents']
+    assert reagents['SAMPLE 1'] == {'slot': reagents['SAMPLE 1']['slot'], 'well': 'A1', 'drawn_ul': 1000.0,
+                                    'load_ul': 1000.0 + get_labware('nest_96_wellplate_2ml_deep')['dead_volume']}
+    assert estimate['runs'][0]['labware']['cryo_tube_rack'] == 8
+
+
+def test_the_estimate_is_summed_up_in_one_line(estimate):
+    assert estimator.summary(estimate).startswith('Estimated ')
+    assert 'over 2 run(s)' in estimator.summary(estimate)
+
+
+def test_only_estimated_when_asked_for():
+    assert api.generate('glycerol_stock', {'num_samples': 8, 'repeats': 1})['estimate'] is None
@@ -0,0 +1,16 @@
+import re
+
+import pytest
+
+from common.protocols import load_preprocessor, to_argv
+
+
+def test_the_cryo_racks_a_multichannel_job_suggests_work():
+    preprocessor = load_preprocessor('glycerol_stock')
+    options = {'num_samples': 8, 'repeats': 1, 'pipette': 'p300_multi_gen2'}
+    with pytest.raises(ValueError, match='does not fit a 8 channel pipette') as error:
+        preprocessor.read_args(None, to_argv(options))
+    suggested = re.search(r'out of (.*), or add', str(error.value)).group(1).split(', ')
+    assert suggested
+    for cryo_rack in suggested:
+        assert preprocessor.read_args(None, to_argv({**options, 'cryo_rack': cryo_rack}))['%%MULTICHANNEL MODE%%'] == 'True'
@@ -0,0 +1,40 @@
+import pytest
+
+from common.inputs import InputError, read_constructs, read_sample_map, read_vector_map
+
+
+def write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_constructs_from_csv_with_or_without_a_header(tmp_path):
+    expected = {'uuid351': ['fuGFP', 'RBS1', 'Term3'], 'uuid352': ['fuGFP', 'RBS2']}
+    assert read_constructs(write(tmp_path, 'a.csv', 'uuid351,fuGFP,RBS1,Term3\nuuid352,fuGFP,RBS2,\n\n')) == expected
+    assert read_constructs(write(tmp_path, 'b.csv', 'construct,parts\nuuid351,fuGFP,RBS1,Term3\nuuid352,fuGFP,RBS2\n')) == expected
+
+
+def test_constructs_from_jsonl(tmp_path):
+    path = write(tmp_path, 'constructs.jsonl', '{"construct": "uuid351", "parts": ["fuGFP", "RBS1"]}\n')
+    assert read_constructs(path) == {'uuid351': ['fuGFP', 'RBS1']}
+
+
+@pytest.mark.parametrize('content, error', [
+    ('uuid351,fuGFP\nuuid351,RBS1\n', 'row 2: construct `uuid351` is listed twice'),
+    ('uuid351\n', 'row 1: construct `uuid351` needs a list of part names'),
+    ('{"construct": "uuid351", "parts": ["fuGFP"]}\n[1]\n', 'row 2: expected a JSON object'),
+    ('{"construct": "uuid351"\n', 'row 1: not valid JSON'),
+])
+def test_bad_rows_are_reported_with_their_number(tmp_path, content, error):
+    with pytest.raises(InputError, match=error):
+        read_constructs(write(tmp_path, 'constructs.csv', content))
+
+
+def test_well_maps(tmp_path):
+    assert read_vector_map(write(tmp_path, 'vectors.csv', 'vector,well\npOpen,A1\npClosed,B2\n')) == {'pOpen': 'A1', 'pClosed': 'B2'}
+    assert read_sample_map(write(tmp_path, 'samples.jsonl', '{"sample": "s1", "well": "H12"}\n')) == {'s1': 'H12'}
+    with pytest.raises(InputError, match='already used'):
+        read_vector_map(write(tmp_path, 'twice.csv', 'pOpen,A1\npClosed,A1\n'))
+    with pytest.raises(InputError, match='not a well name'):
+        read_vector_map(write(tmp_path, 'bad.csv', 'pOpen,1A\n'))
@@ -0,0 +1,37 @@
+from common import ordering
+from common.deck_planner import DeckPlan
+
+PLATE = 'nest_96_wellplate_100ul_pcr_full_skirt'
+
+
+def test_serpentine_snakes_down_and_up_the_columns():
+    plan = DeckPlan()
+    plan.add_wells('products', PLATE, range(12))
+    order = ordering.serpentine(plan, 'products')
+    assert [plan.wells['products'][item][1] for item in order] == ['A1', 'B1', 'C1', 'D1', 'E1', 'F1', 'G1', 'H1', 'D2', 'C2', 'B2', 'A2']
+
+
+def test_order_groups_chains_nearby_transfers():
+    sources = {'near': (0, 0), 'far': (100, 0)}
+    dests = {'a': (10, 0), 'b': (110, 0), 'c': (20, 0)}
+    groups = [('far', ['b']), ('near', ['a']), ('far', ['c'])]
+    ordered = ordering.order_groups(groups, sources, dests)
+    assert ordering.group_travel(ordered, sources, dests) < ordering.group_travel(groups, sources, dests)
+    assert sorted(ordered) == sorted(groups)
+
+
+def test_order_groups_keeps_an_order_that_is_already_short():
+    sources = {'s': (0, 0)}
+    dests = {'a': (1, 0), 'b': (2, 0)}
+    assert ordering.order_groups([('s', ['a', 'b'])], sources, dests) == [('s', ['a', 'b'])]
+
+
+def test_arrange_by_use_puts_the_most_used_items_nearest_and_keeps_kept_wells():
+    plan = DeckPlan()
+    plan.add_wells('reagents', PLATE, ['most', 'least', 'kept'])
+    plan.add_wells('products', PLATE, range(8))
+    wells = ordering.arrange_by_use(plan, 'reagents', ['most', 'kept', 'least'], 'products', kept={'kept': 'H12'})
+    assert wells['kept'] == (0, 'H12')
+    positions = ordering.positions(plan, 'reagents')
+    target = ordering.positions(plan, 'products')[0]
+    assert ordering.path_length([positions['most'], target]) <= ordering.path_length([positions['least'], target])
@@ -0,0 +1,23 @@
+import pytest
+
+from common.benchmark import benchmark_constructs
+from common.pipeline import run_pipeline
+
+
+def test_constructs_are_traced_through_every_stage():
+    constructs = benchmark_constructs(24)
+    files, trace = run_pipeline({'constructs': constructs}, 1)
+    assert [stage['protocol'] for stage in trace['stages']] == ['golden_gate_moclo', 'cell_transform', 'glycerol_stock']
+    assert set(trace['constructs']) == set(constructs)
+    for construct in trace['constructs'].values():
+        #plates move down the line well for well
+        assert construct['golden_gate_moclo']['well'] == construct['cell_transform']['well'] == construct['glycerol_stock']['culture_well']
+        assert len(construct['glycerol_stock']['stocks']) == 1
+    for stage in trace['stages']:
+        assert set(stage['files']) <= set(files)
+
+
+def test_product_plates_must_be_96_well():
+    with pytest.raises(ValueError, match='not a 96 well plate'):
+        run_pipeline({'constructs': benchmark_constructs(2)}, 1,
+                     {'golden_gate_moclo': {'product_plate': 'biorad_384_wellplate_50ul', 'allow_below_minimum': True}})
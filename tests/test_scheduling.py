@@ -0,0 +1,48 @@
+import pytest
+
+from common import scheduling
+
+CONSTRUCTS = {'c1': ['a', 'b'], 'c2': ['a', 'c']}
+
+
+def test_water_tops_every_reaction_up():
+    assert scheduling.water_volumes(CONSTRUCTS) == {'c1': 7.0, 'c2': 7.0}
+    assert scheduling.water_volumes(CONSTRUCTS, reaction_volume=5) == {'c1': 3.5, 'c2': 3.5}
+
+
+def test_reagent_volumes_per_construct():
+    needs, mix = scheduling.reagent_volumes(CONSTRUCTS)
+    assert needs == pytest.approx({'a': 1.0, 'b': 0.5, 'c': 0.5,
+                                   'T4_DNA_Ligase': 1.0, 'T4_DNA_Ligase_buffer': 2.0, 'BsaI-HFv2': 1.0, 'water': 14.0})
+    assert mix == 0
+
+
+def test_reagent_volumes_with_master_mix():
+    needs, mix = scheduling.reagent_volumes(CONSTRUCTS, master_mix=True, mix_water=True)
+    assert needs['T4_DNA_Ligase_buffer'] == pytest.approx(2.0 * scheduling.MIX_OVERAGE)
+    assert needs['water'] == pytest.approx(2 * 7.0 * scheduling.MIX_OVERAGE)
+    assert mix == pytest.approx((2.0 + 7.0) * 2 * scheduling.MIX_OVERAGE)
+
+
+def test_distributes_carry_a_disposal_volume():
+    needs, _ = scheduling.reagent_volumes(CONSTRUCTS, pipette='p20_single_gen2', group_parts=True)
+    assert needs['a'] == pytest.approx(2.0)
+    assert needs['water'] == pytest.approx(15.0)
+
+
+def test_water_is_split_over_wells():
+    needs, _ = scheduling.reagent_volumes(CONSTRUCTS, water_per_well=1)
+    assert needs['water'] == pytest.approx(7.0)
+    assert needs['water 2'] == pytest.approx(7.0)
+
+
+def test_water_per_well_fills_each_well_as_far_as_it_goes():
+    assert scheduling.water_per_well(CONSTRUCTS, 14) == 2
+    assert scheduling.water_per_well(CONSTRUCTS, 13.9) == 1
+    assert scheduling.water_per_well(CONSTRUCTS, 15, pipette='p20_single_gen2') == 2
+    assert scheduling.water_per_well(CONSTRUCTS, 14.9, pipette='p20_single_gen2') == 1
+    assert scheduling.water_per_well({}, 10) == 1
+
+
+def test_water_split_keeps_construct_order():
+    assert scheduling.water_split(['c1', 'c2', 'c3'], 2) == {'water': ['c1', 'c2'], 'water 2': ['c3']}
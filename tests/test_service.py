@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from common.service import ProtocolService
+
+
+@pytest.fixture(scope='module')
+def service():
+    service = ProtocolService(workers=1)
+    yield service
+    service.pool.shutdown()
+
+
+def request(service, method, path, body=b''):
+    """The status and JSON body the service answers a request with"""
+    async def send():
+        reader = asyncio.StreamReader()
+        reader.feed_data(f'{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+        reader.feed_eof()
+        return await service.respond(reader)
+    return asyncio.run(send())
+
+
+def test_lists_the_protocols(service):
+    status, response = request(service, 'GET', '/')
+    assert status == 200
+    assert 'glycerol_stock' in response['protocols']
+
+
+def test_generates_a_protocol(service):
+    status, response = request(service, 'POST', '/glycerol_stock', b'{"num_samples": 8, "repeats": 1}')
+    assert status == 200
+    assert len(response['protocols']) == 1
+    assert response['platemap']
+
+
+def test_unknown_protocols_are_not_found(service):
+    assert request(service, 'POST', '/no_such_protocol', b'{}')[0] == 404
+
+
+def test_options_have_to_be_an_object(service):
+    status, response = request(service, 'POST', '/glycerol_stock', b'[1, 2]')
+    assert status == 400
+    assert 'JSON object' in response['error']
+
+
+def test_invalid_options_are_unprocessable(service):
+    assert request(service, 'POST', '/glycerol_stock', b'{"no_such_option": 1}')[0] == 422
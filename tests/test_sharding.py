@@ -0,0 +1,49 @@
+import pytest
+
+from common.deck_planner import DeckCapacityError, DeckPlan
+from common.sharding import largest_fitting_prefix, make_runs
+
+PLATE = 'nest_96_wellplate_100ul_pcr_full_skirt'
+
+
+def shard_args(args, items):
+    return {**args, 'items': list(items)}
+
+
+def plan_deck(args):
+    """One slot per three items, on a three slot deck"""
+    plan = DeckPlan(available_slots=[3, 2, 1])
+    plan.add_labware('items', PLATE, -(-len(args['items']) // 3))
+    return plan
+
+
+def test_runs_are_filled_before_the_next_starts():
+    runs = make_runs({'name': 'job'}, range(20), shard_args, plan_deck)
+    assert [run_args['items'] for run_args, _ in runs] == [list(range(9)), list(range(9, 18)), [18, 19]]
+    assert all(run_args['name'] == 'job' for run_args, _ in runs)
+    assert [plan.slots()['items'] for _, plan in runs] == [[3, 2, 1], [3, 2, 1], [3]]
+
+
+def test_a_job_that_fits_is_one_run():
+    runs = make_runs({}, range(5), shard_args, plan_deck)
+    assert len(runs) == 1
+
+
+def test_items_may_be_any_iterable():
+    runs = make_runs({}, (item for item in range(10)), shard_args, plan_deck)
+    assert [run_args['items'] for run_args, _ in runs] == [list(range(9)), [9]]
+
+
+def test_a_single_item_too_big_for_the_deck_is_explained():
+    def too_big(args):
+        plan = DeckPlan(available_slots=[1])
+        plan.add_labware('items', PLATE, 2)
+        return plan
+    with pytest.raises(DeckCapacityError):
+        make_runs({}, range(3), shard_args, too_big)
+
+
+def test_largest_fitting_prefix():
+    items = list(range(100))
+    assert largest_fitting_prefix(lambda count: items[:count], lambda subset: len(subset) <= 37) == 37
+    assert largest_fitting_prefix(lambda count: items[:count], lambda subset: True) == 100
@@ -0,0 +1,54 @@
+from common import api
+from common.deck_planner import DeckPlan
+from common.state import empty_state, kept_wells, leftover, read_state, resumed, starting_tips, write_state
+
+
+def test_reading_state_without_a_file(tmp_path):
+    assert read_state(None) is None
+    assert read_state(str(tmp_path / 'deck_state.json')) == empty_state()
+
+
+def test_written_state_reads_back(tmp_path):
+    path = str(tmp_path / 'deck_state.json')
+    deck_state = {'tipracks': {'opentrons_96_tiprack_20ul': 20}, 'reagent_plate': None}
+    write_state(path, deck_state)
+    assert read_state(path) == deck_state
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['deck_state.json']
+
+
+def test_multichannel_pipettes_start_at_the_next_column():
+    deck_state = {'tipracks': {'opentrons_96_tiprack_20ul': 20}, 'reagent_plate': None}
+    assert starting_tips(deck_state, {'tips': ('opentrons_96_tiprack_20ul', 'p20_single_gen2')}) == {'tips': 20}
+    assert starting_tips(deck_state, {'tips': ('opentrons_96_tiprack_20ul', 'p20_multi_gen2')}) == {'tips': 24}
+    #only the first role using the tips gets the partly used rack
+    assert starting_tips(deck_state, {'small': ('opentrons_96_tiprack_20ul', 'p20_single_gen2'),
+                                      'more': ('opentrons_96_tiprack_20ul', 'p20_single_gen2')}) == {'small': 20}
+
+
+def test_reagents_are_only_kept_on_the_same_kind_of_plate():
+    deck_state = {'tipracks': {}, 'reagent_plate': {'load_name': 'corning_96_wellplate_360ul_flat', 'wells': {'water': 'A1'}}}
+    assert kept_wells(deck_state, 'corning_96_wellplate_360ul_flat') == {'water': 'A1'}
+    assert kept_wells(deck_state, 'nest_96_wellplate_100ul_pcr_full_skirt') == {}
+    assert kept_wells(None, 'corning_96_wellplate_360ul_flat') == {}
+
+
+def test_leftover_state_can_be_resumed():
+    deck_state = {'tipracks': {'opentrons_96_tiprack_20ul': 90}, 'reagent_plate': None}
+    plan = DeckPlan()
+    plan.add_tipracks('tips', 'opentrons_96_tiprack_20ul', 10, first_tip=90)
+    left = leftover(deck_state, {}, plan)
+    assert left['tipracks'] == {'opentrons_96_tiprack_20ul': 4}
+    assert resumed(left) == deck_state
+    assert resumed(None) is None
+
+
+def test_back_to_back_jobs_continue_the_tiprack(tmp_path):
+    path = str(tmp_path / 'deck_state.json')
+    options = {'num_samples': 8, 'repeats': 1, 'state_file': path}
+    api.render('glycerol_stock', options)
+    first = read_state(path)
+    assert first['tipracks']
+    api.render('glycerol_stock', options)
+    second = read_state(path)
+    assert second['previous']['tipracks'] == first['tipracks']
+    assert second['tipracks'] != first['tipracks']
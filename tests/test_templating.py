@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from common.protocols import PROTOCOLS, load_preprocessor
+from common.templating import HELPERS_PATH, Template, TemplateError, include_helpers, load_template, rename_keys
+
+
+def test_placeholders_are_filled_in_one_pass():
+    template = Template('a = %%A%%\nb = %%B%%\na_again = %%A%%\n')
+    assert template.render({'%%A%%': '1', '%%B%%': '%%A%%', 'not_a_placeholder': 3}) == 'a = 1\nb = %%A%%\na_again = 1\n'
+
+
+def test_missing_and_unused_placeholders_are_errors():
+    template = Template('a = %%A%%\n')
+    with pytest.raises(TemplateError, match='Missing'):
+        template.render({})
+    with pytest.raises(TemplateError, match='unused'):
+        template.render({'%%A%%': '1', '%%B%%': '2'})
+
+
+def test_templates_are_compiled_once_per_change(tmp_path):
+    path = tmp_path / 'template.py'
+    path.write_text('a = %%A%%\n')
+    assert load_template(str(path)) is load_template(str(path))
+    path.write_text('b = %%B%%\n')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert load_template(str(path)).placeholders == ['%%B%%']
+
+
+def test_old_placeholder_names_are_renamed():
+    assert rename_keys({'%%NUM OF SAMPLES%%': '24', 'repeats': '2'}) == {'num_samples': '24', 'repeats': '2'}
+
+
+def test_helpers_are_pasted_in_at_the_placeholder_indented():
+    source = include_helpers('def run(protocol):\n    %%PROTOCOL HELPERS%%\n    step()\n')
+    assert '%%PROTOCOL HELPERS%%' not in source
+    assert '\n    def step(name=None):\n' in source
+    assert 'Helpers every protocol template shares' not in source # the header about the file itself is left out
+    compile(source, 'template', 'exec')
+
+
+def test_every_template_includes_the_helpers():
+    for protocol in PROTOCOLS:
+        preprocessor = load_preprocessor(protocol)
+        template = load_template(os.path.join(preprocessor.TEMPLATE_DIR, f'{preprocessor.TEMPLATE_NAME}.py'))
+        assert 'def distribute_steps(' in template.source
+
+
+def test_the_helpers_are_not_a_module():
+    assert not HELPERS_PATH.endswith('.py')
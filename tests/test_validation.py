@@ -0,0 +1,51 @@
+import pytest
+
+from common.protocols import load_preprocessor, to_argv
+from common.validation import VolumeError, choose_pipette
+
+SINGLE = ['p20_single_gen2', 'p300_single_gen2', 'p1000_single_gen2']
+
+
+def test_the_requested_pipette_is_kept_when_it_can():
+    assert choose_pipette('p300_single_gen2', [50, 200], SINGLE, 'test') == 'p300_single_gen2'
+
+
+def test_a_pipette_that_can_is_chosen_instead():
+    assert choose_pipette('p300_single_gen2', [5], SINGLE, 'test') == 'p20_single_gen2'
+    assert choose_pipette('p20_single_gen2', [900], SINGLE, 'test') == 'p1000_single_gen2'
+
+
+def test_only_pipettes_with_as_many_channels_are_considered():
+    with pytest.raises(VolumeError):
+        choose_pipette('p300_multi_gen2', [5000], SINGLE, 'test')
+
+
+def test_volumes_too_large_for_every_pipette_are_rejected():
+    with pytest.raises(VolumeError, match='aspirations'):
+        choose_pipette('p20_single_gen2', [5000], SINGLE, 'test')
+
+
+def test_volumes_below_every_minimum_need_to_be_allowed():
+    with pytest.raises(VolumeError, match='--allow_below_minimum'):
+        choose_pipette('p20_single_gen2', [0.5, 5], SINGLE, 'test')
+    assert choose_pipette('p20_single_gen2', [0.5, 5], SINGLE, 'test', allow_below_minimum=True) == 'p20_single_gen2'
+
+
+def test_volumes_far_below_the_minimum_are_always_rejected():
+    with pytest.raises(VolumeError, match='too far below'):
+        choose_pipette('p20_single_gen2', [0.1], SINGLE, 'test', allow_below_minimum=True)
+
+
+def test_unknown_pipettes_are_rejected():
+    with pytest.raises(VolumeError, match='Unknown pipette'):
+        choose_pipette('p50_single', [5], SINGLE, 'test')
+
+
+def test_the_default_golden_gate_reaction_is_still_pipetted(caplog):
+    preprocessor = load_preprocessor('golden_gate_moclo')
+    constructs = {'uuid351': ['fuGFP', 'RBS1']}
+    assert preprocessor.read_args(None, to_argv({'constructs': constructs}))['%%PIPETTE%%'] == 'p20_single_gen2'
+    assert 'expect poor accuracy' in caplog.text
+    with pytest.raises(VolumeError, match='--allow_below_minimum'):
+        preprocessor.read_args(None, to_argv({'constructs': constructs, 'reaction_volume': 5}))
+    preprocessor.read_args(None, to_argv({'constructs': constructs, 'reaction_volume': 5, 'allow_below_minimum': True}))
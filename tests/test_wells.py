@@ -0,0 +1,34 @@
+import pytest
+
+from common.wells import WellIndex, row_col, row_letters, well_index
+
+
+def test_row_letters_continue_past_z():
+    assert [row_letters(row) for row in (0, 25, 26, 27)] == ['A', 'Z', 'AA', 'AB']
+    assert row_col('AB12') == (27, 11)
+    with pytest.raises(ValueError):
+        row_col('12A')
+
+
+def test_wells_are_indexed_column_wise():
+    wells = WellIndex(8, 12)
+    assert len(wells) == 96
+    assert wells.names[:2] == ['A1', 'B1'] and wells.names[8] == 'A2'
+    assert wells.index('H12') == 95
+    assert wells.row_col(9) == (1, 1)
+    assert wells.name_at(1, 1) == 'B2'
+    assert wells.column('C3') == 2
+    assert wells.column_top(2) == 'A3'
+    assert 'I1' not in wells
+    with pytest.raises(KeyError, match='does not exist'):
+        wells.index('I1')
+
+
+def test_384_well_plates():
+    wells = well_index('biorad_384_wellplate_50ul')
+    assert len(wells) == 384
+    assert wells.names[15] == 'P1'
+
+
+def test_one_table_per_labware():
+    assert well_index('nest_96_wellplate_100ul_pcr_full_skirt') is well_index('nest_96_wellplate_100ul_pcr_full_skirt')